@@ -0,0 +1,559 @@
+"""
+Offline batch inference over a JSONL or Parquet file of prompts.
+
+Nightly jobs that push every prompt through /llm pay an HTTP call and a Serve
+hop per prompt. This entry point instead runs the prompts directly on the Ray
+cluster:
+
+- reads the input as a stream (JSONL line by line, Parquet record batch by
+  record batch) and cuts it into chunks of ``--chunk-size`` records; at most
+  ``--max-inflight`` chunks per worker are read ahead, so memory stays bounded
+  whatever the input size
+- runs one ``InferenceWorker`` actor per tensor-parallel GPU group, each with
+  its own vLLM ``LLM`` built with the model, tensor-parallel and prefix-caching
+  settings of the Serve deployment (``serve_app.llm_engine_settings()``) and
+  the node-local model copy when the node has one
+- appends each finished chunk's results to ``<output>/results.jsonl`` (in
+  completion order; every line carries the record's ``id`` and input
+  ``index``)
+- checkpoints the completed chunks and the flushed size of the results file
+  to ``<output>/checkpoint.json`` every ``--checkpoint-every`` seconds and on
+  failure; rerunning the same command truncates the results to the last
+  checkpoint and skips the chunks it records
+- prints a throughput summary and writes it to ``<output>/summary.json``
+
+Input records are ``{"id": ..., "prompt": "..."}`` or ``{"id": ...,
+"messages": [...]}`` and may set ``max_tokens``, ``temperature``, ``seed`` and
+``n`` (defaults from the command line). Output lines are ``{"id", "index",
+"choices": [{"index", "text", "finish_reason"}], "usage"}``, or ``{"id",
+"index", "error"}`` for records that could not be run.
+
+SERVE_LLM_STUB=1 runs the workers on the CPU-only stub engine.
+
+Usage:
+    python batch_infer.py --input prompts.jsonl --output /mnt/shared/cluster-llm/jobs/nightly
+    python batch_infer.py --input prompts.parquet --output /tmp/job --workers 2 --max-tokens 64
+    python batch_infer.py --input prompts.jsonl --output /tmp/job --local   # no Ray, this process
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+from serve_app import (
+    BATCH_SAMPLING_FIELDS,
+    USE_STUB_ENGINE,
+    llm_engine_settings,
+    load_chat_template,
+    messages_to_prompt,
+    node_local_copy,
+    vllm_engine_kwargs,
+)
+from stub_engine import SamplingParams as StubSamplingParams, StubLLM
+
+CHECKPOINT_NAME = "checkpoint.json"
+RESULTS_NAME = "results.jsonl"
+SUMMARY_NAME = "summary.json"
+
+
+class JobError(Exception):
+    """The job cannot start or continue; the checkpoint allows a rerun to resume."""
+
+
+def read_records(path, batch_rows=1024):
+    """
+    Yield the input's records one at a time without loading the whole file.
+
+    A JSONL line that does not parse yields ``{"_error": ...}`` so that it
+    keeps its index and shows up as an error in the results.
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise JobError(f"Reading Parquet needs pyarrow: {e}")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            yield from batch.to_pylist()
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = {"_error": f"line {line_number}: {e}"}
+            yield record if isinstance(record, dict) else {"_error": f"line {line_number}: not an object"}
+
+
+def chunked(records, chunk_size):
+    """Yield ``(chunk_id, first_index, records)``; the chunking depends only on the input and size."""
+    chunk, first = [], 0
+    for index, record in enumerate(records):
+        if not chunk:
+            first = index
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield first // chunk_size, first, chunk
+            chunk = []
+    if chunk:
+        yield first // chunk_size, first, chunk
+
+
+def prepare(record, index, defaults, chat_template):
+    """
+    Turn one input record into ``(index, id, prompt, sampling)``.
+
+    Returns ``(index, id, None, error)`` when the record cannot be run.
+    """
+    record_id = record.get("id", index)
+    if "_error" in record:
+        return index, record_id, None, record["_error"]
+    if isinstance(record.get("messages"), list):
+        try:
+            prompt = messages_to_prompt(record["messages"], chat_template)
+        except Exception as e:
+            return index, record_id, None, str(e)
+    elif isinstance(record.get("prompt"), str):
+        prompt = record["prompt"]
+    else:
+        return index, record_id, None, "Missing 'prompt' or 'messages' field"
+    sampling = dict(defaults)
+    sampling.update({key: record[key] for key in BATCH_SAMPLING_FIELDS if record.get(key) is not None})
+    return index, record_id, prompt, sampling
+
+
+class InferenceWorker:
+    """
+    One engine generating whole chunks (a Ray actor, or in-process with --local).
+
+    Prompts of a chunk go through a single ``LLM.generate()`` call so vLLM
+    batches them; a record whose sampling parameters are invalid is reported
+    as an error without failing the rest of its chunk.
+    """
+
+    def __init__(self, engine_settings, stub=False):
+        model_path = node_local_copy(engine_settings["model_dir"], engine_settings["local_model_root"])
+        started = time.perf_counter()
+        if stub:
+            self.llm = StubLLM(model=model_path, enable_prefix_caching=engine_settings["enable_prefix_caching"])
+            self.sampling_params_cls = StubSamplingParams
+            self.generate_kwargs = {}
+        else:
+            from vllm import LLM, SamplingParams
+
+            self.llm = LLM(**vllm_engine_kwargs(
+                model_path, engine_settings["tensor_parallel_size"], engine_settings["enable_prefix_caching"]
+            ))
+            self.sampling_params_cls = SamplingParams
+            self.generate_kwargs = {"use_tqdm": False}
+        self.model_path = model_path
+        self.host = socket.gethostname()
+        self.load_s = time.perf_counter() - started
+
+    def describe(self):
+        return {"host": self.host, "model_path": self.model_path, "load_s": round(self.load_s, 2)}
+
+    def generate(self, chunk_id, jobs):
+        """Run ``(index, id, prompt, sampling)`` jobs; return ``(chunk_id, results, stats)``."""
+        started = time.perf_counter()
+        results, runnable, params = [], [], []
+        for index, record_id, prompt, sampling in jobs:
+            if prompt is None:
+                results.append({"id": record_id, "index": index, "error": sampling})
+                continue
+            try:
+                params.append(self.sampling_params_cls(**sampling))
+            except Exception as e:
+                results.append({"id": record_id, "index": index, "error": str(e)})
+                continue
+            runnable.append((index, record_id, prompt))
+        outputs = self.llm.generate(
+            [prompt for _, _, prompt in runnable], sampling_params=params, **self.generate_kwargs
+        ) if runnable else []
+        stats = {"records": len(jobs), "errors": len(results), "prompt_tokens": 0, "completion_tokens": 0}
+        for (index, record_id, _), output in zip(runnable, outputs):
+            usage = {
+                "prompt_tokens": len(output.prompt_token_ids or []),
+                "completion_tokens": sum(len(completion.token_ids) for completion in output.outputs),
+            }
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["completion_tokens"] += usage["completion_tokens"]
+            results.append({
+                "id": record_id,
+                "index": index,
+                "choices": [
+                    {"index": completion.index, "text": completion.text, "finish_reason": completion.finish_reason}
+                    for completion in output.outputs
+                ],
+                "usage": usage,
+            })
+        results.sort(key=lambda result: result["index"])
+        stats["busy_s"] = time.perf_counter() - started
+        stats["host"] = self.host
+        return chunk_id, results, stats
+
+
+class LocalPool:
+    """Runs chunks in this process, one at a time (``--local``)."""
+
+    def __init__(self, worker):
+        self.workers = [worker.describe()]
+        self.capacity = 1
+        self._worker = worker
+        self._done = []
+
+    @property
+    def pending(self):
+        return len(self._done)
+
+    def submit(self, chunk_id, jobs):
+        self._done.append(self._worker.generate(chunk_id, jobs))
+
+    def wait(self):
+        done, self._done = self._done, []
+        return done
+
+    def close(self):
+        pass
+
+
+class RayPool:
+    """
+    One ``InferenceWorker`` actor per tensor-parallel GPU group, spread over the nodes.
+
+    With tensor parallelism each actor gets a placement group of
+    ``tensor_parallel_size`` GPU bundles on one node and vLLM's own workers are
+    scheduled into it.
+    """
+
+    def __init__(self, engine_settings, workers, max_inflight, stub=False):
+        import ray
+        from ray.util.placement_group import placement_group, remove_placement_group
+        from ray.util.scheduling_strategies import PlacementGroupSchedulingStrategy
+
+        self._ray = ray
+        self._remove_placement_group = remove_placement_group
+        self.placement_groups = []
+        tensor_parallel_size = engine_settings["tensor_parallel_size"]
+        actor_cls = ray.remote(max_restarts=1, max_task_retries=1)(InferenceWorker)
+        self.actors = []
+        for _ in range(workers):
+            if stub:
+                options = {"num_cpus": 1, "scheduling_strategy": "SPREAD"}
+            elif tensor_parallel_size == 1:
+                options = {"num_gpus": 1, "scheduling_strategy": "SPREAD"}
+            else:
+                group = placement_group([{"GPU": 1, "CPU": 1}] * tensor_parallel_size, strategy="STRICT_PACK")
+                self.placement_groups.append(group)
+                options = {
+                    "num_gpus": 0,
+                    "scheduling_strategy": PlacementGroupSchedulingStrategy(
+                        group, placement_group_capture_child_tasks=True
+                    ),
+                }
+            self.actors.append(actor_cls.options(**options).remote(engine_settings, stub))
+        self.workers = ray.get([actor.describe.remote() for actor in self.actors])
+        self.capacity = workers * max_inflight
+        self._load = {index: 0 for index in range(len(self.actors))}
+        self._refs = {}
+
+    @property
+    def pending(self):
+        return len(self._refs)
+
+    def submit(self, chunk_id, jobs):
+        # The least busy actor gets the chunk, so a slow node does not hold
+        # back the others.
+        actor_index = min(self._load, key=self._load.get)
+        self._load[actor_index] += 1
+        self._refs[self.actors[actor_index].generate.remote(chunk_id, jobs)] = actor_index
+
+    def wait(self):
+        ready, _ = self._ray.wait(list(self._refs), num_returns=1)
+        done = []
+        for ref in ready:
+            self._load[self._refs.pop(ref)] -= 1
+            done.append(self._ray.get(ref))
+        return done
+
+    def close(self):
+        for actor in self.actors:
+            self._ray.kill(actor)
+        for group in self.placement_groups:
+            self._remove_placement_group(group)
+
+
+def input_fingerprint(path):
+    info = os.stat(path)
+    return {"path": os.path.abspath(path), "size": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+
+class Checkpoint:
+    """
+    Completed chunks plus the size of the results file that holds exactly their results.
+
+    ``results_bytes`` only moves in ``add()``, once a chunk's results are all
+    written, so a failure part-way through a chunk never counts its lines.
+    Saved atomically (write, fsync, rename) after the results file has been
+    flushed and fsynced, so on resume everything after ``results_bytes``
+    belongs to chunks that will run again.
+    """
+
+    def __init__(self, output_dir, job):
+        self.path = os.path.join(output_dir, CHECKPOINT_NAME)
+        self.job = job
+        self.completed = set()
+        self.results_bytes = 0
+        self.totals = {"records": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "elapsed_s": 0.0}
+
+    def load(self, restart=False):
+        """Resume from an earlier run of the same job; raises ``JobError`` for a different job."""
+        if restart or not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("job") != self.job:
+            raise JobError(
+                f"{self.path} belongs to a different job (input, chunk size or sampling "
+                f"defaults changed); pass --restart to discard it"
+            )
+        self.completed = set(saved["completed_chunks"])
+        self.results_bytes = saved["results_bytes"]
+        self.totals.update(saved["totals"])
+        return True
+
+    def add(self, chunk_id, written_bytes):
+        """Record a chunk whose ``written_bytes`` of results are in the results file."""
+        self.results_bytes += written_bytes
+        self.completed.add(chunk_id)
+
+    def save(self, results_file, complete=False):
+        results_file.flush()
+        os.fsync(results_file.fileno())
+        state = {
+            "job": self.job,
+            "completed_chunks": sorted(self.completed),
+            "results_bytes": self.results_bytes,
+            "totals": self.totals,
+            "complete": complete,
+            "saved_at": time.time(),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def run_job(input_path, output_dir, pool, chunk_size=256, defaults=None, chat_template=None,
+            checkpoint_every_s=30.0, restart=False, progress_every_s=10.0):
+    """
+    Run every chunk not yet recorded in the checkpoint and return the summary.
+
+    On any failure the checkpoint is saved before the exception propagates, so
+    a rerun picks up from the last completed chunk.
+    """
+    defaults = dict(defaults or {})
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(output_dir, {
+        "input": input_fingerprint(input_path), "chunk_size": chunk_size, "defaults": defaults,
+    })
+    resumed = checkpoint.load(restart)
+    results_path = os.path.join(output_dir, RESULTS_NAME)
+    if resumed and (not os.path.exists(results_path) or os.path.getsize(results_path) < checkpoint.results_bytes):
+        raise JobError(f"{results_path} is missing or shorter than its checkpoint; pass --restart to start over")
+    mode = "r+b" if resumed else "wb"
+    run = {"records": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "chunks": 0}
+    per_host = {}
+    started = time.perf_counter()
+
+    with open(results_path, mode) as results_file:
+        # Drop results written after the last checkpoint: their chunks run again.
+        results_file.seek(checkpoint.results_bytes)
+        results_file.truncate()
+        checkpoint.save(results_file)
+        if resumed:
+            print(f"Resuming: {len(checkpoint.completed)} chunks ({checkpoint.totals['records']} records) "
+                  f"already done")
+        last_checkpoint = last_progress = time.perf_counter()
+
+        def collect():
+            nonlocal last_checkpoint, last_progress
+            for chunk_id, results, stats in pool.wait():
+                # Serialize the whole chunk before writing any of it.
+                lines = b"".join(json.dumps(result).encode("utf-8") + b"\n" for result in results)
+                results_file.write(lines)
+                checkpoint.add(chunk_id, len(lines))
+                run["chunks"] += 1
+                for key in ("records", "errors", "prompt_tokens", "completion_tokens"):
+                    run[key] += stats[key]
+                    checkpoint.totals[key] += stats[key]
+                host = per_host.setdefault(stats["host"], {"chunks": 0, "records": 0, "busy_s": 0.0})
+                host["chunks"] += 1
+                host["records"] += stats["records"]
+                host["busy_s"] += stats["busy_s"]
+            now = time.perf_counter()
+            if now - last_checkpoint >= checkpoint_every_s:
+                checkpoint.totals["elapsed_s"] += now - last_checkpoint
+                checkpoint.save(results_file)
+                last_checkpoint = now
+            if now - last_progress >= progress_every_s:
+                elapsed = now - started
+                print(f"  {run['records']} records, {run['completion_tokens'] / elapsed:.0f} tokens/s, "
+                      f"{checkpoint.totals['records']} done in total")
+                last_progress = now
+
+        try:
+            for chunk_id, first, records in chunked(read_records(input_path), chunk_size):
+                if chunk_id in checkpoint.completed:
+                    continue
+                jobs = [prepare(record, first + offset, defaults, chat_template)
+                        for offset, record in enumerate(records)]
+                while pool.pending >= pool.capacity:
+                    collect()
+                pool.submit(chunk_id, jobs)
+            while pool.pending:
+                collect()
+        except BaseException:
+            checkpoint.totals["elapsed_s"] += time.perf_counter() - last_checkpoint
+            checkpoint.save(results_file)
+            raise
+        checkpoint.totals["elapsed_s"] += time.perf_counter() - last_checkpoint
+        checkpoint.save(results_file, complete=True)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "input": os.path.abspath(input_path),
+        "results": results_path,
+        "resumed": resumed,
+        "workers": pool.workers,
+        "this_run": {
+            **run,
+            "elapsed_s": round(elapsed, 3),
+            "records_per_s": round(run["records"] / elapsed, 2) if elapsed > 0 else None,
+            "completion_tokens_per_s": round(run["completion_tokens"] / elapsed, 2) if elapsed > 0 else None,
+            "per_host": {
+                host: {**values, "busy_s": round(values["busy_s"], 3)} for host, values in per_host.items()
+            },
+        },
+        "job_totals": {**checkpoint.totals, "elapsed_s": round(checkpoint.totals["elapsed_s"], 3)},
+    }
+    with open(os.path.join(output_dir, SUMMARY_NAME), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary):
+    run = summary["this_run"]
+    totals = summary["job_totals"]
+    print("Batch inference summary:")
+    print(f"  Records this run: {run['records']} ({run['errors']} errors) in {run['chunks']} chunks, "
+          f"{run['elapsed_s']:.1f} s")
+    if run["records_per_s"] is not None:
+        print(f"  Throughput: {run['records_per_s']:.1f} records/s, "
+              f"{run['completion_tokens_per_s']:.1f} completion tokens/s "
+              f"({run['prompt_tokens']} prompt + {run['completion_tokens']} completion tokens)")
+    for host, values in sorted(run["per_host"].items()):
+        print(f"    {host}: {values['chunks']} chunks, {values['records']} records, busy {values['busy_s']:.1f} s")
+    print(f"  Job total: {totals['records']} records ({totals['errors']} errors), "
+          f"{totals['completion_tokens']} completion tokens")
+    print(f"  Results: {summary['results']}")
+
+
+def default_workers(stub, tensor_parallel_size):
+    """One worker per tensor-parallel GPU group in the cluster (one per node for the stub)."""
+    import ray
+
+    if stub:
+        return max(1, sum(1 for node in ray.nodes() if node.get("Alive")))
+    return int(ray.cluster_resources().get("GPU", 0) // tensor_parallel_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="JSONL or .parquet file of prompt records")
+    parser.add_argument("--output", required=True, help="Directory for results, checkpoint and summary")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Engine workers (default: one per tensor-parallel GPU group in the cluster)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Records per generate() call (default 256)")
+    parser.add_argument("--max-inflight", type=int, default=2,
+                        help="Chunks queued per worker; bounds memory (default 2)")
+    parser.add_argument("--checkpoint-every", type=float, default=30.0,
+                        help="Seconds between checkpoints (default 30)")
+    parser.add_argument("--max-tokens", type=int, default=100, help="Default max_tokens (default 100)")
+    parser.add_argument("--temperature", type=float, default=0.7, help="Default temperature (default 0.7)")
+    parser.add_argument("--seed", type=int, default=None, help="Default seed")
+    parser.add_argument("--n", type=int, default=1, help="Default completions per prompt (default 1)")
+    parser.add_argument("--restart", action="store_true", help="Discard an existing checkpoint and start over")
+    parser.add_argument("--local", action="store_true", help="Run one engine in this process instead of on Ray")
+    parser.add_argument("--address", default="auto", help="Ray address (default: auto)")
+    args = parser.parse_args()
+
+    if args.chunk_size < 1 or args.max_inflight < 1:
+        parser.error("--chunk-size and --max-inflight must be positive")
+    if not os.path.exists(args.input):
+        parser.error(f"Input not found: {args.input}")
+
+    engine_settings = llm_engine_settings()
+    stub = USE_STUB_ENGINE
+    defaults = {"max_tokens": args.max_tokens, "temperature": args.temperature, "n": args.n}
+    if args.seed is not None:
+        defaults["seed"] = args.seed
+    chat_template = load_chat_template(engine_settings["model_dir"])
+
+    print("Batch inference")
+    print(f"  Input: {args.input}")
+    print(f"  Output: {args.output}")
+    print(f"  Model: {engine_settings['model_dir']} (tensor parallel {engine_settings['tensor_parallel_size']}, "
+          f"{'stub engine' if stub else 'vLLM'})")
+
+    if args.local:
+        pool = LocalPool(InferenceWorker(engine_settings, stub))
+    else:
+        import ray
+
+        ray.init(address=args.address, ignore_reinit_error=True)
+        # Workers may run on nodes without this checkout: ship the functions
+        # and classes they use by value.
+        ray.cloudpickle.register_pickle_by_value(sys.modules["serve_app"])
+        ray.cloudpickle.register_pickle_by_value(sys.modules["stub_engine"])
+        if __name__ != "__main__":
+            ray.cloudpickle.register_pickle_by_value(sys.modules[__name__])
+        workers = args.workers or default_workers(stub, engine_settings["tensor_parallel_size"])
+        if workers < 1:
+            print(f"No GPU group of {engine_settings['tensor_parallel_size']} GPUs available in the cluster")
+            return 1
+        print(f"  Starting {workers} worker(s)...")
+        pool = RayPool(engine_settings, workers, args.max_inflight, stub)
+    for worker in pool.workers:
+        print(f"    {worker['host']}: {worker['model_path']} loaded in {worker['load_s']:.1f} s")
+
+    try:
+        summary = run_job(
+            args.input, args.output, pool,
+            chunk_size=args.chunk_size,
+            defaults=defaults,
+            chat_template=chat_template,
+            checkpoint_every_s=args.checkpoint_every,
+            restart=args.restart,
+        )
+    except JobError as e:
+        print(f"Error: {e}")
+        return 1
+    except Exception as e:
+        print(f"Batch inference failed: {e}")
+        print("Rerun the same command to resume from the last checkpoint.")
+        return 1
+    finally:
+        pool.close()
+    print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
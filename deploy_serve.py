@@ -32,15 +32,47 @@ except RuntimeError:
     # Serve already started
     pass
 
-# Deploy using serve.run() which handles everything
-from serve_app import app
+# Deploy using serve.run() which handles everything. Importing serve_app
+# resolves the per-deployment scaling settings (SERVE_DEPLOYMENT_CONFIG and
+# SERVE_<DEPLOYMENT>_<SETTING> overrides) and applies them to the bound app.
+from serve_app import app, deployment_settings, fair_share_settings
+
+print("  Deployment scaling:")
+for name, values in deployment_settings.items():
+    if values["min_replicas"] == values["max_replicas"]:
+        replicas = f"{values['min_replicas']} replica(s)"
+    else:
+        replicas = (f"autoscale {values['min_replicas']}-{values['max_replicas']} replicas, "
+                    f"target {values['target_ongoing_requests']} ongoing/replica, "
+                    f"delays up {values['upscale_delay_s']}s / down {values['downscale_delay_s']}s")
+    queue = f", max_queued_requests={values['max_queued_requests']}" if "max_queued_requests" in values else ""
+    print(f"    {name}: {replicas}, max_ongoing_requests={values['max_ongoing_requests']}{queue}")
+if fair_share_settings["token_budget"]:
+    tenants = ", ".join(
+        f"{name} (weight {policy['weight']:g}, {policy['priority']})"
+        for name, policy in fair_share_settings["tenants"].items()
+    ) or "none configured"
+    print(f"  Fair share: {fair_share_settings['token_budget']} tokens in flight per ingress replica; tenants: {tenants}")
+else:
+    print("  Fair share: disabled")
 
 # Deploy all services using serve.run() with the app
 # This will deploy all services with route_prefix="/"
 serve.run(app, name='serve_app', route_prefix="/", blocking=False)
 
+# Optionally serve EchoService on its own at /echo-direct, so transport
+# benchmarks can measure the ingress hop (scripts/helpers/bench_echo_transport.py).
+ECHO_DIRECT = os.getenv('SERVE_ECHO_DIRECT', '0') == '1'
+if ECHO_DIRECT:
+    from serve_app import echo_direct_app
+    serve.run(echo_direct_app, name='echo_direct', route_prefix="/echo-direct", blocking=False)
+elif 'echo_direct' in serve.status().applications:
+    serve.delete('echo_direct')
+
 print('Ray Serve application deployed successfully!')
 print(f'Access echo service at: http://<NODE_IP>:{SERVE_PORT}/echo')
+if ECHO_DIRECT:
+    print(f'Access echo service without the ingress at: http://<NODE_IP>:{SERVE_PORT}/echo-direct')
 print(f'Access calculator at: http://<NODE_IP>:{SERVE_PORT}/calc')
 print(f'Access TinyLlama LLM at: http://<NODE_IP>:{SERVE_PORT}/llm')
 
@@ -16,6 +16,12 @@ export SHARED_DIR=/mnt/shared/cluster-llm
 export MODEL_NAME=TinyLlama-1.1B-Chat-v1.0
 export MODEL_REPO=https://huggingface.co/TinyLlama/TinyLlama-1.1B-Chat-v1.0
 export MODEL_DIR="${SHARED_DIR}/${MODEL_NAME}"
+# Optional local copy of the model repo to stage from instead of the Hub
+# (offline/air-gapped clusters). Parallel downloads for 03_download_tinyllama.sh.
+# export MODEL_MIRROR=/data/mirror/TinyLlama-1.1B-Chat-v1.0
+export MODEL_STAGE_JOBS=8
+# Node-local fast storage for per-node model copies (05f_replicate_model_local.sh).
+export MODEL_LOCAL_ROOT=/var/tmp/cluster-llm
 
 # Networking defaults for vLLM and Ray services.
 export VLLM_HOST=0.0.0.0
@@ -31,3 +37,45 @@ export GRAFANA_PORT=3000
 export SERVE_ENABLE_TINYLLAMA=1
 
 
+
+# Run the Serve TinyLlama deployment on the CPU-only stub engine
+# (stub_engine.py) instead of vLLM. Useful for testing without GPUs.
+export SERVE_LLM_STUB=0
+
+# Serve /llm model registry: any model directory under this path can be
+# requested with {"model": "<dir name>"}. Models load on first use and the
+# least recently used one is evicted beyond these budgets (0 = no GPU budget).
+export SERVE_LLM_MODEL_REGISTRY="${SHARED_DIR}"
+export SERVE_LLM_MAX_LOADED_MODELS=1
+export SERVE_LLM_GPU_MEMORY_BUDGET_GB=0
+
+# Launch scripts 06/07 start the CPU-only mock vLLM server
+# (scripts/helpers/mock_vllm_server.py) instead of vLLM when set to "1".
+export VLLM_MOCK=0
+
+# vLLM base URLs behind scripts/helpers/vllm_gateway.py (comma-separated).
+# export VLLM_BACKENDS=http://node1:8000,http://node2:8000
+
+# Ingress fair-share scheduling of /llm across tenants: estimated tokens in
+# flight per ingress replica (0 disables) and the optional tenant table
+# (weights, interactive/batch class, API keys). See README.
+export SERVE_FAIR_SHARE_TOKEN_BUDGET=16384
+# export SERVE_TENANT_CONFIG="${PWD}/serve_tenants.json"
+
+# Route /llm requests sharing a prompt prefix to the same tinyllama replica
+# (consistent hashing, least-loaded fallback). "0" restores Serve's default.
+export SERVE_LLM_PREFIX_ROUTING=1
+
+# Trace this fraction of requests through ingress and replica phases, and
+# append finished traces as OTLP/JSON lines (X-Request-Timing: 1 always traces).
+export SERVE_TRACE_SAMPLE_RATE=0
+# export SERVE_TRACE_FILE=/tmp/serve_traces.jsonl
+
+# Also deploy EchoService without the ingress at /echo-direct, for
+# scripts/helpers/bench_echo_transport.py.
+export SERVE_ECHO_DIRECT=0
+
+# Optional JSON/YAML file with per-deployment Serve scaling settings
+# (min/max replicas, target ongoing requests, up/downscale delays,
+# max_ongoing_requests). See serve_app.py for the format.
+# export SERVE_DEPLOYMENT_CONFIG="${PWD}/serve_deployments.json"
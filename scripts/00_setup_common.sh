@@ -19,6 +19,7 @@ fi
 : "${MODEL_NAME:=TinyLlama-1.1B-Chat-v1.0}"
 : "${MODEL_REPO:=https://huggingface.co/TinyLlama/TinyLlama-1.1B-Chat-v1.0}"
 : "${MODEL_DIR:=$SHARED_DIR/$MODEL_NAME}"
+: "${MODEL_LOCAL_ROOT:=/var/tmp/cluster-llm}"
 : "${VLLM_HOST:=0.0.0.0}"
 : "${TENSOR_PARALLEL_SIZE:=2}"
 : "${RAY_PORT:=6379}"
@@ -107,6 +108,35 @@ primary_ip() {
   hostname -I 2>/dev/null | awk '{print $1}'
 }
 
+# Helper: poll a command until it succeeds, instead of sleeping a fixed time.
+# Usage: wait_for <timeout_seconds> <command> [args...]
+wait_for() {
+  local timeout="$1"
+  shift
+  local deadline=$((SECONDS + timeout))
+  until "$@" >/dev/null 2>&1; do
+    if (( SECONDS >= deadline )); then
+      return 1
+    fi
+    sleep 0.5
+  done
+}
+
+# Helper: directory to load the model from on this node. Prefers the
+# node-local copy made by scripts/05f_replicate_model_local.sh; its manifest is
+# written last, and every file must still match it (stage_model.py --check, the
+# same size check serve_app.node_local_copy makes), so a partial or damaged
+# copy is never used.
+model_load_dir() {
+  local local_dir="${MODEL_LOCAL_ROOT%/}/$(basename "$MODEL_DIR")"
+  if [[ -n "${MODEL_LOCAL_ROOT:-}" && -f "$local_dir/.stage_manifest.json" ]] \
+    && uv run python "$REPO_ROOT/scripts/helpers/stage_model.py" --dest "$local_dir" --check >/dev/null 2>&1; then
+    echo "$local_dir"
+  else
+    echo "$MODEL_DIR"
+  fi
+}
+
 # Auto-find available VLLM port if not explicitly set, but reuse persisted value if present
 VLLM_PORT_FILE="$STATE_DIR/vllm_port"
 
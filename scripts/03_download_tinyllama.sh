@@ -15,27 +15,18 @@ fi
 
 echo "[download_model] Target: $MODEL_DIR"
 mkdir -p "$SHARED_DIR"
-cd "$SHARED_DIR"
 
-if [[ -d "$MODEL_DIR" && -f "$MODEL_DIR/config.json" ]]; then
-  echo "[download_model] Model already present at $MODEL_DIR"
-  exit 0
+# Parallel, resumable download with checksum verification; re-running after an
+# interruption continues from the .partial files. An intact staged copy is
+# detected from its manifest without re-hashing.
+STAGE_ARGS=(--repo "$MODEL_REPO" --dest "$MODEL_DIR" --jobs "${MODEL_STAGE_JOBS:-8}")
+if [[ -n "${MODEL_MIRROR:-}" ]]; then
+  echo "[download_model] Staging from local mirror $MODEL_MIRROR"
+  STAGE_ARGS+=(--mirror "$MODEL_MIRROR")
+else
+  echo "[download_model] Staging $MODEL_REPO"
 fi
 
-echo "[download_model] Ensuring git-lfs is installed"
-git lfs install
-
-if [[ ! -d "$MODEL_NAME" ]]; then
-  echo "[download_model] Cloning $MODEL_REPO"
-  git clone "$MODEL_REPO" "$MODEL_NAME"
-fi
-
-# Optional: cleanup .git to save space
-if [[ -d "$MODEL_NAME/.git" ]]; then
-  echo "[download_model] Removing .git directory to save space"
-  rm -rf "$MODEL_NAME/.git"
-fi
+uv run python "$REPO_ROOT/scripts/helpers/stage_model.py" "${STAGE_ARGS[@]}"
 
 echo "[download_model] Done"
-
-
@@ -187,7 +187,8 @@ systemctl restart grafana-server || true
 
 # Wait for services to be ready
 echo "[install_monitoring] Waiting for services to be ready..."
-sleep 5
+wait_for 30 systemctl is-active --quiet prometheus || true
+wait_for 30 systemctl is-active --quiet grafana-server || true
 
 # Check if services are running
 if systemctl is-active --quiet prometheus; then
@@ -43,7 +43,7 @@ fi
 uv run python -m ray.scripts.scripts start --head --node-ip-address "$NODE_IP" --port "$RAY_PORT" --dashboard-host 0.0.0.0
 
 echo "[start_ray_head] Waiting for Ray to initialize..."
-sleep 3
+wait_for 60 uv run python -m ray.scripts.scripts status --address "${NODE_IP}:${RAY_PORT}" || true
 
 echo "[start_ray_head] Ray cluster status:"
 uv run python -m ray.scripts.scripts status || echo "[start_ray_head] Warning: ray status unavailable"
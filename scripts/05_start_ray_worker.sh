@@ -39,7 +39,7 @@ echo "[start_ray_worker] Prometheus: ${RAY_PROMETHEUS_HOST}"
 uv run python -m ray.scripts.scripts start --address "${HEAD_NODE_IP}:${RAY_PORT}" --node-ip-address "${WORKER_NODE_IP}"
 
 echo "[start_ray_worker] Waiting for worker to initialize..."
-sleep 3
+wait_for 60 uv run python -m ray.scripts.scripts status --address "${HEAD_NODE_IP}:${RAY_PORT}" || true
 
 echo "[start_ray_worker] Ray cluster status:"
 uv run python -m ray.scripts.scripts status || echo "[start_ray_worker] Warning: ray status unavailable"
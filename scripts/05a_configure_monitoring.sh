@@ -72,7 +72,7 @@ echo "[configure_monitoring] Restarting Prometheus..."
 systemctl restart prometheus
 
 # Wait for Prometheus to be ready
-sleep 3
+wait_for 30 curl -sf "http://localhost:${PROMETHEUS_PORT}/-/ready" || true
 
 # Configure Grafana with Prometheus datasource and default dashboards
 echo "[configure_monitoring] Configuring Grafana..."
@@ -90,7 +90,6 @@ fi
 # Restart Grafana to apply iframe changes
 echo "[configure_monitoring] Restarting Grafana to apply iframe settings..."
 systemctl restart grafana-server
-sleep 3
 
 # Get Grafana admin credentials (now from common config)
 # GRAFANA_ADMIN_USER and GRAFANA_ADMIN_PASS are set in 00_setup_common.sh
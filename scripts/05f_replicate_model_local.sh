@@ -0,0 +1,33 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
+COMMON_SETUP="$REPO_ROOT/scripts/00_setup_common.sh"
+
+if [[ -f "$COMMON_SETUP" ]]; then
+  # shellcheck source=/dev/null
+  source "$COMMON_SETUP"
+else
+  echo "[replicate_model] ERROR: Unable to locate $COMMON_SETUP" >&2
+  exit 1
+fi
+
+# Copies MODEL_DIR from shared storage to MODEL_LOCAL_ROOT on every Ray node
+# (one pinned Ray task per node), so vLLM and Serve replicas load weights from
+# local disk instead of all reading the shared mount at once. Run it after the
+# workers have joined; re-running only copies to nodes that are out of date.
+echo "[replicate_model] Source: $MODEL_DIR"
+echo "[replicate_model] Node-local root: $MODEL_LOCAL_ROOT"
+
+if ! uv run python -m ray.scripts.scripts status >/dev/null 2>&1; then
+  echo "[replicate_model] ERROR: Ray cluster is not running" >&2
+  echo "[replicate_model] Please start Ray first with: bash scripts/04_start_ray_head.sh" >&2
+  exit 1
+fi
+
+uv run python "$REPO_ROOT/scripts/helpers/replicate_model.py" \
+  --source "$MODEL_DIR" \
+  --dest-root "$MODEL_LOCAL_ROOT"
+
+echo "[replicate_model] Done"
@@ -26,28 +26,32 @@ fi
 echo "[launch_vllm_ray] Starting vLLM (Ray backend) on ${VLLM_HOST}:${VLLM_PORT}"
 echo "[launch_vllm_ray] Node IP: ${NODE_IP}"
 echo "[launch_vllm_ray] VLLM_HOST_IP: ${VLLM_HOST_IP}"
+MODEL_LOAD_DIR="$(model_load_dir)"
 echo "[launch_vllm_ray] Model: ${MODEL_DIR}"
+if [[ "$MODEL_LOAD_DIR" != "$MODEL_DIR" ]]; then
+  echo "[launch_vllm_ray] Loading weights from node-local copy: ${MODEL_LOAD_DIR}"
+fi
 echo "[launch_vllm_ray] Tensor Parallel Size: ${TENSOR_PARALLEL_SIZE}"
 echo "[launch_vllm_ray] Ray backend: distributed"
 
-uv run python -m vllm.entrypoints.openai.api_server \
-  --model "$MODEL_DIR" \
-  --host "$VLLM_HOST" --port "$VLLM_PORT" \
-  --distributed-executor-backend ray \
-  --tensor-parallel-size "$TENSOR_PARALLEL_SIZE" &
+if [[ "${VLLM_MOCK:-0}" == "1" ]]; then
+  # CPU-only stand-in with the same OpenAI API (scripts/helpers/mock_vllm_server.py).
+  echo "[launch_vllm_ray] VLLM_MOCK=1: starting the CPU-only mock vLLM server"
+  uv run python "$REPO_ROOT/scripts/helpers/mock_vllm_server.py" \
+    --model "$MODEL_DIR" \
+    --host "$VLLM_HOST" --port "$VLLM_PORT" &
+else
+  uv run python -m vllm.entrypoints.openai.api_server \
+    --model "$MODEL_LOAD_DIR" \
+    --served-model-name "$MODEL_DIR" \
+    --host "$VLLM_HOST" --port "$VLLM_PORT" \
+    --distributed-executor-backend ray \
+    --tensor-parallel-size "$TENSOR_PARALLEL_SIZE" &
+fi
 
 VLLM_PID=$!
 echo "[launch_vllm_ray] vLLM started with PID: ${VLLM_PID}"
 
-echo "[launch_vllm_ray] Waiting for vLLM to initialize..."
-sleep 5
-
-# Check if vLLM is still running
-if ! kill -0 $VLLM_PID 2>/dev/null; then
-  echo "[launch_vllm_ray] ERROR: vLLM process died" >&2
-  exit 1
-fi
-
 # Wait for vLLM API to be ready (with timeout)
 echo "[launch_vllm_ray] Waiting for vLLM API to be ready..."
 MAX_WAIT=120
@@ -62,8 +66,8 @@ while [ $WAIT_COUNT -lt $MAX_WAIT ]; do
     echo "[launch_vllm_ray] ERROR: vLLM process died during initialization" >&2
     exit 1
   fi
-  sleep 2
-  WAIT_COUNT=$((WAIT_COUNT + 2))
+  sleep 1
+  WAIT_COUNT=$((WAIT_COUNT + 1))
 done
 
 if [ $WAIT_COUNT -ge $MAX_WAIT ]; then
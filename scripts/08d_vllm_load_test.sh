@@ -0,0 +1,51 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Load test / latency benchmark against the vLLM or Ray Serve endpoints.
+# Usage:
+#   ./08d_vllm_load_test.sh                                  # chat, 8 users, streaming
+#   TARGET=llm MODE=open RATE=20 DURATION=60 ./08d_vllm_load_test.sh
+#   ./08d_vllm_load_test.sh --target echo --concurrency 64   # extra args are passed through
+# Results are printed as a table and written as JSON under logs/.
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
+COMMON_SETUP="$REPO_ROOT/scripts/00_setup_common.sh"
+
+if [[ -f "$COMMON_SETUP" ]]; then
+  # shellcheck source=/dev/null
+  source "$COMMON_SETUP"
+fi
+
+TARGET="${TARGET:-chat}"
+MODE="${MODE:-closed}"
+CONCURRENCY="${CONCURRENCY:-8}"
+RATE="${RATE:-10}"
+NUM_REQUESTS="${NUM_REQUESTS:-200}"
+MAX_TOKENS="${MAX_TOKENS:-64}"
+
+EXTRA_ARGS=()
+if [[ -n "${VLLM_BASE_URL:-}" && "$TARGET" == "chat" ]]; then
+  EXTRA_ARGS+=(--base-url "$VLLM_BASE_URL")
+fi
+if [[ -n "${DURATION:-}" ]]; then
+  EXTRA_ARGS+=(--duration "$DURATION")
+fi
+if [[ "${STREAM:-1}" == "1" ]]; then
+  EXTRA_ARGS+=(--stream)
+fi
+
+LOGS_DIR="$REPO_ROOT/logs"
+mkdir -p "$LOGS_DIR"
+JSON_OUT="$LOGS_DIR/load_test_${TARGET}_$(date +"%Y%m%d_%H%M%S").json"
+
+echo "[load-test] Target: ${TARGET}, mode: ${MODE}"
+cd "$REPO_ROOT"
+uv run python scripts/helpers/load_generator.py \
+  --target "$TARGET" --mode "$MODE" \
+  --concurrency "$CONCURRENCY" --rate "$RATE" \
+  --num-requests "$NUM_REQUESTS" --max-tokens "$MAX_TOKENS" \
+  --json-out "$JSON_OUT" \
+  "${EXTRA_ARGS[@]}" "$@"
+
+echo "[load-test] JSON results: ${JSON_OUT}"
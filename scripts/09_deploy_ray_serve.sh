@@ -82,5 +82,6 @@ echo "[deploy_ray_serve] Test with:"
 echo "[deploy_ray_serve]   curl -X POST http://${NODE_IP}:${SERVE_PORT}/echo -H 'Content-Type: application/json' -d '{\"message\": \"Hello Ray Serve!\"}'"
 echo "[deploy_ray_serve]   curl -X POST http://${NODE_IP}:${SERVE_PORT}/calc -H 'Content-Type: application/json' -d '{\"operation\": \"add\", \"a\": 10, \"b\": 5}'"
 echo "[deploy_ray_serve]   curl -X POST http://${NODE_IP}:${SERVE_PORT}/llm -H 'Content-Type: application/json' -d '{\"prompt\": \"Hello, how are you?\", \"max_tokens\": 50}'"
+echo "[deploy_ray_serve]   curl -N -X POST http://${NODE_IP}:${SERVE_PORT}/llm -H 'Content-Type: application/json' -d '{\"prompt\": \"Hello, how are you?\", \"max_tokens\": 50, \"stream\": true}'"
 echo "[deploy_ray_serve] Done"
 
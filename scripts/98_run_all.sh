@@ -1,8 +1,11 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-# Master script to run all setup and deployment scripts in sequence
-# All output is logged to a single datetime-stamped file
+# Master script to run all setup and deployment scripts.
+# By default the steps run as a dependency graph (scripts/helpers/bringup.py):
+# independent steps overlap, finished steps are skipped and each step gets its
+# own log next to the single datetime-stamped file. RUN_ALL_SERIAL=1 runs them
+# in sequence as below.
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 REPO_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
@@ -23,6 +26,10 @@ fi
 # Ensure PATH includes common uv installation locations
 export PATH="$HOME/.local/bin:/root/.local/bin:/usr/local/bin:$PATH"
 
+if [[ "${RUN_ALL_SERIAL:-0}" != "1" ]]; then
+    exec python3 "$SCRIPT_DIR/helpers/bringup.py" "$@"
+fi
+
 # Create logs directory if it doesn't exist
 LOG_DIR_NOTE=""
 LOGS_DIR="${REPO_ROOT}/logs"
@@ -140,6 +147,12 @@ if [[ "${RUN_WORKER:-false}" == "true" ]]; then
     }
 fi
 
+# Node-local model copies (optional - replicas fall back to shared storage)
+run_script "05f_replicate_model_local.sh" "Replicate model to node-local storage" && SUCCESSFUL_SCRIPTS+=("05f_replicate_model_local.sh") || {
+    FAILED_SCRIPTS+=("05f_replicate_model_local.sh")
+    log_with_timestamp "${YELLOW}[WARN]${NC} Model replication failed, replicas will read from shared storage..."
+}
+
 # Monitoring configuration (optional - continue even if it fails)
 run_script "05a_configure_monitoring.sh" "Configure monitoring" && SUCCESSFUL_SCRIPTS+=("05a_configure_monitoring.sh") || {
     FAILED_SCRIPTS+=("05a_configure_monitoring.sh")
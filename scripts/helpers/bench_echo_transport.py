@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Measure the transport overhead of each Serve hop by echoing payloads.
+
+The same EchoService code is reached over up to three paths:
+
+- ``handle``: a DeploymentHandle call from this process (Ray RPC only; run the
+  script on a cluster node with Ray installed)
+- ``direct``: HTTP to ``/echo-direct`` (Serve's HTTP proxy, then the echo
+  replica; deploy with ``SERVE_ECHO_DIRECT=1``)
+- ``ingress``: HTTP to ``/echo`` (proxy, the Ingress replica, then the echo
+  replica)
+
+and in three modes: ``json`` (a ``{"message": ...}`` body decoded and
+re-encoded), ``raw`` (bytes in and out via ``/echo/raw``) and ``stream`` (the
+bytes come back in ``--chunk-size`` pieces via ``/echo/stream``). For every
+payload size and concurrency it reports latency percentiles and throughput per
+path, the per-hop overhead (direct - handle is the HTTP proxy, ingress -
+direct is the ingress layer) and the payload copies each path makes per
+request.
+
+Usage:
+    python scripts/helpers/bench_echo_transport.py --sizes 100,64KiB,4MiB --concurrency 1,16
+    python scripts/helpers/bench_echo_transport.py --paths handle,direct,ingress --modes raw --json-out echo.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HELPERS_DIR))
+if HELPERS_DIR not in sys.path:
+    sys.path.insert(0, HELPERS_DIR)
+
+from load_generator import AsyncHTTPClient, percentile, serve_base_url  # noqa: E402
+
+PATHS = ("handle", "direct", "ingress")
+MODES = ("json", "raw", "stream")
+HOP_NAMES = {"direct": "HTTP proxy", "ingress": "ingress"}
+
+# Handle hops between the client and the echo replica on each path.
+PATH_HOPS = {"handle": 1, "direct": 1, "ingress": 2}
+
+UNITS = {"": 1, "b": 1, "k": 1000, "kb": 1000, "kib": 1024, "m": 1000 ** 2, "mb": 1000 ** 2, "mib": 1024 ** 2}
+
+
+def copies_per_request(path, mode):
+    """
+    Full copies of the payload one request makes on ``path``.
+
+    Every hop carries the payload twice (request and response), and each
+    crossing is one serialization plus one deserialization: HTTP bodies travel
+    from Serve's proxy to a replica as pickled ASGI messages, handle arguments
+    and results as pickled objects. JSON mode over HTTP adds a decode of the
+    request and an encode of the response. Socket reads and writes are not
+    counted.
+    """
+    copies = PATH_HOPS[path] * 4
+    if mode == "json" and path != "handle":
+        copies += 2
+    return copies
+
+
+def parse_size(text):
+    """``"64KiB"`` -> 65536; plain numbers are bytes."""
+    text = text.strip().lower()
+    number = text.rstrip("kmib")
+    unit = text[len(number):]
+    if unit not in UNITS or not number:
+        raise argparse.ArgumentTypeError(f"Bad size: {text!r} (use e.g. 100, 64KiB, 1MiB)")
+    return int(float(number) * UNITS[unit])
+
+
+def format_size(size):
+    for unit, scale in (("MiB", 1024 ** 2), ("KiB", 1024)):
+        if size >= scale:
+            return f"{size / scale:g}{unit}"
+    return f"{size}B"
+
+
+def payload_for(mode, size):
+    """``(body bytes, content type, expected response bytes)`` for one request."""
+    if mode == "json":
+        body = json.dumps({"message": "x" * size}).encode("utf-8")
+        return body, "application/json", size
+    return os.urandom(size), "application/octet-stream", size
+
+
+class HTTPTransport:
+    """Echo over HTTP, through the ingress (``/echo``) or directly (``/echo-direct``)."""
+
+    def __init__(self, client, base_url, prefix, chunk_size):
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+
+    def url(self, mode):
+        if mode == "json":
+            return f"{self.base_url}{self.prefix}"
+        if mode == "stream":
+            return f"{self.base_url}{self.prefix}/stream?chunk_size={self.chunk_size}"
+        return f"{self.base_url}{self.prefix}/raw"
+
+    async def available(self):
+        try:
+            status, _, body = await self.client.request("POST", self.url("raw"), body=b"ping")
+        except OSError:
+            return False
+        return status == 200 and body == b"ping"
+
+    async def echo(self, mode, body, content_type):
+        status, _, data = await self.client.request(
+            "POST", self.url(mode), body=body, headers={"Content-Type": content_type}
+        )
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {data[:200]!r}")
+        return len(data)
+
+
+class HandleTransport:
+    """Echo through a DeploymentHandle to the ingress app's echo replica."""
+
+    def __init__(self, app_name, chunk_size):
+        import ray
+        from ray import serve
+
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        from serve_app import ServeRequest
+
+        ray.init(address="auto", ignore_reinit_error=True, log_to_driver=False)
+        self.serve_request = ServeRequest
+        self.handle = serve.get_deployment_handle("echo_service", app_name=app_name)
+        self.stream_handle = self.handle.options(stream=True, method_name="stream")
+        self.chunk_size = chunk_size
+
+    async def available(self):
+        return await self.echo("raw", b"ping", None) == 4
+
+    async def echo(self, mode, body, content_type):
+        if mode == "json":
+            request = self.serve_request(path="/echo", method="POST", data=json.loads(body))
+            return len((await self.handle.remote(request))["echo"])
+        request = self.serve_request(path=f"/echo/{mode}", method="POST",
+                                     data={"chunk_size": self.chunk_size}, body=body)
+        if mode == "raw":
+            return len(await self.handle.remote(request))
+        received = 0
+        async for chunk in self.stream_handle.remote(request):
+            received += len(chunk)
+        return received
+
+
+async def run_cell(transport, mode, size, concurrency, requests, warmup):
+    """Closed loop of ``concurrency`` workers sending ``requests`` echoes in total."""
+    body, content_type, expected = payload_for(mode, size)
+    for _ in range(warmup):
+        await transport.echo(mode, body, content_type)
+
+    latencies = []
+    errors = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                received = await transport.echo(mode, body, content_type)
+                if received < expected:
+                    raise RuntimeError(f"short echo: {received} of {expected} bytes")
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                errors[error] = errors.get(error, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies_ms = [latency * 1000.0 for latency in latencies]
+    return {
+        "requests": requests,
+        "successful": len(latencies),
+        "errors": errors,
+        "p50_ms": _round(percentile(latencies_ms, 50)),
+        "p99_ms": _round(percentile(latencies_ms, 99)),
+        "mean_ms": _round(sum(latencies_ms) / len(latencies_ms)) if latencies_ms else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        # Payload bytes moved per second, counting both directions.
+        "throughput_mb_s": round(2 * size * len(latencies) / elapsed / 1e6, 2) if elapsed > 0 else None,
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+async def run(args):
+    client = AsyncHTTPClient()
+    transports = {}
+    try:
+        for path in args.paths:
+            if path == "handle":
+                try:
+                    transport = HandleTransport(args.app_name, args.chunk_size)
+                except Exception as e:
+                    print(f"Skipping handle path: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+            else:
+                prefix = "/echo-direct" if path == "direct" else "/echo"
+                transport = HTTPTransport(client, args.base_url, prefix, args.chunk_size)
+            if await transport.available():
+                transports[path] = transport
+            elif path == "direct":
+                print("Skipping direct path: /echo-direct is not deployed (SERVE_ECHO_DIRECT=1)", file=sys.stderr)
+            else:
+                print(f"Skipping {path} path: the echo service did not answer", file=sys.stderr)
+        if not transports:
+            raise SystemExit("No echo path is reachable")
+
+        cells = []
+        for mode in args.modes:
+            for size in args.sizes:
+                for concurrency in args.concurrency:
+                    # Bound the bytes sent per cell so megabyte payloads stay quick.
+                    requests = max(concurrency, min(args.requests, args.max_mb_per_cell * 2 ** 20 // max(1, size)))
+                    cell = {"mode": mode, "size_bytes": size, "concurrency": concurrency, "paths": {}}
+                    for path, transport in transports.items():
+                        result = await run_cell(transport, mode, size, concurrency, requests, args.warmup)
+                        result["copies_per_request"] = copies_per_request(path, mode)
+                        result["bytes_copied_per_request"] = result["copies_per_request"] * size
+                        cell["paths"][path] = result
+                    cell["hop_overhead_ms"] = hop_overhead(cell["paths"])
+                    cells.append(cell)
+                    print_cell(cell)
+        return cells
+    finally:
+        client.close()
+
+
+def hop_overhead(paths):
+    """p50 latency each hop adds: the path minus the next shorter one."""
+    overhead = {}
+    previous = None
+    for path in PATHS:
+        result = paths.get(path)
+        if result is None or result["p50_ms"] is None:
+            continue
+        if previous is not None and path in HOP_NAMES:
+            overhead[HOP_NAMES[path]] = round(result["p50_ms"] - previous["p50_ms"], 3)
+        previous = result
+    return overhead
+
+
+def print_cell(cell):
+    print(f"\n{cell['mode']} {format_size(cell['size_bytes'])} x {cell['concurrency']} concurrent")
+    print(f"  {'path':<8} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'MB/s':>9} {'copies':>7} {'copied':>9}")
+    for path, result in cell["paths"].items():
+        if not result["successful"]:
+            print(f"  {path:<8} all {result['requests']} requests failed: {result['errors']}")
+            continue
+        print(f"  {path:<8} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f} {result['throughput_rps']:>9.1f} "
+              f"{result['throughput_mb_s']:>9.1f} {result['copies_per_request']:>7} "
+              f"{format_size(result['bytes_copied_per_request']):>9}")
+        for error, count in result["errors"].items():
+            print(f"    error x{count}: {error}")
+    for hop, overhead_ms in cell["hop_overhead_ms"].items():
+        print(f"  + {hop}: {overhead_ms:+.3f} ms p50")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep echo payload size and concurrency over Serve paths.")
+    parser.add_argument("--base-url", default=serve_base_url())
+    parser.add_argument("--paths", default="handle,direct,ingress",
+                        help="Comma-separated subset of: " + ", ".join(PATHS))
+    parser.add_argument("--modes", default="json,raw,stream", help="Comma-separated subset of: " + ", ".join(MODES))
+    parser.add_argument("--sizes", default="16,1KiB,64KiB,1MiB,4MiB",
+                        help="Comma-separated payload sizes (B, KiB, MiB, KB, MB)")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per path and cell")
+    parser.add_argument("--max-mb-per-cell", type=int, default=256,
+                        help="Send fewer requests for large payloads, down to one per worker")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests per path and cell")
+    parser.add_argument("--chunk-size", type=parse_size, default=64 * 1024, help="Streaming echo chunk size")
+    parser.add_argument("--app-name", default="serve_app", help="Serve application of the handle path")
+    parser.add_argument("--json-out", help="Write every cell as JSON to this file")
+    args = parser.parse_args(argv)
+
+    args.paths = [path.strip() for path in args.paths.split(",") if path.strip()]
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for name, values, allowed in (("--paths", args.paths, PATHS), ("--modes", args.modes, MODES)):
+        unknown = sorted(set(values) - set(allowed))
+        if unknown:
+            parser.error(f"{name}: unknown {', '.join(unknown)}")
+    args.paths = [path for path in PATHS if path in args.paths]
+    try:
+        args.sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+        args.concurrency = [max(1, int(level)) for level in args.concurrency.split(",") if level.strip()]
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Echo transport benchmark @ {args.base_url}: paths {', '.join(args.paths)}; "
+          f"modes {', '.join(args.modes)}")
+    cells = asyncio.run(run(args))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"base_url": args.base_url, "cells": cells}, f, indent=2)
+        print(f"\nWrote {len(cells)} cells to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
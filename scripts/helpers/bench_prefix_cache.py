@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark prefill savings from prefix caching on multi-turn conversations.
+
+Replays the same conversation shape against the Ray Serve ``/llm`` endpoint
+twice:
+
+- ``shared``: every conversation starts with the same long system prompt and
+  each turn resends the growing history, so turns share a prompt prefix.
+- ``unique``: every request gets a freshly randomized system prompt of the same
+  length, so nothing can be reused.
+
+The difference in per-request latency (and the ``cached_prompt_tokens``
+reported in ``usage``) is the prefill work saved by prefix caching.
+
+Usage:
+    python scripts/helpers/bench_prefix_cache.py [--base-url http://127.0.0.1:8001]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from urllib import request
+
+WORDS = (
+    "cluster", "replica", "gpu", "tensor", "parallel", "shared", "storage",
+    "latency", "throughput", "token", "prompt", "batch", "serve", "ray",
+    "model", "weights", "kernel", "memory", "cache", "block", "island",
+)
+
+
+def default_base_url():
+    """Resolve the Serve ingress URL the same way the test fixtures do."""
+    host = (
+        os.getenv("RAY_SERVE_TEST_HOST")
+        or os.getenv("SERVE_HOST")
+        or os.getenv("NODE_IP")
+        or "127.0.0.1"
+    )
+    if host == "0.0.0.0":
+        host = "127.0.0.1"
+    port = os.getenv("RAY_SERVE_TEST_PORT") or os.getenv("SERVE_PORT") or "8001"
+    return f"http://{host}:{port}"
+
+
+def post_json(url, payload, timeout=180.0):
+    data = json.dumps(payload).encode("utf-8")
+    req = request.Request(url, data=data, method="POST")
+    req.add_header("Content-Type", "application/json")
+    with request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def system_prompt(rng, words):
+    return "You are a helpful assistant. " + " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def run_scenario(base_url, scenario, args):
+    """Run all conversations for one scenario and collect per-request stats."""
+    rng = random.Random(args.seed)
+    shared_system = system_prompt(rng, args.system_words)
+    latencies = []
+    prompt_tokens = 0
+    cached_tokens = 0
+    errors = 0
+
+    for conversation in range(args.conversations):
+        history = []
+        for turn in range(args.turns):
+            system = shared_system if scenario == "shared" else system_prompt(rng, args.system_words)
+            history.append({"role": "user", "content": f"Question {turn} of conversation {conversation}?"})
+            payload = {
+                "messages": [{"role": "system", "content": system}] + history,
+                "max_tokens": args.max_tokens,
+                "temperature": 0.0,
+                # Bypass the response cache; we are measuring the engine.
+                "cache": False,
+            }
+            start = time.perf_counter()
+            try:
+                response = post_json(f"{base_url}/llm", payload)
+            except Exception as exc:
+                print(f"⚠ Request failed: {exc}", file=sys.stderr)
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if "error" in response:
+                errors += 1
+                continue
+            history.append({"role": "assistant", "content": response.get("response", "")})
+            usage = response.get("usage") or {}
+            prompt_tokens += usage.get("prompt_tokens") or 0
+            cached_tokens += usage.get("cached_prompt_tokens") or 0
+
+    return {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "errors": errors,
+        "latency_mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "cached_fraction": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default=default_base_url(), help="Ray Serve ingress URL")
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--system-words", type=int, default=400, help="Length of the system prompt in words")
+    parser.add_argument("--max-tokens", type=int, default=8, help="Keep small so prefill dominates latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON only")
+    args = parser.parse_args()
+
+    results = [run_scenario(args.base_url, scenario, args) for scenario in ("unique", "shared")]
+    unique, shared = results
+    savings = None
+    if unique["latency_mean_ms"] and shared["latency_mean_ms"]:
+        savings = round(1 - shared["latency_mean_ms"] / unique["latency_mean_ms"], 4)
+    summary = {"base_url": args.base_url, "results": results, "latency_savings": savings}
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"Prefix caching benchmark against {args.base_url}/llm")
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'mean ms':>10} {'p50 ms':>10} "
+          f"{'prompt tok':>11} {'cached tok':>11} {'cached %':>9}")
+    for row in results:
+        print(f"{row['scenario']:<10} {row['requests']:>8} {row['errors']:>6} "
+              f"{row['latency_mean_ms'] or 0:>10.2f} {row['latency_p50_ms'] or 0:>10.2f} "
+              f"{row['prompt_tokens']:>11} {row['cached_prompt_tokens']:>11} "
+              f"{row['cached_fraction'] * 100:>8.1f}%")
+    if savings is not None:
+        print(f"Mean latency saved by sharing prefixes: {savings * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
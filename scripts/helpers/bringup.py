@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Bring the cluster up by running the numbered scripts as a dependency graph.
+
+``98_run_all.sh`` used to run every step one after another. This orchestrator
+starts each script as soon as the steps it depends on have finished, so
+independent work overlaps. For example, the model download runs next to the
+monitoring install, and the Prometheus fixes run next to the Ray start-up.
+On top of that:
+
+- steps whose outputs are already valid are skipped (venv present, model
+  matches its staging manifest, Ray or vLLM already healthy, ...); ``--force``
+  runs everything
+- after a step exits, its readiness check (Ray status, vLLM ``/health``, Serve
+  routes, ...) is polled before dependents start, instead of fixed sleeps
+- every step writes its own log under ``logs/run_all_<timestamp>/``, and its
+  output is appended to the single ``logs/run_all_<timestamp>.log`` when it
+  finishes, so blocks of parallel steps never interleave
+- a timing report lists each step's start offset and duration, plus the
+  critical path that bounds the total wall-clock time
+
+Steps that depend on a failed step are reported as blocked. The run fails
+only when a critical step (venv, shared dir, model, Ray head) fails, like the
+serial script. ``RUN_WORKER=true`` and ``USE_RAY_VLLM=true`` select optional
+steps as before.
+
+Usage:
+    python3 scripts/helpers/bringup.py              # what 98_run_all.sh runs
+    python3 scripts/helpers/bringup.py --dry-run    # print the plan only
+    RUN_ALL_SERIAL=1 bash scripts/98_run_all.sh     # the old serial order
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib import request
+
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(HELPERS_DIR)
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+
+RED = "\033[0;31m"
+GREEN = "\033[0;32m"
+YELLOW = "\033[1;33m"
+NC = "\033[0m"
+
+
+class Step:
+    """
+    One script in the bring-up graph.
+
+    ``requires`` lists steps that must succeed first; ``after`` only orders
+    this step behind others (it runs even if they failed or were disabled).
+    ``valid`` returns True when the step's outputs already exist, ``ready``
+    returns True once what the step started is serving.
+    """
+
+    def __init__(self, script, description, requires=(), after=(), critical=False,
+                 enabled=True, valid=None, ready=None, ready_timeout_s=60.0):
+        self.script = script
+        self.name = script.split("_", 1)[0]
+        self.description = description
+        self.requires = tuple(requires)
+        self.after = tuple(after)
+        self.critical = critical
+        self.enabled = enabled
+        self.valid = valid
+        self.ready = ready
+        self.ready_timeout_s = ready_timeout_s
+
+
+class StepResult:
+    def __init__(self, step, status, started=0.0, finished=0.0, detail=""):
+        self.step = step
+        self.status = status  # ok | skipped | failed | blocked
+        self.started = started
+        self.finished = finished
+        self.detail = detail
+
+    @property
+    def succeeded(self):
+        return self.status in ("ok", "skipped")
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+
+# --------------------------------------------------------------------------- #
+# Validity and readiness checks
+# --------------------------------------------------------------------------- #
+def _quiet(*cmd, timeout=30, env=None):
+    try:
+        return subprocess.run(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout, env=env
+        ).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _http_ok(url, timeout=2.0):
+    try:
+        with request.urlopen(url, timeout=timeout) as resp:
+            return 200 <= resp.status < 300
+    except Exception:  # noqa: BLE001 - any failure means "not ready"
+        return False
+
+
+def wait_until(check, timeout_s, initial_delay_s=0.25, max_delay_s=2.0):
+    """Poll ``check`` with exponential backoff; True as soon as it passes."""
+    deadline = time.monotonic() + timeout_s
+    delay = initial_delay_s
+    while True:
+        if check():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, max_delay_s)
+
+
+# Exits 0 once the cluster at argv[1] has a live worker node on address argv[2]
+# (the head plus at least one more node, in case both share an address).
+WORKER_JOINED_CHECK = """
+import sys
+import ray
+ray.init(address=sys.argv[1], logging_level="ERROR", log_to_driver=False)
+nodes = [node for node in ray.nodes() if node["Alive"]]
+sys.exit(not (len(nodes) >= 2 and any(node["NodeManagerAddress"] == sys.argv[2] for node in nodes)))
+"""
+
+
+def default_steps(env):
+    """The repository's bring-up graph, with checks bound to ``env``."""
+    venv_python = os.path.join(env.get("VENV_DIR", os.path.join(REPO_ROOT, ".venv")), "bin", "python")
+    # The scripts bind Ray and its GCS to the primary address by default.
+    node_ip = env.get("NODE_IP") or (subprocess.run(
+        ["hostname", "-I"], capture_output=True, text=True).stdout.split() or ["127.0.0.1"])[0]
+    ray_address = f"{node_ip}:{env.get('RAY_PORT', '6379')}"
+    vllm_port_file = os.path.join(REPO_ROOT, ".cache", "run_all", "vllm_port")
+
+    def venv_ready():
+        return _quiet(venv_python, "-c", "import importlib.util as u, sys; "
+                      "sys.exit(not all(u.find_spec(m) for m in ('ray', 'vllm')))")
+
+    def shared_dir_ready():
+        shared = env.get("SHARED_DIR", "")
+        return os.path.isdir(shared) and os.access(shared, os.W_OK)
+
+    def model_staged():
+        sys.path.insert(0, HELPERS_DIR)
+        import stage_model
+
+        return not stage_model.check_manifest(env.get("MODEL_DIR", ""))
+
+    def monitoring_installed():
+        return (shutil.which("prometheus") is not None
+                and _quiet("systemctl", "is-active", "--quiet", "prometheus")
+                and _quiet("systemctl", "is-active", "--quiet", "grafana-server"))
+
+    def monitoring_ready():
+        return (_http_ok(f"http://127.0.0.1:{env.get('PROMETHEUS_PORT', '9090')}/-/ready")
+                and _http_ok(f"http://127.0.0.1:{env.get('GRAFANA_PORT', '3000')}/api/health"))
+
+    def ray_ready():
+        return _quiet(venv_python, "-m", "ray.scripts.scripts", "status", "--address", ray_address, env=env)
+
+    def ray_worker_ready():
+        # The head was already up before 05 ran, so "ray status" proves
+        # nothing here: wait for the worker's node to be alive in the cluster.
+        head = f"{env['HEAD_NODE_IP']}:{env.get('RAY_PORT', '6379')}" if env.get("HEAD_NODE_IP") else ray_address
+        worker_ip = env.get("WORKER_NODE_IP") or node_ip
+        return _quiet(venv_python, "-c", WORKER_JOINED_CHECK, head, worker_ip, env=env)
+
+    def vllm_ready():
+        try:
+            with open(vllm_port_file) as f:
+                port = f.read().strip() or env.get("VLLM_PORT", "8000")
+        except OSError:
+            port = env.get("VLLM_PORT", "8000")
+        return _http_ok(f"http://127.0.0.1:{port}/health")
+
+    def serve_ready():
+        return _http_ok(f"http://127.0.0.1:{env.get('SERVE_PORT', '8001')}/-/routes")
+
+    ray_vllm = env.get("USE_RAY_VLLM", "false") == "true"
+    return [
+        Step("01_setup_venv.sh", "Setup virtual environment", critical=True, valid=venv_ready),
+        Step("02_prepare_shared.sh", "Prepare shared storage directory", critical=True, valid=shared_dir_ready),
+        Step("03_download_tinyllama.sh", "Download TinyLlama model", requires=("01", "02"),
+             critical=True, valid=model_staged),
+        Step("03a_install_monitoring.sh", "Install monitoring tools (Prometheus/Grafana)",
+             valid=monitoring_installed, ready=monitoring_ready),
+        Step("04_start_ray_head.sh", "Start Ray head node", requires=("01",), critical=True,
+             valid=ray_ready, ready=ray_ready),
+        Step("05_start_ray_worker.sh", "Start Ray worker node", requires=("04",),
+             enabled=env.get("RUN_WORKER", "false") == "true", ready=ray_worker_ready),
+        Step("05f_replicate_model_local.sh", "Replicate model to node-local storage",
+             requires=("03", "04"), after=("05",)),
+        # 05a and 05c both rewrite the Prometheus config, so they are ordered.
+        Step("05a_configure_monitoring.sh", "Configure monitoring", requires=("03a",), after=("04",)),
+        Step("05b_verify_monitoring.sh", "Verify monitoring setup", requires=("05a",)),
+        Step("05c_fix_prometheus_config.sh", "Fix Prometheus configuration", requires=("03a",), after=("05a",)),
+        Step("05d_verify_prometheus_config.sh", "Verify Prometheus configuration", requires=("05c",)),
+        Step("05e_fix_ray_dashboard_no_data.sh", "Fix Ray dashboard data issues",
+             requires=("04",), after=("05c",)),
+        Step("07_launch_vllm_ray.sh", "Launch vLLM with Ray backend", requires=("03", "04"),
+             after=("05", "05f"), enabled=ray_vllm, valid=vllm_ready, ready=vllm_ready, ready_timeout_s=300.0),
+        Step("06_launch_vllm_single_node.sh", "Launch vLLM single node", requires=("03",),
+             after=("05f",), enabled=not ray_vllm, valid=vllm_ready, ready=vllm_ready, ready_timeout_s=300.0),
+        Step("08z_vllm_run_all.sh", "Run all vLLM tests", requires=("07" if ray_vllm else "06",)),
+        # Serve may stop the standalone vLLM to free GPUs, so it goes last.
+        Step("09_deploy_ray_serve.sh", "Deploy Ray Serve application", requires=("04",),
+             after=("06", "07", "08z"), ready=serve_ready, ready_timeout_s=120.0),
+    ]
+
+
+# --------------------------------------------------------------------------- #
+# Scheduler
+# --------------------------------------------------------------------------- #
+class BringUp:
+    """Run ``steps`` as a DAG with up to ``jobs`` scripts at once."""
+
+    def __init__(self, steps, script_dir, log_file, step_log_dir, env=None, jobs=8, force=False):
+        self.steps = {step.name: step for step in steps if step.enabled}
+        self.order = [step.name for step in steps if step.enabled]
+        self.script_dir = script_dir
+        self.log_file = log_file
+        self.step_log_dir = step_log_dir
+        self.env = env
+        self.jobs = max(1, jobs)
+        self.force = force
+        self.results = {}
+        self.origin = time.monotonic()
+        self._log_lock = threading.Lock()
+        self._check_graph()
+
+    def _deps(self, step):
+        """Dependencies that are part of this run (disabled steps drop out)."""
+        return [name for name in step.requires + step.after if name in self.steps]
+
+    def _check_graph(self):
+        for step in self.steps.values():
+            for name in step.requires:
+                if name not in self.steps:
+                    raise ValueError(f"{step.script} requires {name}, which is not enabled")
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"dependency cycle through {name}")
+            visiting.add(name)
+            for dep in self._deps(self.steps[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.order:
+            visit(name)
+
+    def log(self, message):
+        line = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+        with self._log_lock:
+            print(line, flush=True)
+            with open(self.log_file, "a") as f:
+                f.write(line + "\n")
+
+    def plan(self):
+        """Waves of steps that can start together when every step succeeds."""
+        level = {}
+        for name in self._topological():
+            level[name] = 1 + max((level[dep] for dep in self._deps(self.steps[name])), default=-1)
+        waves = {}
+        for name in self.order:
+            waves.setdefault(level[name], []).append(name)
+        return [waves[index] for index in sorted(waves)]
+
+    def _topological(self):
+        ordered, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self._deps(self.steps[name]):
+                visit(dep)
+            ordered.append(name)
+
+        for name in self.order:
+            visit(name)
+        return ordered
+
+    def run(self):
+        pending = list(self.order)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while pending or running:
+                for name in list(pending):
+                    if len(running) >= self.jobs:
+                        break
+                    step = self.steps[name]
+                    if any(dep not in self.results for dep in self._deps(step)):
+                        continue
+                    pending.remove(name)
+                    failed = [dep for dep in step.requires if not self.results[dep].succeeded]
+                    if failed:
+                        now = self._now()
+                        self.results[name] = StepResult(step, "blocked", now, now, f"needs {', '.join(failed)}")
+                        self.log(f"{YELLOW}[BLOCKED]{NC} {step.description} (failed: {', '.join(failed)})")
+                        continue
+                    running[pool.submit(self._run_step, step)] = name
+                if not running:
+                    # Only blocked steps were resolved this pass; look again.
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.results[running.pop(future)] = future.result()
+        return self.results
+
+    def _now(self):
+        return time.monotonic() - self.origin
+
+    def _run_step(self, step):
+        started = self._now()
+        if not self.force and step.valid is not None:
+            try:
+                valid = step.valid()
+            except Exception:  # noqa: BLE001 - a broken check just means "run it"
+                valid = False
+            if valid:
+                self.log(f"{GREEN}[SKIP]{NC} {step.description} (already done)")
+                return StepResult(step, "skipped", started, self._now(), "outputs already valid")
+
+        script_path = os.path.join(self.script_dir, step.script)
+        if not os.path.isfile(script_path):
+            self.log(f"{RED}[ERROR]{NC} Script not found: {script_path}")
+            return StepResult(step, "failed", started, self._now(), "script not found")
+
+        self.log(f"{GREEN}[START]{NC} Running: {step.description}")
+        step_log = os.path.join(self.step_log_dir, step.script.replace(".sh", ".log"))
+        with open(step_log, "w") as out:
+            out.write(f"Running: {step.description}\nScript: {script_path}\nStarted at: {time.ctime()}\n")
+            out.flush()
+            exit_code = subprocess.run(
+                ["bash", script_path], stdout=out, stderr=subprocess.STDOUT, env=self.env
+            ).returncode
+
+        detail = ""
+        if exit_code == 0 and step.ready is not None:
+            if not wait_until(step.ready, step.ready_timeout_s):
+                exit_code = exit_code or 1
+                detail = f"not ready after {step.ready_timeout_s:.0f}s"
+        status = "ok" if exit_code == 0 else "failed"
+        detail = detail or ("" if exit_code == 0 else f"exit code {exit_code}")
+        self._append_step_log(step, step_log, status, detail)
+        if status == "ok":
+            self.log(f"{GREEN}[SUCCESS]{NC} Completed: {step.description}")
+        else:
+            self.log(f"{RED}[ERROR]{NC} Failed: {step.description} ({detail})")
+        return StepResult(step, status, started, self._now(), detail)
+
+    def _append_step_log(self, step, step_log, status, detail):
+        """Copy a finished step's output into the combined log as one block."""
+        with open(step_log) as f:
+            output = f.read()
+        banner = "=" * 40
+        verdict = f"Completed: {step.description}" if status == "ok" else f"FAILED: {step.description} ({detail})"
+        with self._log_lock, open(self.log_file, "a") as f:
+            f.write(f"{banner}\n{output}{banner}\n{verdict}\nFinished at: {time.ctime()}\n{banner}\n")
+
+    # ------------------------------------------------------------------- #
+    # Reporting
+    # ------------------------------------------------------------------- #
+    def critical_path(self):
+        """Steps on the longest chain of finish times, and its total length."""
+        finish, previous = {}, {}
+        for name in self._topological():
+            result = self.results.get(name)
+            if result is None:
+                continue
+            deps = [dep for dep in self._deps(self.steps[name]) if dep in finish]
+            base = max(deps, key=lambda dep: finish[dep], default=None)
+            previous[name] = base
+            finish[name] = (finish[base] if base else 0.0) + result.duration
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = []
+        while name:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], total
+
+    def report(self):
+        wall = max((result.finished for result in self.results.values()), default=0.0)
+        serial = sum(result.duration for result in self.results.values())
+        path, _ = self.critical_path()
+        self.log("Step timing (offsets from start):")
+        for name in self.order:
+            result = self.results[name]
+            marker = "*" if name in path else " "
+            self.log(f" {marker} {result.step.script:<36} {result.status:<8} "
+                     f"start {result.started:7.1f}s  took {result.duration:7.1f}s  {result.detail}")
+        self.log(f"Critical path (*): {' -> '.join(path)}")
+        self.log(f"Wall clock {wall:.1f}s vs {serial:.1f}s if run serially "
+                 f"({max(0.0, serial - wall):.1f}s saved)")
+
+    def exit_code(self):
+        failed = [result for result in self.results.values() if not result.succeeded]
+        for result in failed:
+            self.log(f"  ✗ {result.step.script} ({result.status})")
+        if any(result.step.critical for result in failed):
+            self.log(f"{RED}[ERROR]{NC} One or more critical scripts failed. Please review the log file.")
+            return 1
+        if failed:
+            self.log(f"{YELLOW}[WARN]{NC} Some non-critical scripts failed, but deployment may still be functional.")
+        else:
+            self.log(f"{GREEN}[SUCCESS]{NC} All scripts completed successfully!")
+        return 0
+
+
+def load_environment():
+    """Environment after sourcing env.sh and 00_setup_common.sh, like the scripts see it."""
+    common = os.path.join(SCRIPTS_DIR, "00_setup_common.sh")
+    try:
+        output = subprocess.run(
+            ["bash", "-c", 'source "$1" >/dev/null 2>&1; env -0', "bringup", common],
+            capture_output=True, check=True, timeout=60,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return dict(os.environ)
+    env = dict(os.environ)
+    for entry in output.split(b"\0"):
+        key, sep, value = entry.decode("utf-8", "replace").partition("=")
+        if sep:
+            env[key] = value
+    return env
+
+
+def logs_dir():
+    """``logs/`` like 98_run_all.sh, falling back when it is not writable."""
+    for candidate in (os.path.join(REPO_ROOT, "logs"), os.path.join(REPO_ROOT, "logs-local")):
+        try:
+            os.makedirs(candidate, exist_ok=True)
+        except OSError:
+            continue
+        if os.access(candidate, os.W_OK):
+            return candidate
+    return tempfile.mkdtemp(prefix="run_all_logs_")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=8, help="Maximum scripts running at once")
+    parser.add_argument("--force", action="store_true", help="Run steps even if their outputs look valid")
+    parser.add_argument("--dry-run", action="store_true", help="Print the execution plan and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = load_environment()
+    env["PATH"] = os.pathsep.join([os.path.expanduser("~/.local/bin"), "/root/.local/bin",
+                                   "/usr/local/bin", env.get("PATH", "")])
+    steps = default_steps(env)
+
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    log_root = logs_dir()
+    step_log_dir = os.path.join(log_root, f"run_all_{timestamp}")
+    log_file = os.path.join(log_root, f"run_all_{timestamp}.log")
+    runner = BringUp(steps, SCRIPTS_DIR, log_file, step_log_dir, env=env, jobs=args.jobs, force=args.force)
+
+    if args.dry_run:
+        for index, wave in enumerate(runner.plan()):
+            print(f"wave {index}: " + ", ".join(runner.steps[name].script for name in wave))
+        return 0
+
+    os.makedirs(step_log_dir, exist_ok=True)
+    runner.log(f"{GREEN}Starting full deployment pipeline (parallel){NC}")
+    runner.log(f"{GREEN}Log file: {log_file} (per-step logs in {step_log_dir}){NC}")
+    runner.run()
+    runner.report()
+
+    primary_ip = env.get("NODE_IP") or "localhost"
+    runner.log(f"{GREEN}Service URLs:{NC}")
+    runner.log(f"  Ray Dashboard:      http://{primary_ip}:{env.get('RAY_DASHBOARD_PORT', '8265')}")
+    runner.log(f"  Ray Serve Ingress:  http://{primary_ip}:{env.get('SERVE_PORT', '8001')}/")
+    if env.get("VLLM_PORT"):
+        runner.log(f"  vLLM API:           http://{primary_ip}:{env['VLLM_PORT']}")
+    runner.log(f"  Prometheus:         http://{primary_ip}:{env.get('PROMETHEUS_PORT', '9090')}")
+    runner.log(f"  Grafana:            http://{primary_ip}:{env.get('GRAFANA_PORT', '3000')}")
+    runner.log(f"Full log available at: {log_file}")
+    return runner.exit_code()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
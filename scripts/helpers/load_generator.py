@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Asyncio load generator and latency benchmark for the vLLM and Ray Serve endpoints.
+
+Targets:
+- ``chat``: vLLM OpenAI-compatible ``/v1/chat/completions`` (model discovered
+  from ``/v1/models`` the same way the ``vllm_service`` test fixture does)
+- ``llm``:  Ray Serve ``/llm``
+- ``echo``: Ray Serve ``/echo``
+- ``calc``: Ray Serve ``/calc``
+
+Load modes:
+- ``closed``: ``--concurrency`` users, each sending its next request as soon as
+  the previous one finishes.
+- ``open``: requests arrive as a Poisson process at ``--rate`` requests/s,
+  regardless of how fast the server answers.
+
+Reports throughput, output tokens/s, time-to-first-token, inter-token latency
+and p50/p90/p99 end-to-end latency as a table and, optionally, as JSON.
+
+Usage:
+    python scripts/helpers/load_generator.py --target chat --mode closed --concurrency 16 --stream
+    python scripts/helpers/load_generator.py --target llm --mode open --rate 20 --duration 60
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import math
+import os
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+WORDS = (
+    "cluster", "replica", "gpu", "tensor", "parallel", "shared", "storage",
+    "latency", "throughput", "token", "prompt", "batch", "serve", "ray",
+    "model", "weights", "kernel", "memory", "cache", "block", "island",
+    "java", "bali", "sumatra", "volcano", "ocean", "river", "forest",
+)
+
+SERVE_TARGETS = ("llm", "echo", "calc")
+
+
+class AsyncHTTPClient:
+    """
+    Minimal HTTP/1.1 client on asyncio streams with keep-alive connection pooling.
+
+    Supports ``Content-Length``, chunked and read-until-close bodies. When
+    ``on_line`` is given, each complete body line is passed to it as soon as it
+    arrives, which is how Server-Sent Events are timed; if it returns an
+    awaitable, reading waits for it (backpressure). ``on_head`` is called
+    with the status and headers before the body is read. A chunked body cut
+    off before its last chunk raises ``asyncio.IncompleteReadError``.
+    """
+
+    def __init__(self):
+        self._idle = {}
+
+    async def _connect(self, host, port):
+        idle = self._idle.get((host, port))
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return await asyncio.open_connection(host, port)
+
+    def _release(self, host, port, reader, writer, reusable):
+        if reusable and not writer.is_closing():
+            self._idle.setdefault((host, port), []).append((reader, writer))
+        else:
+            writer.close()
+
+    async def request(self, method, url, payload=None, body=None, headers=None, on_line=None, on_head=None):
+        """Send one request and return ``(status, response_headers, body_bytes)``."""
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: keep-alive"]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+            if payload is not None:
+                lines.append("Content-Type: application/json")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        reader, writer = await self._connect(host, port)
+        try:
+            writer.write(head + (body or b""))
+            await writer.drain()
+            status, response_headers = await self._read_head(reader)
+            if on_head is not None:
+                on_head(status, response_headers)
+            data, reusable = await self._read_body(reader, response_headers, on_line)
+        except BaseException:
+            writer.close()
+            raise
+        if response_headers.get("connection", "").lower() == "close":
+            reusable = False
+        self._release(host, port, reader, writer, reusable)
+        return status, response_headers, data
+
+    @staticmethod
+    async def _read_head(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before response")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _read_body(reader, headers, on_line):
+        chunks = []
+        pending = b""
+
+        async def emit(line):
+            result = on_line(line.rstrip(b"\r"))
+            if inspect.isawaitable(result):
+                await result
+
+        async def feed(data):
+            nonlocal pending
+            chunks.append(data)
+            if on_line is None:
+                return
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                await emit(line)
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await reader.readline()
+                if not size_line.endswith(b"\n"):
+                    # The connection closed before the terminating chunk.
+                    raise asyncio.IncompleteReadError(size_line, None)
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Trailers (usually none) end with an empty line.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                await feed(await reader.readexactly(size))
+                await reader.readexactly(2)
+            reusable = True
+        elif "content-length" in headers:
+            await feed(await reader.readexactly(int(headers["content-length"])))
+            reusable = True
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                await feed(data)
+            reusable = False
+        if on_line is not None and pending:
+            await emit(pending)
+        return b"".join(chunks), reusable
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of ``values`` (``pct`` in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def vllm_base_url():
+    """Resolve the vLLM URL the same way the ``vllm_service`` fixture does."""
+    host = (
+        os.getenv("VLLM_TEST_HOST")
+        or os.getenv("VLLM_HOST_IP")
+        or os.getenv("VLLM_HOST")
+        or "127.0.0.1"
+    )
+    if host == "0.0.0.0":
+        host = "127.0.0.1"
+    port = int(os.getenv("VLLM_TEST_PORT") or os.getenv("VLLM_PORT") or 8000)
+    return f"http://{host}:{port}"
+
+
+def serve_base_url():
+    """Resolve the Ray Serve ingress URL the same way the ``ray_serve_service`` fixture does."""
+    host = (
+        os.getenv("RAY_SERVE_TEST_HOST")
+        or os.getenv("SERVE_HOST")
+        or os.getenv("NODE_IP")
+        or "127.0.0.1"
+    )
+    if host == "0.0.0.0":
+        host = "127.0.0.1"
+    port = int(os.getenv("RAY_SERVE_TEST_PORT") or os.getenv("SERVE_PORT") or 8001)
+    return f"http://{host}:{port}"
+
+
+async def discover_model(client, base_url):
+    """Return the first model id from ``/v1/models``."""
+    status, _, body = await client.request("GET", f"{base_url}/v1/models")
+    if status != 200:
+        raise RuntimeError(f"/v1/models returned HTTP {status}")
+    payload = json.loads(body)
+    models = payload.get("data") or []
+    if not models or not isinstance(models[0], dict) or not models[0].get("id"):
+        raise RuntimeError(f"No model id found in /v1/models response from {base_url}")
+    return models[0]["id"]
+
+
+class PromptDataset:
+    """Prompts from a JSONL file or synthesized with a configurable length distribution."""
+
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.args = args
+        self.records = []
+        if args.dataset:
+            with open(args.dataset, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    if isinstance(record, str):
+                        record = {"prompt": record}
+                    self.records.append(record)
+            if not self.records:
+                raise ValueError(f"Dataset {args.dataset} is empty")
+
+    def _length(self):
+        args = self.args
+        if args.prompt_len_dist == "fixed":
+            length = args.prompt_len
+        elif args.prompt_len_dist == "uniform":
+            length = self.rng.uniform(args.prompt_len_min, args.prompt_len_max)
+        elif args.prompt_len_dist == "normal":
+            length = self.rng.gauss(args.prompt_len, args.prompt_len_std)
+        else:  # lognormal with the requested mean and std
+            mean, std = float(args.prompt_len), float(args.prompt_len_std or 1)
+            sigma2 = math.log(1 + (std / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            length = self.rng.lognormvariate(mu, math.sqrt(sigma2))
+        return int(min(max(length, args.prompt_len_min), args.prompt_len_max))
+
+    def next(self):
+        """Return a record with ``prompt`` or ``messages``."""
+        if self.records:
+            return self.rng.choice(self.records)
+        words = " ".join(self.rng.choice(WORDS) for _ in range(max(1, self._length())))
+        return {"prompt": f"Write a short story about: {words}"}
+
+
+def build_request(target, record, args, model, rng):
+    """Return ``(path, payload)`` for one request to ``target``."""
+    if target == "chat":
+        messages = record.get("messages") or [{"role": "user", "content": record["prompt"]}]
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": args.max_tokens,
+            "temperature": args.temperature,
+        }
+        if args.stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        if args.ignore_eos:
+            payload["ignore_eos"] = True
+        return "/v1/chat/completions", payload
+    if target == "llm":
+        payload = dict(record)
+        payload.update({"max_tokens": args.max_tokens, "temperature": args.temperature})
+        if args.stream:
+            payload["stream"] = True
+        return "/llm", payload
+    if target == "echo":
+        return "/echo", {"message": record.get("prompt", "hello")}
+    operation = rng.choice(("add", "subtract", "multiply", "divide"))
+    return "/calc", {"operation": operation, "a": rng.uniform(-100, 100), "b": rng.uniform(1, 100)}
+
+
+async def send_one(client, base_url, target, record, args, model, rng):
+    """Send one request and return its timing record."""
+    path, payload = build_request(target, record, args, model, rng)
+    result = {"ok": False, "ttft": None, "itl": [], "output_tokens": 0, "prompt_tokens": 0}
+    token_times = []
+    usage = {}
+
+    def on_line(line):
+        if not line.startswith(b"data: "):
+            return
+        data = line[len(b"data: "):]
+        if data == b"[DONE]":
+            return
+        now = time.perf_counter()
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        if target == "chat":
+            if event.get("usage"):
+                usage.update(event["usage"])
+            choices = event.get("choices") or []
+            if choices and (choices[0].get("delta") or {}).get("content"):
+                token_times.append(now)
+        elif "token" in event:
+            token_times.append(now)
+        elif "error" in event:
+            result["error"] = str(event["error"])
+
+    start = time.perf_counter()
+    try:
+        status, _, body = await asyncio.wait_for(
+            client.request("POST", f"{base_url}{path}", payload=payload, on_line=on_line if args.stream else None),
+            timeout=args.timeout,
+        )
+    except Exception as exc:
+        result.update(latency=time.perf_counter() - start, error=f"{type(exc).__name__}: {exc}")
+        return result
+    end = time.perf_counter()
+    result["latency"] = end - start
+    result["status"] = status
+    if status != 200:
+        result["error"] = f"HTTP {status}"
+        return result
+
+    if args.stream and target in ("chat", "llm"):
+        if token_times:
+            result["ttft"] = token_times[0] - start
+            result["itl"] = [later - earlier for earlier, later in zip(token_times, token_times[1:])]
+        result["output_tokens"] = usage.get("completion_tokens") or len(token_times)
+        result["prompt_tokens"] = usage.get("prompt_tokens") or 0
+    else:
+        try:
+            response = json.loads(body)
+        except ValueError:
+            response = {}
+        if isinstance(response, dict) and "error" in response:
+            result["error"] = str(response["error"])
+            return result
+        usage = response.get("usage") or {} if isinstance(response, dict) else {}
+        result["output_tokens"] = usage.get("completion_tokens") or 0
+        result["prompt_tokens"] = usage.get("prompt_tokens") or 0
+    result["ok"] = "error" not in result
+    return result
+
+
+async def run_load(args):
+    client = AsyncHTTPClient()
+    target = args.target
+    base_url = args.base_url or (serve_base_url() if target in SERVE_TARGETS else vllm_base_url())
+    model = args.model
+    if target == "chat" and not model:
+        model = await discover_model(client, base_url)
+
+    dataset = PromptDataset(args)
+    rng = random.Random(args.seed + 1)
+    results = []
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    issued = 0
+
+    def more_requests():
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        return issued < args.num_requests
+
+    async def one():
+        results.append(await send_one(client, base_url, target, dataset.next(), args, model, rng))
+
+    started = time.perf_counter()
+    if args.mode == "closed":
+        async def user():
+            nonlocal issued
+            while more_requests():
+                issued += 1
+                await one()
+
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+    else:
+        arrivals = random.Random(args.seed + 2)
+        tasks = []
+        next_arrival = time.perf_counter()
+        while more_requests():
+            issued += 1
+            tasks.append(asyncio.create_task(one()))
+            # Schedule against absolute times so the arrival rate does not drift.
+            next_arrival += arrivals.expovariate(args.rate)
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    client.close()
+    return summarize(results, elapsed, args, base_url, model)
+
+
+def summarize(results, elapsed, args, base_url, model):
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    itls = [gap for r in ok for gap in r["itl"]]
+    output_tokens = sum(r["output_tokens"] for r in ok)
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r.get("error", "unknown")] = errors.get(r.get("error", "unknown"), 0) + 1
+
+    def ms(value):
+        return round(value * 1000.0, 2) if value is not None else None
+
+    def dist(values):
+        return {
+            "mean": ms(sum(values) / len(values)) if values else None,
+            "p50": ms(percentile(values, 50)),
+            "p90": ms(percentile(values, 90)),
+            "p99": ms(percentile(values, 99)),
+        }
+
+    return {
+        "config": {
+            "target": args.target,
+            "base_url": base_url,
+            "model": model,
+            "mode": args.mode,
+            "concurrency": args.concurrency if args.mode == "closed" else None,
+            "rate": args.rate if args.mode == "open" else None,
+            "stream": args.stream,
+            "max_tokens": args.max_tokens,
+        },
+        "requests": len(results),
+        "successful": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "output_tokens": output_tokens,
+        "output_tokens_per_s": round(output_tokens / elapsed, 2) if elapsed else None,
+        "latency_ms": dist(latencies),
+        "ttft_ms": dist(ttfts),
+        "itl_ms": dist(itls),
+    }
+
+
+def print_table(summary):
+    config = summary["config"]
+    load = (f"{config['concurrency']} concurrent users" if config["mode"] == "closed"
+            else f"Poisson arrivals at {config['rate']} req/s")
+    print(f"Target: {config['target']} @ {config['base_url']} ({load})")
+    if config["model"]:
+        print(f"Model:  {config['model']}")
+    print(f"Requests: {summary['requests']} ({summary['successful']} ok, {summary['failed']} failed) "
+          f"in {summary['duration_s']}s")
+    print(f"Throughput: {summary['throughput_rps']} req/s, {summary['output_tokens_per_s']} output tokens/s")
+    print(f"{'metric':<14} {'mean':>10} {'p50':>10} {'p90':>10} {'p99':>10}")
+    for name, key in (("latency (ms)", "latency_ms"), ("TTFT (ms)", "ttft_ms"), ("ITL (ms)", "itl_ms")):
+        row = summary[key]
+        cells = [f"{row[col]:>10.2f}" if row[col] is not None else f"{'-':>10}" for col in ("mean", "p50", "p90", "p99")]
+        print(f"{name:<14} {' '.join(cells)}")
+    for error, count in summary["errors"].items():
+        print(f"  error x{count}: {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the vLLM and Ray Serve endpoints.")
+    parser.add_argument("--target", choices=("chat", "llm", "echo", "calc"), default="chat")
+    parser.add_argument("--base-url", help="Override the endpoint base URL")
+    parser.add_argument("--model", help="Model id for chat requests (default: discover via /v1/models)")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent users in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=10.0, help="Arrival rate (req/s) in open-loop mode")
+    parser.add_argument("--num-requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of --num-requests")
+    parser.add_argument("--stream", action="store_true", help="Stream responses to measure TTFT and ITL")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--ignore-eos", action="store_true", help="Ask vLLM to always generate max_tokens")
+    parser.add_argument("--dataset", help="JSONL file of {'prompt': ...} or {'messages': [...]} records")
+    parser.add_argument("--prompt-len-dist", choices=("fixed", "uniform", "normal", "lognormal"), default="fixed")
+    parser.add_argument("--prompt-len", type=int, default=64, help="Mean prompt length in words")
+    parser.add_argument("--prompt-len-std", type=float, default=16.0)
+    parser.add_argument("--prompt-len-min", type=int, default=1)
+    parser.add_argument("--prompt-len-max", type=int, default=2048)
+    parser.add_argument("--timeout", type=float, default=180.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", help="Also write the summary as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON instead of a table")
+    args = parser.parse_args(argv)
+    if args.mode == "open" and args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.mode == "closed" and args.concurrency <= 0:
+        parser.error("--concurrency must be positive")
+    if args.prompt_len_dist in ("normal", "lognormal") and args.prompt_len < 1:
+        parser.error(f"--prompt-len must be at least 1 with --prompt-len-dist {args.prompt_len_dist}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        summary = asyncio.run(run_load(args))
+    except Exception as exc:
+        print(f"✗ Load test failed: {exc}", file=sys.stderr)
+        sys.exit(1)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_table(summary)
+    if summary["failed"] and not summary["successful"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+CPU-only mock of the vLLM OpenAI-compatible API server.
+
+Serves ``/health``, ``/v1/models``, ``/v1/completions`` and
+``/v1/chat/completions`` (including ``"stream": true`` Server-Sent Events) on
+top of ``stub_engine.StubAsyncEngine`` — the same engine ``serve_app.py`` uses
+with ``SERVE_LLM_STUB=1`` — so the launch scripts, test fixtures and load
+generator can run end to end without a GPU, and the numbers they report
+measure the serving stack rather than the model.
+
+Latency knobs (defaults match the ``SERVE_LLM_STUB_*`` environment variables):
+- ``--token-latency-ms``: decode time per generated token
+- ``--prefill-ms-per-token``: prompt processing time per uncached prompt token
+- ``--max-concurrency``: sequences decoded at once; extra requests queue
+- ``--natural-tokens``: typical answer length before the model "stops"
+
+Usage:
+    python scripts/helpers/mock_vllm_server.py --port 8000 --model TinyLlama-1.1B-Chat-v1.0
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from stub_engine import SamplingParams, StubAsyncEngine, count_tokens  # noqa: E402
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    503: "Service Unavailable",
+}
+
+
+class MockVLLMServer:
+    """
+    Minimal asyncio HTTP/1.1 server speaking the vLLM OpenAI API subset.
+
+    Use ``serve_forever()`` from the command line, or ``start()``/``stop()`` to
+    run it on a background thread (``port=0`` picks a free port), as the test
+    fixtures do.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8000,
+        model="mock-model",
+        token_latency_ms=None,
+        prefill_ms_per_token=None,
+        max_concurrency=None,
+        natural_tokens=16,
+        prefix_caching=True,
+    ):
+        self.host = host
+        self.port = port
+        self.model = model
+        self.engine = StubAsyncEngine(
+            model=model,
+            token_latency_s=None if token_latency_ms is None else token_latency_ms / 1000.0,
+            prefill_latency_s=None if prefill_ms_per_token is None else prefill_ms_per_token / 1000.0,
+            enable_prefix_caching=prefix_caching,
+            max_concurrency=max_concurrency,
+            natural_tokens=natural_tokens,
+        )
+        self.created = int(time.time())
+        # Tests flip this to make /health fail like a vLLM server whose engine died.
+        self.healthy = True
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._connections = set()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ------------------------------------------------------------------ #
+    # Lifecycle
+    # ------------------------------------------------------------------ #
+    async def _start_server(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def serve_forever(self):
+        async def run():
+            await self._start_server()
+            print(f"✓ Mock vLLM server for '{self.model}' listening on {self.base_url}", flush=True)
+            async with self._server:
+                await self._server.serve_forever()
+
+        asyncio.run(run())
+
+    def start(self):
+        """Run the server on a daemon thread and return once it is listening."""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start_server())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="mock-vllm-server", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=10)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # Idle keep-alive connections would otherwise keep their handlers
+            # waiting for the next request forever.
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        self._loop = None
+
+    # ------------------------------------------------------------------ #
+    # HTTP plumbing
+    # ------------------------------------------------------------------ #
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._send_json(writer, 411, _error("chunked request bodies are not supported"))
+                    break
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                await self._dispatch(writer, method.upper(), target.split("?", 1)[0], body)
+                keep_alive = version.strip().upper() == "HTTP/1.1"
+                if headers.get("connection", "").lower() == "close" or not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _send_json(self, writer, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _send_events(self, writer, events):
+        """Stream ``events`` (dicts, then the ``[DONE]`` sentinel) as chunked SSE."""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        async for event in events:
+            data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+        done = b"data: [DONE]\n\n"
+        writer.write(f"{len(done):x}\r\n".encode("latin-1") + done + b"\r\n0\r\n\r\n")
+        await writer.drain()
+
+    async def _dispatch(self, writer, method, path, body):
+        if path == "/health":
+            await self._send_json(writer, 200 if self.healthy else 503, {})
+            return
+        if path == "/v1/models":
+            await self._send_json(writer, 200, self._models())
+            return
+        if path not in ("/v1/completions", "/v1/chat/completions"):
+            await self._send_json(writer, 404, _error(f"Unknown path: {path}", "NotFoundError"))
+            return
+        if method != "POST":
+            await self._send_json(writer, 405, _error("Use POST"))
+            return
+        try:
+            data = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            await self._send_json(writer, 400, _error("Request body is not valid JSON"))
+            return
+        if not isinstance(data, dict):
+            await self._send_json(writer, 400, _error("Request body must be a JSON object"))
+            return
+        if data.get("model") not in (None, self.model):
+            await self._send_json(
+                writer, 404, _error(f"The model `{data.get('model')}` does not exist.", "NotFoundError")
+            )
+            return
+
+        chat = path == "/v1/chat/completions"
+        if chat:
+            messages = data.get("messages")
+            if not isinstance(messages, list) or not messages or not all(isinstance(m, dict) for m in messages):
+                await self._send_json(writer, 400, _error("'messages' must be a non-empty list of objects"))
+                return
+            prompt = _messages_to_prompt(messages)
+        else:
+            prompt = data.get("prompt")
+            if isinstance(prompt, list):
+                prompt = "".join(str(part) for part in prompt)
+            if not isinstance(prompt, str):
+                await self._send_json(writer, 400, _error("'prompt' must be a string"))
+                return
+
+        try:
+            params = SamplingParams(
+                max_tokens=_number(data, "max_tokens", 16, integer=True, minimum=1),
+                temperature=_number(data, "temperature", 1.0, minimum=0.0),
+                seed=_number(data, "seed", None, integer=True),
+                ignore_eos=bool(data.get("ignore_eos", False)),
+            )
+        except ValueError as e:
+            await self._send_json(writer, 400, _error(str(e)))
+            return
+        request_id = ("chatcmpl-" if chat else "cmpl-") + uuid.uuid4().hex
+        if data.get("stream"):
+            include_usage = bool((data.get("stream_options") or {}).get("include_usage"))
+            await self._send_events(writer, self._stream(prompt, params, request_id, chat, include_usage))
+            return
+
+        final = None
+        async for final in self.engine.generate(prompt, params, request_id):
+            pass
+        output = final.outputs[0]
+        choice = {"index": 0, "finish_reason": output.finish_reason, "logprobs": None}
+        if chat:
+            choice["message"] = {"role": "assistant", "content": output.text}
+        else:
+            choice["text"] = output.text
+        await self._send_json(writer, 200, {
+            "id": request_id,
+            "object": "chat.completion" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [choice],
+            "usage": _usage(prompt, len(output.token_ids)),
+        })
+
+    async def _stream(self, prompt, params, request_id, chat, include_usage):
+        """Yield OpenAI-style chunks with one delta per generated token."""
+        base = {
+            "id": request_id,
+            "object": "chat.completion.chunk" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": self.model,
+        }
+        if chat:
+            yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+        sent = ""
+        generated = 0
+        async for output in self.engine.generate(prompt, params, request_id):
+            completion = output.outputs[0]
+            delta, sent = completion.text[len(sent):], completion.text
+            generated = len(completion.token_ids)
+            if chat:
+                choice = {"index": 0, "delta": {"content": delta}, "finish_reason": completion.finish_reason}
+            else:
+                choice = {"index": 0, "text": delta, "finish_reason": completion.finish_reason, "logprobs": None}
+            yield {**base, "choices": [choice]}
+        if include_usage:
+            yield {**base, "choices": [], "usage": _usage(prompt, generated)}
+
+    def _models(self):
+        return {
+            "object": "list",
+            "data": [{
+                "id": self.model,
+                "object": "model",
+                "created": self.created,
+                "owned_by": "vllm",
+                "root": self.model,
+                "max_model_len": 2048,
+            }],
+        }
+
+
+def _error(message, error_type="BadRequestError"):
+    return {"object": "error", "message": message, "type": error_type, "code": None}
+
+
+def _number(data, key, default, integer=False, minimum=None):
+    """Validate a numeric request field the way vLLM's request schema does."""
+    value = data.get(key)
+    if value is None:
+        return default
+    kind = "an integer" if integer else "a number"
+    if (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)
+            or (integer and value != int(value))):
+        raise ValueError(f"'{key}' must be {kind}, got {json.dumps(value)}")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"'{key}' must be at least {minimum}, got {value}")
+    return int(value) if integer else float(value)
+
+
+def _usage(prompt, completion_tokens):
+    prompt_tokens = count_tokens(prompt)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _messages_to_prompt(messages):
+    lines = [f"{message.get('role', 'user')}: {message.get('content', '')}" for message in messages]
+    return "\n".join(lines) + "\nassistant:"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.getenv("VLLM_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("VLLM_PORT", "8000")))
+    parser.add_argument(
+        "--model",
+        default=os.getenv("MODEL_DIR") or os.getenv("MODEL_NAME") or "mock-model",
+        help="Model id reported by /v1/models (vLLM uses the --model path)",
+    )
+    parser.add_argument("--token-latency-ms", type=float, default=None)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="0 = unlimited")
+    parser.add_argument("--natural-tokens", type=int, default=16, help="0 = always generate max_tokens")
+    parser.add_argument("--no-prefix-caching", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MockVLLMServer(
+        host=args.host,
+        port=args.port,
+        model=args.model,
+        token_latency_ms=args.token_latency_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        max_concurrency=args.max_concurrency,
+        natural_tokens=args.natural_tokens,
+        prefix_caching=not args.no_prefix_caching,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Copy a staged model from shared storage to node-local disk on every Ray node.
+
+Every vLLM and Serve replica otherwise reads its weights from the shared mount,
+so scaling out or restarting turns into a read storm on NFS. This tool runs
+one Ray task per alive node (head and every worker joined with
+``05_start_ray_worker.sh``), pinned with node affinity, that:
+
+- copies the model directory with large sequential reads (``--chunk-mb``)
+  into ``.partial`` files, renamed into place once verified
+- verifies each copy against the manifest written by ``stage_model.py``
+  (sha256 or git object id); without a manifest, against the bytes read
+- drops the copy from page cache and re-reads it to verify and to measure
+  what a replica start would cost from local disk
+- writes a manifest for the local copy last, so a half-finished copy is never
+  picked up; re-runs skip nodes whose copy still matches the source
+
+It reports copy throughput per node and the estimated load time saved per
+replica start (shared-storage read time minus local read time).
+
+Usage:
+    python scripts/helpers/replicate_model.py --source "$MODEL_DIR" --dest-root "$MODEL_LOCAL_ROOT"
+    python scripts/helpers/replicate_model.py --local-only   # this machine only, no Ray
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import time
+
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+if HELPERS_DIR not in sys.path:
+    sys.path.insert(0, HELPERS_DIR)
+
+import stage_model  # noqa: E402
+from stage_model import MANIFEST_NAME, check_manifest  # noqa: E402
+
+
+def _advise(fileobj, advice):
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fileobj.fileno(), 0, 0, advice)
+        except OSError:
+            pass
+
+
+def _digest_for(entry, size):
+    """Hash object matching the checksum the manifest recorded for a file."""
+    if entry.get("git_oid") and not entry.get("sha256"):
+        return hashlib.sha1(f"blob {size}\0".encode("ascii")), entry["git_oid"]
+    return hashlib.sha256(), entry.get("sha256")
+
+
+def _read_through(path, digest, buffer):
+    """Hash a file with sequential reads; return the elapsed seconds."""
+    view = memoryview(buffer)
+    started = time.perf_counter()
+    with open(path, "rb", buffering=0) as f:
+        _advise(f, getattr(os, "POSIX_FADV_SEQUENTIAL", 0))
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return time.perf_counter() - started
+
+
+def source_files(source):
+    """``{relative path: os.stat_result}`` for every file of a model directory."""
+    files = {}
+    for directory, dirnames, filenames in os.walk(source):
+        dirnames[:] = [name for name in dirnames if name != ".git"]
+        for name in filenames:
+            if name.startswith(MANIFEST_NAME) or name.endswith(".partial"):
+                continue
+            path = os.path.join(directory, name)
+            files[os.path.relpath(path, source)] = os.stat(path)
+    return files
+
+
+def source_fingerprint(files):
+    """Cheap identity of the source tree (names, sizes, mtimes), no hashing."""
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f"{name}\0{files[name].st_size}\0{files[name].st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def copy_file(src, dst, entry, buffer):
+    """
+    Copy one file with sequential reads and verify the local copy.
+
+    Returns ``(shared_read_s, write_s, local_read_s, checksum)``. Raises
+    ``stage_model.StageError`` if either the source bytes or the re-read local
+    copy do not match the expected checksum.
+    """
+    size = os.path.getsize(src)
+    source_digest, expected = _digest_for(entry, size)
+    partial = dst + ".partial"
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    view = memoryview(buffer)
+    read_s = write_s = 0.0
+    with open(src, "rb", buffering=0) as fin, open(partial, "wb", buffering=0) as fout:
+        _advise(fin, getattr(os, "POSIX_FADV_SEQUENTIAL", 0))
+        while True:
+            started = time.perf_counter()
+            count = fin.readinto(buffer)
+            read_s += time.perf_counter() - started
+            if not count:
+                break
+            source_digest.update(view[:count])
+            started = time.perf_counter()
+            fout.write(view[:count])
+            write_s += time.perf_counter() - started
+        started = time.perf_counter()
+        os.fsync(fout.fileno())
+        write_s += time.perf_counter() - started
+        # Evict the freshly written pages so the verification pass below
+        # really reads from disk, like a replica starting later would.
+        _advise(fout, getattr(os, "POSIX_FADV_DONTNEED", 0))
+
+    if expected is None:
+        expected = source_digest.hexdigest()
+    elif source_digest.hexdigest() != expected:
+        os.remove(partial)
+        raise stage_model.StageError(f"{src}: shared copy does not match its manifest checksum")
+
+    local_digest, _ = _digest_for(entry, size)
+    local_read_s = _read_through(partial, local_digest, buffer)
+    if local_digest.hexdigest() != expected:
+        os.remove(partial)
+        raise stage_model.StageError(f"{dst}: local copy failed verification")
+    os.replace(partial, dst)
+    return read_s, write_s, local_read_s, expected
+
+
+def replicate(source, dest_root, chunk_bytes=64 * 1024 * 1024, force=False):
+    """
+    Make ``<dest_root>/<basename(source)>`` a verified copy of ``source``.
+
+    Returns a stats dict (bytes, timings, whether the node was already current).
+    """
+    source = os.path.abspath(source.rstrip("/"))
+    dest = os.path.join(dest_root, os.path.basename(source))
+    files = source_files(source)
+    fingerprint = source_fingerprint(files)
+    stats = {
+        "node": socket.gethostname(),
+        "dest": dest,
+        "files": len(files),
+        "bytes": sum(stat.st_size for stat in files.values()),
+        "skipped": False,
+        "copy_s": 0.0,
+        "shared_read_s": 0.0,
+        "local_read_s": 0.0,
+    }
+
+    local_manifest = os.path.join(dest, MANIFEST_NAME)
+    if not force and os.path.exists(local_manifest) and not check_manifest(dest):
+        with open(local_manifest) as f:
+            if json.load(f).get("source_fingerprint") == fingerprint:
+                stats["skipped"] = True
+                return stats
+
+    try:
+        with open(os.path.join(source, MANIFEST_NAME)) as f:
+            expected = json.load(f).get("files", {})
+    except (OSError, ValueError):
+        expected = {}
+
+    os.makedirs(dest, exist_ok=True)
+    if os.path.exists(local_manifest):
+        # The copy is about to change; never leave a stale manifest behind.
+        os.remove(local_manifest)
+    existing = sum(
+        os.path.getsize(os.path.join(dest, name)) for name in files if os.path.isfile(os.path.join(dest, name))
+    )
+    free = shutil.disk_usage(dest).free + existing
+    if free < stats["bytes"]:
+        raise stage_model.StageError(
+            f"{dest}: {stats['bytes'] / 2**30:.1f} GiB needed, {free / 2**30:.1f} GiB free"
+        )
+
+    buffer = bytearray(chunk_bytes)
+    entries = {}
+    started = time.perf_counter()
+    for name in sorted(files):
+        entry = dict(expected.get(name, {}))
+        target = os.path.join(dest, name)
+        read_s, _, local_read_s, checksum = copy_file(os.path.join(source, name), target, entry, buffer)
+        if not entry.get("git_oid"):
+            entry["sha256"] = checksum
+        stats["shared_read_s"] += read_s
+        stats["local_read_s"] += local_read_s
+        stat = os.stat(target)
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        entries[name] = entry
+    stats["copy_s"] = time.perf_counter() - started
+
+    manifest = {
+        "source": source,
+        "source_fingerprint": fingerprint,
+        "replicated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": entries,
+    }
+    tmp = local_manifest + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, local_manifest)
+    return stats
+
+
+def _replicate_task(source, dest_root, chunk_bytes, force):
+    import ray
+
+    stats = replicate(source, dest_root, chunk_bytes, force)
+    stats["node"] = ray.util.get_node_ip_address()
+    return stats
+
+
+def replicate_on_all_nodes(source, dest_root, chunk_bytes, force=False, address="auto"):
+    """Run ``replicate`` once on every alive Ray node; return per-node stats."""
+    import ray
+    from ray.util.scheduling_strategies import NodeAffinitySchedulingStrategy
+
+    ray.init(address=address, ignore_reinit_error=True, log_to_driver=False)
+    # Worker nodes may not have this checkout on their Python path; ship the
+    # helper modules' code along with the task instead of importing by name.
+    ray.cloudpickle.register_pickle_by_value(stage_model)
+    if __name__ != "__main__":
+        ray.cloudpickle.register_pickle_by_value(sys.modules[__name__])
+
+    task = ray.remote(num_cpus=0, max_retries=1)(_replicate_task)
+    nodes = [node for node in ray.nodes() if node.get("Alive")]
+    refs = {
+        node["NodeManagerAddress"]: task.options(
+            scheduling_strategy=NodeAffinitySchedulingStrategy(node_id=node["NodeID"], soft=False)
+        ).remote(source, dest_root, chunk_bytes, force)
+        for node in nodes
+    }
+    results = []
+    for node_ip, ref in refs.items():
+        try:
+            results.append(ray.get(ref))
+        except Exception as exc:  # noqa: BLE001 - report every node, keep going
+            results.append({"node": node_ip, "error": str(exc)})
+    return results
+
+
+def print_report(results):
+    failures = 0
+    copied_bytes = 0
+    slowest = 0.0
+    for stats in results:
+        node = stats["node"]
+        if "error" in stats:
+            failures += 1
+            print(f"✗ {node}: {stats['error']}")
+            continue
+        size_mib = stats["bytes"] / 2**20
+        if stats["skipped"]:
+            print(f"✓ {node}: {stats['dest']} already current ({size_mib:.0f} MiB)")
+            continue
+        copied_bytes += stats["bytes"]
+        slowest = max(slowest, stats["copy_s"])
+        copy_rate = size_mib / stats["copy_s"] if stats["copy_s"] else 0.0
+        shared_rate = size_mib / stats["shared_read_s"] if stats["shared_read_s"] else 0.0
+        local_rate = size_mib / stats["local_read_s"] if stats["local_read_s"] else 0.0
+        saved = stats["shared_read_s"] - stats["local_read_s"]
+        print(f"✓ {node}: {stats['files']} files, {size_mib:.0f} MiB in {stats['copy_s']:.1f}s "
+              f"({copy_rate:.0f} MiB/s copy; shared read {shared_rate:.0f} MiB/s, local read {local_rate:.0f} MiB/s)")
+        if saved > 0:
+            print(f"  estimated load time saved per replica start: {saved:.1f}s")
+        else:
+            print("  no load time saved: shared storage read as fast as local disk here")
+    if copied_bytes:
+        aggregate = copied_bytes / 2**20 / slowest if slowest else 0.0
+        print(f"Copied {copied_bytes / 2**30:.2f} GiB across nodes ({aggregate:.0f} MiB/s aggregate)")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", default=os.getenv("MODEL_DIR"), help="Model on shared storage (default: $MODEL_DIR)")
+    parser.add_argument("--dest-root", default=os.getenv("MODEL_LOCAL_ROOT", "/var/tmp/cluster-llm"),
+                        help="Node-local directory for model copies (default: $MODEL_LOCAL_ROOT)")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="Read size for sequential copies")
+    parser.add_argument("--force", action="store_true", help="Copy even if the local copy is current")
+    parser.add_argument("--local-only", action="store_true", help="Replicate to this machine only, without Ray")
+    parser.add_argument("--address", default=os.getenv("RAY_ADDRESS", "auto"), help="Ray cluster address")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.source or not os.path.isdir(args.source):
+        print(f"✗ Source model directory not found: {args.source}", file=sys.stderr)
+        return 2
+    chunk_bytes = max(1, args.chunk_mb) * 1024 * 1024
+    print(f"Replicating {args.source} -> {args.dest_root} on "
+          f"{'this node' if args.local_only else 'every Ray node'}")
+    if args.local_only:
+        try:
+            results = [replicate(args.source, args.dest_root, chunk_bytes, args.force)]
+        except (stage_model.StageError, OSError) as exc:
+            results = [{"node": socket.gethostname(), "error": str(exc)}]
+    else:
+        results = replicate_on_all_nodes(args.source, args.dest_root, chunk_bytes, args.force, args.address)
+    return 1 if print_report(results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
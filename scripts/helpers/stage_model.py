@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Stage a Hugging Face model into shared storage: parallel, resumable, verified.
+
+Replaces the single-stream ``git clone`` + git-lfs download:
+- shard files download in parallel (``--jobs``); each is written to
+  ``<file>.partial`` and resumed with an HTTP byte-range request after an
+  interruption
+- every file is verified: LFS files against their sha256, small files against
+  their git blob id (from the Hub API), mirror files against the source copy
+- ``.bin``/``.pt``/``.pth`` weights are converted to ``.safetensors`` (needs
+  ``torch`` and ``safetensors``) so vLLM can memory-map them; they are skipped
+  entirely when the repo already ships safetensors
+- a manifest (``.stage_manifest.json``) records sizes, hashes and mtimes, so
+  ``--check`` can confirm a staged model in milliseconds without hashing
+
+``--mirror DIR`` stages from a local copy of the repo instead of the Hub, which
+works offline (air-gapped clusters, tests).
+
+Usage:
+    python scripts/helpers/stage_model.py --repo "$MODEL_REPO" --dest "$MODEL_DIR"
+    python scripts/helpers/stage_model.py --mirror /data/mirror/TinyLlama --dest "$MODEL_DIR"
+    python scripts/helpers/stage_model.py --dest "$MODEL_DIR" --check
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib import error, request
+from urllib.parse import quote, urlsplit
+
+MANIFEST_NAME = ".stage_manifest.json"
+HUB_URL = os.getenv("HF_ENDPOINT", "https://huggingface.co")
+CHUNK_BYTES = 8 * 1024 * 1024
+PICKLE_WEIGHT_SUFFIXES = (".bin", ".pt", ".pth")
+# Framework-specific duplicates of the weights that vLLM never reads.
+SKIPPED_SUFFIXES = (".h5", ".msgpack", ".onnx", ".ot", ".tflite", ".mlmodel")
+
+
+class StageError(RuntimeError):
+    pass
+
+
+def repo_id_from(repo):
+    """Accept ``org/name`` or a ``https://huggingface.co/org/name`` URL."""
+    if "://" in repo:
+        return urlsplit(repo).path.strip("/").removesuffix(".git")
+    return repo.strip("/")
+
+
+def git_blob_sha1(path):
+    """Git's object id for a file, which the Hub reports for non-LFS files."""
+    digest = hashlib.sha1(f"blob {os.path.getsize(path)}\0".encode("ascii"))
+    return _hash_file(path, digest)
+
+
+def sha256_file(path):
+    return _hash_file(path, hashlib.sha256())
+
+
+def _hash_file(path, digest):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --------------------------------------------------------------------------- #
+# Sources: where the file list and the bytes come from
+# --------------------------------------------------------------------------- #
+class HubSource:
+    """Files of one revision of a Hugging Face Hub repository."""
+
+    def __init__(self, repo, revision="main", token=None):
+        self.repo_id = repo_id_from(repo)
+        self.revision = revision
+        self.token = token
+        self.description = f"{HUB_URL}/{self.repo_id}@{revision}"
+
+    def _request(self, url, headers=None):
+        req = request.Request(url, headers=headers or {})
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        return request.urlopen(req, timeout=60)
+
+    def list_files(self):
+        """Return ``[{"path", "size", "sha256" | "git_oid"}]`` for the revision."""
+        url = (f"{HUB_URL}/api/models/{self.repo_id}/tree/{quote(self.revision, safe='')}"
+               "?recursive=true")
+        with self._request(url) as resp:
+            entries = json.loads(resp.read().decode("utf-8"))
+        files = []
+        for entry in entries:
+            if entry.get("type") != "file":
+                continue
+            item = {"path": entry["path"], "size": entry.get("size", 0)}
+            lfs = entry.get("lfs")
+            if lfs:
+                item["size"] = lfs.get("size", item["size"])
+                item["sha256"] = lfs.get("oid")
+            else:
+                item["git_oid"] = entry.get("oid")
+            files.append(item)
+        return files
+
+    def open(self, path, offset):
+        """Return ``(stream, resumed)``; ``resumed`` is False if the server ignored the range."""
+        url = f"{HUB_URL}/{self.repo_id}/resolve/{quote(self.revision, safe='')}/{quote(path)}"
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            resp = self._request(url, headers)
+        except error.HTTPError as exc:
+            if exc.code == 416:
+                # Range starts at or past the end: the partial file is complete.
+                return None, True
+            raise
+        return resp, offset > 0 and resp.status == 206
+
+
+class MirrorSource:
+    """Files of a repository copy in a local directory (offline staging)."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.description = self.root
+        if not os.path.isdir(self.root):
+            raise StageError(f"Mirror directory not found: {self.root}")
+
+    def list_files(self):
+        files = []
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if name != ".git"]
+            for name in filenames:
+                full = os.path.join(directory, name)
+                rel = os.path.relpath(full, self.root)
+                if name == MANIFEST_NAME or name.endswith(".partial"):
+                    continue
+                # Hashed lazily in verify(); the mirror copy is the reference.
+                files.append({"path": rel, "size": os.path.getsize(full), "mirror_path": full})
+        return sorted(files, key=lambda item: item["path"])
+
+    def open(self, path, offset):
+        stream = open(os.path.join(self.root, path), "rb")
+        stream.seek(offset)
+        return stream, True
+
+
+# --------------------------------------------------------------------------- #
+# Staging
+# --------------------------------------------------------------------------- #
+def select_files(files, all_files=False):
+    """Drop files vLLM does not need, and pickle weights when safetensors exist."""
+    if all_files:
+        return files
+    has_safetensors = any(item["path"].endswith(".safetensors") for item in files)
+    selected = []
+    for item in files:
+        path = item["path"]
+        if path.endswith(SKIPPED_SUFFIXES) or path.startswith((".git/", ".gitattributes")):
+            continue
+        if has_safetensors and path.endswith(PICKLE_WEIGHT_SUFFIXES):
+            continue
+        selected.append(item)
+    return selected
+
+
+def verify(item, path):
+    """Check a fully downloaded file against the expected size and hash."""
+    if os.path.getsize(path) != item["size"]:
+        return False
+    if item.get("sha256"):
+        return sha256_file(path) == item["sha256"]
+    if item.get("git_oid"):
+        return git_blob_sha1(path) == item["git_oid"]
+    if item.get("mirror_path"):
+        item["sha256"] = sha256_file(item["mirror_path"])
+        return sha256_file(path) == item["sha256"]
+    return True
+
+
+def fetch(source, item, dest):
+    """
+    Download one file into ``dest``, resuming any ``.partial`` left behind.
+
+    Returns ``(path, bytes_transferred)``. A file that fails verification is
+    downloaded again from scratch once before giving up.
+    """
+    target = os.path.join(dest, item["path"])
+    partial = target + ".partial"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target) and verify(item, target):
+        return item["path"], 0
+
+    transferred = 0
+    for attempt in range(2):
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        if offset > item["size"]:
+            offset = 0
+        stream, resumed = source.open(item["path"], offset) if offset < item["size"] else (None, True)
+        if stream is not None:
+            with stream, open(partial, "ab" if resumed else "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    transferred += len(chunk)
+        if verify(item, partial):
+            os.replace(partial, target)
+            return item["path"], transferred
+        # Corrupt or stale partial data: drop it and start over.
+        os.remove(partial)
+    raise StageError(f"{item['path']}: checksum or size mismatch after download")
+
+
+def convert_to_safetensors(dest, keep_original=False):
+    """
+    Convert pickle weight files in ``dest`` to ``.safetensors``.
+
+    Rewrites ``pytorch_model.bin.index.json`` as ``model.safetensors.index.json``
+    for sharded checkpoints. Returns the list of ``(old, new)`` file names.
+    """
+    pickles = sorted(
+        name for name in os.listdir(dest)
+        if name.endswith(PICKLE_WEIGHT_SUFFIXES) and not name.startswith("training_args")
+    )
+    if not pickles:
+        return []
+    try:
+        import torch
+        from safetensors.torch import save_file
+    except ImportError:
+        print("⚠ torch/safetensors not installed; keeping pickle weights (vLLM can still load them)")
+        return []
+
+    converted = []
+    for name in pickles:
+        new_name = safetensors_name(name)
+        state_dict = torch.load(os.path.join(dest, name), map_location="cpu", weights_only=True)
+        if "state_dict" in state_dict and isinstance(state_dict["state_dict"], dict):
+            state_dict = state_dict["state_dict"]
+        # safetensors refuses tensors that share storage (tied embeddings);
+        # give each its own contiguous copy.
+        seen = set()
+        tensors = {}
+        for key, tensor in state_dict.items():
+            storage = tensor.untyped_storage().data_ptr()
+            tensors[key] = tensor.clone().contiguous() if storage in seen else tensor.contiguous()
+            seen.add(storage)
+        save_file(tensors, os.path.join(dest, new_name), metadata={"format": "pt"})
+        converted.append((name, new_name))
+        print(f"✓ Converted {name} -> {new_name}")
+
+    index_path = os.path.join(dest, "pytorch_model.bin.index.json")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        index["weight_map"] = {key: safetensors_name(value) for key, value in index["weight_map"].items()}
+        with open(os.path.join(dest, "model.safetensors.index.json"), "w") as f:
+            json.dump(index, f, indent=2)
+        if not keep_original:
+            os.remove(index_path)
+    if not keep_original:
+        for name, _ in converted:
+            os.remove(os.path.join(dest, name))
+    return converted
+
+
+def safetensors_name(name):
+    stem = name.rsplit(".", 1)[0]
+    if stem.startswith("pytorch_model"):
+        stem = "model" + stem[len("pytorch_model"):]
+    return stem + ".safetensors"
+
+
+def write_manifest(dest, source, files, converted):
+    entries = {}
+    for name in staged_files(dest):
+        path = os.path.join(dest, name)
+        stat = os.stat(path)
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        expected = files.get(name, {})
+        if expected.get("sha256"):
+            entry["sha256"] = expected["sha256"]
+        elif expected.get("git_oid"):
+            entry["git_oid"] = expected["git_oid"]
+        else:
+            entry["sha256"] = sha256_file(path)
+        entries[name] = entry
+    manifest = {
+        "source": source.description,
+        "staged_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "converted": dict(converted),
+        "files": entries,
+    }
+    tmp = os.path.join(dest, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(dest, MANIFEST_NAME))
+    return manifest
+
+
+def staged_files(dest):
+    names = []
+    for directory, _, filenames in os.walk(dest):
+        for name in filenames:
+            if name.startswith(MANIFEST_NAME) or name.endswith(".partial"):
+                continue
+            names.append(os.path.relpath(os.path.join(directory, name), dest))
+    return sorted(names)
+
+
+def check_manifest(dest, deep=False):
+    """
+    Return a list of problems with a staged model (empty when it is intact).
+
+    The default check compares sizes and mtimes only; ``deep`` re-hashes every
+    file against the recorded checksums.
+    """
+    try:
+        with open(os.path.join(dest, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as exc:
+        return [f"no readable manifest: {exc}"]
+    problems = []
+    for name, entry in manifest.get("files", {}).items():
+        path = os.path.join(dest, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            problems.append(f"{name}: missing")
+            continue
+        if stat.st_size != entry["size"]:
+            problems.append(f"{name}: size {stat.st_size} != {entry['size']}")
+        elif deep:
+            if entry.get("sha256") and sha256_file(path) != entry["sha256"]:
+                problems.append(f"{name}: sha256 mismatch")
+            elif entry.get("git_oid") and git_blob_sha1(path) != entry["git_oid"]:
+                problems.append(f"{name}: git object id mismatch")
+        elif stat.st_mtime_ns != entry["mtime_ns"]:
+            problems.append(f"{name}: modified since staging")
+    return problems
+
+
+def stage(source, dest, jobs=8, convert=True, keep_original=False, all_files=False):
+    """Download, verify, convert and record every file of ``source`` into ``dest``."""
+    os.makedirs(dest, exist_ok=True)
+    files = select_files(source.list_files(), all_files=all_files)
+    total = sum(item["size"] for item in files)
+    print(f"Staging {len(files)} files ({total / 2**20:.1f} MiB) from {source.description} -> {dest}")
+
+    started = time.perf_counter()
+    transferred = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(fetch, source, item, dest) for item in files]
+        for future in as_completed(futures):
+            path, nbytes = future.result()
+            transferred += nbytes
+            print(f"✓ {path} ({'cached' if nbytes == 0 else f'{nbytes / 2**20:.1f} MiB'})")
+    elapsed = time.perf_counter() - started
+    rate = transferred / 2**20 / elapsed if elapsed > 0 else 0.0
+    print(f"Transferred {transferred / 2**20:.1f} MiB in {elapsed:.1f}s ({rate:.1f} MiB/s)")
+
+    converted = convert_to_safetensors(dest, keep_original) if convert else []
+    return write_manifest(dest, source, {item["path"]: item for item in files}, converted)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repo", default=os.getenv("MODEL_REPO"), help="Hub repo id or URL (default: $MODEL_REPO)")
+    parser.add_argument("--revision", default="main")
+    parser.add_argument("--mirror", default=os.getenv("MODEL_MIRROR"),
+                        help="Stage from this local repo copy instead of the Hub (default: $MODEL_MIRROR)")
+    parser.add_argument("--dest", default=os.getenv("MODEL_DIR"), help="Target directory (default: $MODEL_DIR)")
+    parser.add_argument("--jobs", type=int, default=8, help="Parallel file downloads")
+    parser.add_argument("--check", action="store_true", help="Only verify the manifest of an already staged model")
+    parser.add_argument("--deep", action="store_true", help="With --check, re-hash every file")
+    parser.add_argument("--force", action="store_true", help="Re-stage even if the manifest check passes")
+    parser.add_argument("--no-convert", action="store_true", help="Keep .bin/.pt weights as they are")
+    parser.add_argument("--keep-original", action="store_true", help="Keep pickle weights after conversion")
+    parser.add_argument("--all-files", action="store_true", help="Also fetch TF/Flax/ONNX and duplicate weights")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.dest:
+        print("✗ --dest (or MODEL_DIR) is required", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    problems = check_manifest(args.dest, deep=args.deep)
+    if args.check:
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        if problems:
+            for problem in problems:
+                print(f"✗ {problem}")
+            return 1
+        print(f"✓ {args.dest} matches its manifest ({elapsed_ms:.1f} ms)")
+        return 0
+    if not problems and not args.force:
+        print(f"✓ {args.dest} already staged (manifest verified)")
+        return 0
+
+    if args.mirror:
+        source = MirrorSource(args.mirror)
+    elif args.repo:
+        source = HubSource(args.repo, args.revision, token=os.getenv("HF_TOKEN"))
+    else:
+        print("✗ Either --repo (MODEL_REPO) or --mirror (MODEL_MIRROR) is required", file=sys.stderr)
+        return 2
+    try:
+        manifest = stage(
+            source,
+            args.dest,
+            jobs=args.jobs,
+            convert=not args.no_convert,
+            keep_original=args.keep_original,
+            all_files=args.all_files,
+        )
+    except (StageError, OSError, error.URLError) as exc:
+        print(f"✗ Staging failed: {exc} (re-run to resume)", file=sys.stderr)
+        return 1
+    print(f"✓ Staged {len(manifest['files'])} files into {args.dest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+Least-outstanding-requests gateway across several vLLM OpenAI-compatible servers.
+
+The standalone servers started by ``06_launch_vllm_single_node.sh`` and
+``07_launch_vllm_ray.sh`` on several nodes each have their own URL. This
+helper holds a pool of them and sends each request to the best one:
+
+- balancing: the healthy backend with the fewest outstanding requests
+  (``--balance requests``) or estimated outstanding tokens, i.e. prompt plus
+  ``max_tokens`` (``--balance tokens``); ties rotate
+- health: ``/health`` and ``/v1/models`` are probed every
+  ``--health-interval-s``; a failed probe ejects the backend
+- ejection: ``--failure-threshold`` consecutive request failures (connection
+  errors, timeouts, 5xx) also eject it. An ejected backend is probed again
+  after ``--eject-s`` (doubling per repeated ejection, up to
+  ``--max-eject-s``) and reinstated once its probe passes. Requests that fail
+  on one backend are retried on another
+- hedging: with ``--hedge-after-ms``, a non-streaming request that has not
+  answered by then is also sent to a second backend; the first answer wins
+  and the other request is cancelled
+
+Use ``EndpointPool`` as a client library from asyncio code, or run the
+gateway, which serves ``/v1/*`` (including ``"stream": true``), ``/health``
+(200 while any backend is usable) and ``GET /gateway/backends`` (per-backend
+state and counters), and point ``VLLM_BASE_URL`` and the ``08*`` scripts at it.
+
+Usage:
+    python scripts/helpers/vllm_gateway.py --backends http://node1:8000,http://node2:8000 --port 8080
+    python scripts/helpers/vllm_gateway.py --balance tokens --hedge-after-ms 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+HELPERS_DIR = os.path.dirname(os.path.abspath(__file__))
+if HELPERS_DIR not in sys.path:
+    sys.path.insert(0, HELPERS_DIR)
+
+from load_generator import AsyncHTTPClient, vllm_base_url  # noqa: E402
+
+BALANCE_MODES = ("requests", "tokens")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    411: "Length Required",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class NoBackendAvailable(RuntimeError):
+    """Every backend is ejected, unhealthy or already tried for this request."""
+
+
+class ClientDisconnected(RuntimeError):
+    """The gateway's client went away while a streamed response was relayed."""
+
+
+class BackendError(RuntimeError):
+    """A request to one backend failed without an HTTP response."""
+
+    def __init__(self, url, error):
+        super().__init__(f"{url}: {type(error).__name__}: {error}")
+        self.url = url
+
+
+def estimate_tokens(payload):
+    """Rough token cost of an OpenAI request: prompt characters / 4 plus ``max_tokens``."""
+    if not isinstance(payload, dict):
+        return 1
+    prompt = payload.get("prompt")
+    if isinstance(payload.get("messages"), list):
+        prompt = " ".join(str(message.get("content", "")) for message in payload["messages"] if isinstance(message, dict))
+    elif isinstance(prompt, list):
+        prompt = "".join(str(part) for part in prompt)
+    prompt_tokens = len(prompt) // 4 if isinstance(prompt, str) else 0
+    try:
+        max_tokens = int(payload.get("max_tokens") or 16)
+    except (TypeError, ValueError):
+        max_tokens = 16
+    return max(1, prompt_tokens + max_tokens) * max(1, int(payload.get("n") or 1))
+
+
+class Backend:
+    """One vLLM server: its load, health and counters."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.outstanding_tokens = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.latency_ewma_s = None
+        self.models = []
+        self.last_error = None
+
+    def usable(self, now):
+        return self.healthy and now >= self.ejected_until
+
+    def stats(self, now):
+        return {
+            "url": self.url,
+            "state": "healthy" if self.usable(now) else "ejected",
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 3),
+            "ejections": self.ejections,
+            "outstanding": self.outstanding,
+            "outstanding_tokens": self.outstanding_tokens,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "latency_ewma_ms": None if self.latency_ewma_s is None else round(self.latency_ewma_s * 1000.0, 1),
+            "models": self.models,
+            "last_error": self.last_error,
+        }
+
+
+class EndpointPool:
+    """
+    Route OpenAI API requests over several vLLM base URLs.
+
+    Use it on one event loop: ``await start()`` (or ``async with``) runs the
+    first health check and the periodic probe task, ``request()`` sends a
+    request to the least-loaded usable backend and ``stats()`` reports every
+    backend.
+    """
+
+    def __init__(
+        self,
+        urls,
+        balance="requests",
+        hedge_after_s=None,
+        health_interval_s=5.0,
+        health_timeout_s=2.0,
+        failure_threshold=3,
+        eject_s=10.0,
+        max_eject_s=300.0,
+        request_timeout_s=600.0,
+    ):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one backend URL")
+        if balance not in BALANCE_MODES:
+            raise ValueError(f"balance must be one of {BALANCE_MODES}, got {balance!r}")
+        self.backends = [Backend(url) for url in urls]
+        self.balance = balance
+        self.hedge_after_s = hedge_after_s
+        self.health_interval_s = health_interval_s
+        self.health_timeout_s = health_timeout_s
+        self.failure_threshold = max(1, failure_threshold)
+        self.eject_s = eject_s
+        self.max_eject_s = max(eject_s, max_eject_s)
+        self.request_timeout_s = request_timeout_s
+        self.client = AsyncHTTPClient()
+        self.hedged = 0
+        self.retried = 0
+        self._turn = 0
+        self._health_task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        await self.check_health()
+        if self.health_interval_s and self.health_interval_s > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        self.client.close()
+
+    # ------------------------------------------------------------------ #
+    # Health and ejection
+    # ------------------------------------------------------------------ #
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            await self.check_health()
+
+    async def check_health(self):
+        """Probe every backend that is not waiting out an ejection."""
+        now = time.monotonic()
+        await asyncio.gather(*(self._probe(backend) for backend in self.backends if now >= backend.ejected_until))
+
+    async def _probe(self, backend):
+        # Probes use their own connections so they never queue behind requests.
+        client = AsyncHTTPClient()
+        try:
+            status, _, _ = await asyncio.wait_for(
+                client.request("GET", f"{backend.url}/health"), self.health_timeout_s
+            )
+            if status != 200:
+                raise RuntimeError(f"/health returned HTTP {status}")
+            status, _, body = await asyncio.wait_for(
+                client.request("GET", f"{backend.url}/v1/models"), self.health_timeout_s
+            )
+            models = [model.get("id") for model in json.loads(body).get("data") or []] if status == 200 else []
+            if not models:
+                raise RuntimeError(f"/v1/models returned HTTP {status} and no models")
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, RuntimeError) as exc:
+            self._eject(backend, f"health check: {type(exc).__name__}: {exc}")
+            return
+        finally:
+            client.close()
+        backend.models = models
+        if not backend.healthy:
+            backend.healthy = True
+            backend.consecutive_failures = 0
+            print(f"[gateway] Reinstated {backend.url}", flush=True)
+
+    def _eject(self, backend, reason):
+        backend.last_error = reason
+        backend.ejections += 1
+        backend.consecutive_failures = 0
+        backend.ejected_until = time.monotonic() + min(
+            self.eject_s * 2 ** (backend.ejections - 1), self.max_eject_s
+        )
+        if backend.healthy:
+            print(f"[gateway] Ejected {backend.url} ({reason})", flush=True)
+        backend.healthy = False
+
+    def _record_failure(self, backend, reason):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        backend.last_error = reason
+        if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+            self._eject(backend, reason)
+
+    def _record_success(self, backend, elapsed_s):
+        backend.consecutive_failures = 0
+        backend.ejections = 0
+        backend.latency_ewma_s = (
+            elapsed_s if backend.latency_ewma_s is None else 0.8 * backend.latency_ewma_s + 0.2 * elapsed_s
+        )
+
+    # ------------------------------------------------------------------ #
+    # Routing
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _release(backend, cost):
+        backend.outstanding -= 1
+        backend.outstanding_tokens -= cost
+
+    def pick(self, exclude=()):
+        """The usable backend with the least outstanding work, ties in rotation."""
+        now = time.monotonic()
+        candidates = [backend for backend in self.backends if backend.usable(now) and backend not in exclude]
+        if not candidates:
+            raise NoBackendAvailable(
+                "no usable vLLM backend"
+                + (f" (tried {', '.join(backend.url for backend in exclude)})" if exclude else "")
+            )
+        if self.balance == "tokens":
+            load = lambda backend: (backend.outstanding_tokens, backend.outstanding)  # noqa: E731
+        else:
+            load = lambda backend: (backend.outstanding, backend.outstanding_tokens)  # noqa: E731
+        lowest = min(load(backend) for backend in candidates)
+        tied = [backend for backend in candidates if load(backend) == lowest]
+        self._turn += 1
+        return tied[self._turn % len(tied)]
+
+    async def _send(self, backend, method, path, payload, headers, on_line, on_head):
+        started = time.monotonic()
+        try:
+            status, response_headers, body = await asyncio.wait_for(
+                self.client.request(
+                    method, backend.url + path, payload=payload, headers=headers, on_line=on_line, on_head=on_head
+                ),
+                self.request_timeout_s,
+            )
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as exc:
+            self._record_failure(backend, f"{type(exc).__name__}: {exc}")
+            raise BackendError(backend.url, exc) from exc
+        if status >= 500:
+            self._record_failure(backend, f"HTTP {status}")
+        else:
+            self._record_success(backend, time.monotonic() - started)
+        return status, response_headers, body
+
+    async def request(self, method, path, payload=None, headers=None, on_line=None, on_head=None):
+        """
+        Send one request and return ``(status, headers, body, backend_url)``.
+
+        Connection failures, timeouts and 5xx answers are retried once on
+        every other usable backend; the last 5xx is returned if all fail.
+        With ``on_line`` (streaming) the request is neither hedged nor retried
+        once the response has started, since its lines are already forwarded.
+        """
+        cost = estimate_tokens(payload)
+        streaming = on_line is not None
+        started = {"head": False}
+
+        def head(status, response_headers):
+            started["head"] = True
+            if on_head is not None:
+                on_head(status, response_headers)
+
+        tried = []
+        hedge = []
+        tasks = {}
+        last_error = None
+        last_response = None
+        hedge_pending = self.hedge_after_s is not None and not streaming
+
+        def launch():
+            backend = self.pick(exclude=tried)
+            tried.append(backend)
+            # Count the request as outstanding from the moment it is routed, so
+            # requests picked before this task first runs already see it.
+            backend.outstanding += 1
+            backend.outstanding_tokens += cost
+            backend.requests += 1
+            task = asyncio.ensure_future(
+                self._send(backend, method, path, payload, headers, on_line, head if streaming else on_head)
+            )
+            task.add_done_callback(lambda _: self._release(backend, cost))
+            tasks[task] = backend
+            return backend
+
+        launch()
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=self.hedge_after_s if hedge_pending else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # The first backend is slow: race it against another one.
+                    hedge_pending = False
+                    try:
+                        hedge.append(launch())
+                        hedge[0].hedges += 1
+                        self.hedged += 1
+                    except NoBackendAvailable:
+                        pass
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    try:
+                        status, response_headers, body = task.result()
+                    except BackendError as exc:
+                        last_error = exc
+                        continue
+                    if status >= 500 and not (streaming and started["head"]):
+                        last_response = (status, response_headers, body, backend.url)
+                        continue
+                    if backend in hedge:
+                        backend.hedges_won += 1
+                    return status, response_headers, body, backend.url
+                if not tasks and not (streaming and started["head"]):
+                    try:
+                        launch()
+                        self.retried += 1
+                    except NoBackendAvailable:
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if last_response is not None:
+            return last_response
+        if last_error is not None:
+            raise last_error
+        raise NoBackendAvailable("no usable vLLM backend")
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "balance": self.balance,
+            "hedge_after_ms": None if self.hedge_after_s is None else self.hedge_after_s * 1000.0,
+            "usable": sum(1 for backend in self.backends if backend.usable(now)),
+            "hedged": self.hedged,
+            "retried": self.retried,
+            "backends": [backend.stats(now) for backend in self.backends],
+        }
+
+
+class GatewayServer:
+    """
+    Minimal asyncio HTTP/1.1 front end for an ``EndpointPool``.
+
+    Like ``MockVLLMServer``, use ``serve_forever()`` from the command line or
+    ``start()``/``stop()`` to run it on a background thread (``port=0`` picks a
+    free port). The pool is built from ``pool_options`` on the server's loop.
+    """
+
+    def __init__(self, urls, host="127.0.0.1", port=8080, **pool_options):
+        self.urls = urls
+        self.host = host
+        self.port = port
+        self.pool_options = pool_options
+        self.pool = None
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._connections = set()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ------------------------------------------------------------------ #
+    # Lifecycle
+    # ------------------------------------------------------------------ #
+    async def _start_server(self):
+        self.pool = EndpointPool(self.urls, **self.pool_options)
+        await self.pool.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def serve_forever(self):
+        async def run():
+            await self._start_server()
+            usable = self.pool.stats()["usable"]
+            print(f"✓ vLLM gateway on {self.base_url}: {usable}/{len(self.urls)} backends usable", flush=True)
+            try:
+                async with self._server:
+                    await self._server.serve_forever()
+            finally:
+                await self.pool.close()
+
+        asyncio.run(run())
+
+    def start(self):
+        """Run the gateway on a daemon thread and return once it is listening."""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start_server())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="vllm-gateway", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=30)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            await self.pool.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        self._loop = None
+
+    # ------------------------------------------------------------------ #
+    # HTTP plumbing
+    # ------------------------------------------------------------------ #
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._send_json(writer, 411, _error("chunked request bodies are not supported"))
+                    break
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                await self._dispatch(writer, method.upper(), target, headers, body)
+                keep_alive = version.strip().upper() == "HTTP/1.1"
+                if headers.get("connection", "").lower() == "close" or not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _send(self, writer, status, body, content_type="application/json"):
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload):
+        await self._send(writer, status, json.dumps(payload).encode("utf-8"))
+
+    async def _dispatch(self, writer, method, target, headers, body):
+        path = target.split("?", 1)[0]
+        if path == "/health":
+            await self._send_json(writer, 200 if self.pool.stats()["usable"] else 503, {})
+            return
+        if path == "/gateway/backends":
+            await self._send_json(writer, 200, self.pool.stats())
+            return
+        if not path.startswith("/v1/"):
+            await self._send_json(writer, 404, _error(f"Unknown path: {path}", "NotFoundError"))
+            return
+
+        payload = None
+        if body:
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError:
+                await self._send_json(writer, 400, _error("Request body is not valid JSON"))
+                return
+        forward = {name: headers[name] for name in ("authorization",) if name in headers}
+        try:
+            if isinstance(payload, dict) and payload.get("stream"):
+                await self._proxy_stream(writer, method, target, payload, forward)
+                return
+            status, response_headers, response_body, _ = await self.pool.request(
+                method, target, payload=payload, headers=forward
+            )
+        except (NoBackendAvailable, BackendError) as exc:
+            await self._send_json(writer, 503 if isinstance(exc, NoBackendAvailable) else 502, _error(str(exc)))
+            return
+        await self._send(
+            writer, status, response_body, response_headers.get("content-type", "application/json")
+        )
+
+    async def _proxy_stream(self, writer, method, target, payload, forward):
+        """
+        Relay a streamed response line by line as it arrives.
+
+        Each line is drained to the client before the next one is read from
+        the backend, so a slow client slows the backend read instead of
+        growing the buffer. If the backend fails after the head was sent, the
+        connection is dropped without the final chunk, so the client sees a
+        truncated stream instead of a clean end.
+        """
+        started = []
+
+        def on_head(status, response_headers):
+            started.append(status)
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+                f"Content-Type: {response_headers.get('content-type', 'text/event-stream')}\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Transfer-Encoding: chunked\r\n\r\n".encode("latin-1")
+            )
+
+        async def on_line(line):
+            data = line + b"\n"
+            try:
+                writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                await writer.drain()
+            except ConnectionError as exc:
+                # Not a backend failure: it must not count against the backend.
+                raise ClientDisconnected(str(exc)) from exc
+
+        try:
+            await self.pool.request(method, target, payload=payload, headers=forward, on_line=on_line, on_head=on_head)
+        except ClientDisconnected as exc:
+            raise ConnectionAbortedError(str(exc)) from exc
+        except (NoBackendAvailable, BackendError) as exc:
+            if started:
+                raise ConnectionAbortedError(f"backend failed mid-stream: {exc}") from exc
+            await self._send_json(writer, 503 if isinstance(exc, NoBackendAvailable) else 502, _error(str(exc)))
+            return
+        if started:
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+
+def _error(message, error_type="BadGatewayError"):
+    return {"object": "error", "message": message, "type": error_type, "code": None}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--backends",
+        default=os.getenv("VLLM_BACKENDS") or vllm_base_url(),
+        help="Comma-separated vLLM base URLs (default: VLLM_BACKENDS, else the local vLLM URL)",
+    )
+    parser.add_argument("--host", default=os.getenv("VLLM_GATEWAY_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("VLLM_GATEWAY_PORT", "8080")))
+    parser.add_argument("--balance", choices=BALANCE_MODES, default="requests",
+                        help="Least outstanding requests, or least outstanding estimated tokens")
+    parser.add_argument("--hedge-after-ms", type=float, default=None,
+                        help="Also send a non-streaming request to a second backend after this long")
+    parser.add_argument("--health-interval-s", type=float, default=5.0)
+    parser.add_argument("--health-timeout-s", type=float, default=2.0)
+    parser.add_argument("--failure-threshold", type=int, default=3,
+                        help="Consecutive request failures that eject a backend")
+    parser.add_argument("--eject-s", type=float, default=10.0, help="First ejection period; doubles per repeat")
+    parser.add_argument("--max-eject-s", type=float, default=300.0)
+    parser.add_argument("--request-timeout-s", type=float, default=600.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    urls = [url.strip() for url in args.backends.split(",") if url.strip()]
+    server = GatewayServer(
+        urls,
+        host=args.host,
+        port=args.port,
+        balance=args.balance,
+        hedge_after_s=None if args.hedge_after_ms is None else args.hedge_after_ms / 1000.0,
+        health_interval_s=args.health_interval_s,
+        health_timeout_s=args.health_timeout_s,
+        failure_threshold=args.failure_threshold,
+        eject_s=args.eject_s,
+        max_eject_s=args.max_eject_s,
+        request_timeout_s=args.request_timeout_s,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
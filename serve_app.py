@@ -5,57 +5,1909 @@ This provides a basic HTTP service to demonstrate Ray Serve functionality.
 Can be deployed using: serve deploy serve_app.py
 """
 
+import asyncio
+import base64
+import bisect
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import gc
+import hashlib
+import importlib.util
+import json
+import math
 import os
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
 from ray import serve
-try:
-    from vllm import LLM
-    from vllm import SamplingParams
-    VLLM_AVAILABLE = True
-except ImportError:
-    VLLM_AVAILABLE = False
-
-
-@serve.deployment(
-    name="echo_service",
-    num_replicas=1
-)
+from ray.serve import metrics
+from ray.serve.config import RequestRouterConfig
+from ray.serve.exceptions import BackPressureError
+from ray.serve.request_router import FIFOMixin, RequestRouter
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+# vLLM is imported inside TinyLlamaService only: importing it here would make
+# deploy_serve.py and every echo/calculator replica pay its multi-second
+# import (torch, CUDA) for nothing. find_spec checks it is installed cheaply.
+VLLM_AVAILABLE = importlib.util.find_spec("vllm") is not None
+
+# SERVE_LLM_STUB=1 swaps vLLM for the CPU-only engine in stub_engine.py so the
+# LLM deployment (and its concurrency) can be exercised without a GPU.
+USE_STUB_ENGINE = os.getenv("SERVE_LLM_STUB", "0") == "1"
+
+# SERVE_LLM_ENGINE selects how TinyLlamaService drives the model:
+# - "async": AsyncLLMEngine, requests are continuously batched by vLLM.
+# - "sync": blocking LLM.generate, fed by a Serve micro-batching layer that
+#   gathers concurrent requests into one generate() call over a prompt list.
+LLM_ENGINE_MODE = os.getenv("SERVE_LLM_ENGINE", "async").lower()
+
+# Default scaling settings per deployment. The cheap CPU services autoscale on
+# ongoing requests; the GPU-backed tinyllama deployment defaults to a single
+# replica (raise SERVE_TINYLLAMA_MAX_REPLICAS to add GPU replicas as its queue
+# grows). See load_deployment_settings() for how to override them.
+DEPLOYMENT_DEFAULTS = {
+    "ingress": {
+        "min_replicas": 1, "max_replicas": 4, "target_ongoing_requests": 32,
+        "upscale_delay_s": 10.0, "downscale_delay_s": 300.0, "max_ongoing_requests": 128,
+    },
+    "echo_service": {
+        "min_replicas": 1, "max_replicas": 8, "target_ongoing_requests": 8,
+        "upscale_delay_s": 10.0, "downscale_delay_s": 300.0, "max_ongoing_requests": 32,
+    },
+    "calculator": {
+        "min_replicas": 1, "max_replicas": 8, "target_ongoing_requests": 8,
+        "upscale_delay_s": 10.0, "downscale_delay_s": 300.0, "max_ongoing_requests": 32,
+    },
+    # tinyllama accepts many more requests than it runs: its admission
+    # controller decides what runs and rejects the excess with 429/503, and
+    # max_queued_requests bounds what waits in front of the replicas.
+    "tinyllama": {
+        "min_replicas": 1, "max_replicas": 1, "target_ongoing_requests": 16,
+        "upscale_delay_s": 30.0, "downscale_delay_s": 600.0, "max_ongoing_requests": 256,
+        "max_queued_requests": 128,
+    },
+}
+_INT_SETTINGS = ("min_replicas", "max_replicas", "max_ongoing_requests", "max_queued_requests")
+_SETTING_NAMES = frozenset(key for values in DEPLOYMENT_DEFAULTS.values() for key in values)
+
+
+def load_deployment_settings():
+    """
+    Resolve scaling settings for every deployment.
+    
+    Precedence (lowest to highest): ``DEPLOYMENT_DEFAULTS``, the JSON/YAML file
+    named by ``SERVE_DEPLOYMENT_CONFIG`` (a mapping of deployment name to
+    settings), then ``SERVE_<DEPLOYMENT>_<SETTING>`` environment variables,
+    e.g. ``SERVE_ECHO_SERVICE_MAX_REPLICAS=16``. Unknown deployment or setting
+    names and unparsable values raise ``ValueError``.
+    """
+    settings = {name: dict(values) for name, values in DEPLOYMENT_DEFAULTS.items()}
+    
+    config_path = os.getenv("SERVE_DEPLOYMENT_CONFIG")
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as f:
+            if config_path.endswith((".yaml", ".yml")):
+                import yaml
+                overrides = yaml.safe_load(f) or {}
+            else:
+                overrides = json.load(f)
+        for name, values in overrides.items():
+            if name not in settings:
+                raise ValueError(f"Unknown deployment '{name}' in {config_path}")
+            unknown = sorted(set(values) - _SETTING_NAMES)
+            if unknown:
+                raise ValueError(f"Unknown setting(s) {', '.join(unknown)} for '{name}' in {config_path}")
+            settings[name].update(values)
+    
+    for name, values in settings.items():
+        for key in list(values):
+            env_name = f"SERVE_{name.upper()}_{key.upper()}"
+            env_value = os.getenv(env_name)
+            if env_value is not None:
+                try:
+                    values[key] = int(env_value) if key in _INT_SETTINGS else float(env_value)
+                except ValueError:
+                    kind = "an integer" if key in _INT_SETTINGS else "a number"
+                    raise ValueError(f"{env_name} must be {kind}, got {env_value!r}") from None
+        if values["min_replicas"] > values["max_replicas"]:
+            raise ValueError(f"{name}: min_replicas must not exceed max_replicas")
+    return settings
+
+
+def deployment_options(name, settings):
+    """Translate resolved settings into ``Deployment.options()`` kwargs."""
+    values = settings[name]
+    options = {"max_ongoing_requests": values["max_ongoing_requests"]}
+    if "max_queued_requests" in values:
+        options["max_queued_requests"] = values["max_queued_requests"]
+    if values["min_replicas"] == values["max_replicas"]:
+        options["num_replicas"] = values["min_replicas"]
+    else:
+        options["autoscaling_config"] = {
+            "min_replicas": values["min_replicas"],
+            "max_replicas": values["max_replicas"],
+            "target_ongoing_requests": values["target_ongoing_requests"],
+            "upscale_delay_s": values["upscale_delay_s"],
+            "downscale_delay_s": values["downscale_delay_s"],
+        }
+    return options
+
+
+@dataclass
+class ServeRequest:
+    """
+    An HTTP request decoded once by ``Ingress``.
+    
+    Services receive this small picklable object over their handles instead of
+    the raw Starlette request, so the body is parsed exactly once per call.
+    """
+    path: str
+    method: str = "GET"
+    data: Dict[str, Any] = field(default_factory=dict)
+    # Propagation context of a sampled request (RequestTrace.context()).
+    trace: Optional[Dict[str, Any]] = None
+    # Undecoded request body, for the raw echo routes (/echo/raw, /echo/stream).
+    body: Optional[bytes] = None
+
+
+def parse_json_object(body):
+    """Decode a JSON request body; anything but a JSON object becomes ``{}``."""
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+# Compiled chat templates keyed by model path, shared by all replicas that run
+# in the same worker process.
+_CHAT_TEMPLATES: Dict[str, Any] = {}
+
+
+def _special_token_text(token):
+    """tokenizer_config.json stores special tokens as strings or AddedToken dicts."""
+    if isinstance(token, dict):
+        return token.get("content", "")
+    return token or ""
+
+
+def _raise_template_error(message):
+    raise ValueError(f"Chat template error: {message}")
+
+
+def _render_chat(template, messages, bos_token, eos_token):
+    prompt = template.render(
+        messages=messages, bos_token=bos_token, eos_token=eos_token, add_generation_prompt=True
+    )
+    if bos_token and prompt.startswith(bos_token):
+        prompt = prompt[len(bos_token):]
+    return prompt
+
+
+def load_chat_template(model_path):
+    """
+    Compile the model's chat template once and cache it per model path.
+    
+    Reads ``chat_template`` and the BOS/EOS tokens from the model's
+    ``tokenizer_config.json`` and returns a callable ``render(messages=...)``
+    that produces the prompt with the generation prompt appended. A leading
+    BOS token that the template emits is stripped, because vLLM adds BOS
+    again when it tokenizes a text prompt. Returns
+    ``None`` when the model ships no template (or jinja2 is missing), in which
+    case callers fall back to the plain "Role: content" format.
+    """
+    if model_path in _CHAT_TEMPLATES:
+        return _CHAT_TEMPLATES[model_path]
+    
+    render = None
+    config_path = os.path.join(model_path, "tokenizer_config.json")
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        source = config.get("chat_template")
+        if isinstance(source, list):
+            # Newer configs may ship several named templates.
+            source = next((t.get("template") for t in source if t.get("name") == "default"), None)
+        if source:
+            from jinja2.sandbox import ImmutableSandboxedEnvironment
+            
+            env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+            env.globals["raise_exception"] = _raise_template_error
+            render = functools.partial(
+                _render_chat,
+                env.from_string(source),
+                bos_token=_special_token_text(config.get("bos_token")),
+                eos_token=_special_token_text(config.get("eos_token")),
+            )
+    except (OSError, ValueError, ImportError) as e:
+        print(f"No usable chat template in {config_path}: {e}")
+    
+    _CHAT_TEMPLATES[model_path] = render
+    return render
+
+
+def messages_to_prompt(messages, chat_template):
+    """
+    Convert OpenAI messages format to prompt string.
+    
+    Uses the model's own chat template when it ships one, so the rendered
+    prompt for a conversation is a stable prefix of the prompt for its next
+    turn and prefix caching can reuse its KV blocks.
+    """
+    if chat_template is not None:
+        return chat_template(messages=messages)
+    
+    prompt_parts = []
+    for msg in messages:
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        if role == "system":
+            prompt_parts.append(f"System: {content}")
+        elif role == "user":
+            prompt_parts.append(f"User: {content}")
+        elif role == "assistant":
+            prompt_parts.append(f"Assistant: {content}")
+    return "\n".join(prompt_parts)
+
+
+# Histogram buckets (milliseconds) shared by every serve_app latency metric.
+LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+# Model loads take seconds to minutes.
+MODEL_LOAD_BUCKETS_MS = [10, 100, 1000, 5000, 10000, 30000, 60000, 120000, 300000, 600000]
+
+
+class RequestOutcome:
+    """Outcome of one tracked request; see ``ServiceMetrics.track()``."""
+    
+    __slots__ = ("error_type",)
+    
+    def __init__(self):
+        self.error_type = None
+    
+    def check(self, result):
+        """Classify an ``{"error": ...}`` response as failed and return it unchanged."""
+        if self.error_type is None and isinstance(result, dict) and "error" in result:
+            self.error_type = result.get("error_type") or "bad_request"
+        return result
+
+
+class ServiceMetrics:
+    """
+    Application metrics for one deployment, exported through ``ray.serve.metrics``.
+    
+    Ray tags every series with the deployment, replica and application and
+    exposes them from each node's metrics agent, so the Prometheus service
+    discovery set up by ``05a_configure_monitoring.sh`` scrapes them together
+    with Ray's built-in metrics (as ``ray_serve_app_*``).
+    """
+    
+    def __init__(self):
+        self.requests = metrics.Counter(
+            "serve_app_requests",
+            description="Requests handled, by route and status (ok or error).",
+            tag_keys=("route", "status"),
+        )
+        self.errors = metrics.Counter(
+            "serve_app_errors",
+            description="Failed requests, by route and error type.",
+            tag_keys=("route", "error_type"),
+        )
+        self.latency = metrics.Histogram(
+            "serve_app_request_latency_ms",
+            description="End-to-end request latency inside this deployment.",
+            boundaries=LATENCY_BUCKETS_MS,
+            tag_keys=("route",),
+        )
+        self.in_flight = metrics.Gauge(
+            "serve_app_requests_in_flight",
+            description="Requests currently being handled by this replica.",
+            tag_keys=("route",),
+        )
+        self._in_flight = {}
+    
+    @contextlib.contextmanager
+    def track(self, route):
+        """
+        Count, time and track one request to ``route``.
+        
+        Yields a ``RequestOutcome``; the request is recorded as an error when
+        its ``error_type`` is set (directly, via ``check()``, or by an exception
+        escaping the block).
+        """
+        outcome = RequestOutcome()
+        self._set_in_flight(route, 1)
+        started = time.perf_counter()
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome.error_type = outcome.error_type or type(e).__name__
+            raise
+        finally:
+            self._set_in_flight(route, -1)
+            self.latency.observe((time.perf_counter() - started) * 1000.0, tags={"route": route})
+            status = "error" if outcome.error_type else "ok"
+            self.requests.inc(tags={"route": route, "status": status})
+            if outcome.error_type:
+                self.errors.inc(tags={"route": route, "error_type": outcome.error_type})
+    
+    def _set_in_flight(self, route, delta):
+        count = self._in_flight.get(route, 0) + delta
+        self._in_flight[route] = count
+        self.in_flight.set(count, tags={"route": route})
+
+
+class LLMMetrics(ServiceMetrics):
+    """``ServiceMetrics`` plus token counters and generation timings."""
+    
+    def __init__(self):
+        super().__init__()
+        self.prompt_tokens = metrics.Counter(
+            "serve_app_llm_prompt_tokens",
+            description="Prompt tokens processed by the engine.",
+            tag_keys=("route",),
+        )
+        self.completion_tokens = metrics.Counter(
+            "serve_app_llm_completion_tokens",
+            description="Tokens generated by the engine.",
+            tag_keys=("route",),
+        )
+        self.cached_prompt_tokens = metrics.Counter(
+            "serve_app_llm_cached_prompt_tokens",
+            description="Prompt tokens served from the prefix (KV) cache instead of prefill.",
+            tag_keys=("route",),
+        )
+        self.ttft = metrics.Histogram(
+            "serve_app_llm_ttft_ms",
+            description="Time from request arrival to the first generated token.",
+            boundaries=LATENCY_BUCKETS_MS,
+            tag_keys=("route",),
+        )
+        self.generation_time = metrics.Histogram(
+            "serve_app_llm_generation_ms",
+            description="Time from request arrival to the last generated token.",
+            boundaries=LATENCY_BUCKETS_MS,
+            tag_keys=("route",),
+        )
+        self.model_load_time = metrics.Histogram(
+            "serve_app_llm_model_load_ms",
+            description="Time to load a registry model onto this replica.",
+            boundaries=MODEL_LOAD_BUCKETS_MS,
+            tag_keys=("model",),
+        )
+        self.model_eviction_time = metrics.Histogram(
+            "serve_app_llm_model_eviction_ms",
+            description="Time to unload an evicted registry model.",
+            boundaries=MODEL_LOAD_BUCKETS_MS,
+            tag_keys=("model",),
+        )
+        self.models_loaded = metrics.Gauge(
+            "serve_app_llm_models_loaded",
+            description="Registry models resident on this replica.",
+        )
+        self.startup_phase = metrics.Gauge(
+            "serve_app_llm_startup_phase_ms",
+            description="Replica cold-start time by phase (import, weight_load, engine_init, warmup).",
+            tag_keys=("phase",),
+        )
+        self.admission_queue_depth = metrics.Gauge(
+            "serve_app_llm_admission_queue_depth",
+            description="Requests waiting for token budget on this replica.",
+        )
+        self.tokens_in_flight = metrics.Gauge(
+            "serve_app_llm_tokens_in_flight",
+            description="Admitted token budget (estimated prompt tokens + max_tokens) in use.",
+        )
+        self.admission_wait = metrics.Histogram(
+            "serve_app_llm_admission_wait_ms",
+            description="Time admitted requests spent queued for token budget.",
+            boundaries=LATENCY_BUCKETS_MS,
+        )
+        self.rejections = metrics.Counter(
+            "serve_app_llm_rejections",
+            description="Requests turned away by admission control, by reason.",
+            tag_keys=("reason",),
+        )
+        self.prompt_token_total = 0
+        self.cached_prompt_token_total = 0
+    
+    def observe_generation(self, route, started, first_token_at, finished_at, usage):
+        """Record one finished generation (``perf_counter`` timestamps)."""
+        tags = {"route": route}
+        if first_token_at is not None:
+            self.ttft.observe((first_token_at - started) * 1000.0, tags=tags)
+        self.generation_time.observe((finished_at - started) * 1000.0, tags=tags)
+        if usage:
+            self.prompt_tokens.inc(usage["prompt_tokens"], tags=tags)
+            if usage["completion_tokens"]:
+                self.completion_tokens.inc(usage["completion_tokens"], tags=tags)
+            cached = usage.get("cached_prompt_tokens") or 0
+            if cached:
+                self.cached_prompt_tokens.inc(cached, tags=tags)
+            self.prompt_token_total += usage["prompt_tokens"]
+            self.cached_prompt_token_total += cached
+    
+    def prefix_cache_stats(self):
+        """Share of prompt tokens this replica served from its prefix cache."""
+        total = self.prompt_token_total
+        return {
+            "prompt_tokens": total,
+            "cached_prompt_tokens": self.cached_prompt_token_total,
+            "hit_rate": round(self.cached_prompt_token_total / total, 4) if total else None,
+        }
+    
+    def observe_startup(self, phases_ms):
+        for phase, elapsed_ms in phases_ms.items():
+            self.startup_phase.set(elapsed_ms, tags={"phase": phase})
+    
+    def observe_model_load(self, model_id, elapsed_ms, loaded):
+        self.model_load_time.observe(elapsed_ms, tags={"model": model_id})
+        self.models_loaded.set(loaded)
+    
+    def observe_model_eviction(self, model_id, elapsed_ms, loaded):
+        self.model_eviction_time.observe(elapsed_ms, tags={"model": model_id})
+        self.models_loaded.set(loaded)
+    
+    def observe_admission(self, queue_depth, tokens_in_flight):
+        self.admission_queue_depth.set(queue_depth)
+        self.tokens_in_flight.set(tokens_in_flight)
+    
+    def observe_rejection(self, reason):
+        self.rejections.inc(tags={"reason": reason})
+
+
+class IngressMetrics(ServiceMetrics):
+    """``ServiceMetrics`` plus per-tenant fair-share series for the /llm path."""
+    
+    def __init__(self):
+        super().__init__()
+        self.tenant_requests = metrics.Counter(
+            "serve_app_tenant_requests",
+            description="/llm requests completed, by tenant and priority class.",
+            tag_keys=("tenant", "priority"),
+        )
+        self.tenant_latency = metrics.Histogram(
+            "serve_app_tenant_latency_ms",
+            description="/llm latency per tenant, including fair-share queueing.",
+            boundaries=LATENCY_BUCKETS_MS,
+            tag_keys=("tenant", "priority"),
+        )
+        self.tenant_queue_wait = metrics.Histogram(
+            "serve_app_tenant_queue_wait_ms",
+            description="Time /llm requests waited in the ingress fair-share queue.",
+            boundaries=LATENCY_BUCKETS_MS,
+            tag_keys=("tenant", "priority"),
+        )
+        self.tenant_tokens = metrics.Counter(
+            "serve_app_tenant_completion_tokens",
+            description="Tokens generated for each tenant.",
+            tag_keys=("tenant", "priority"),
+        )
+        self.tenant_rejections = metrics.Counter(
+            "serve_app_tenant_rejections",
+            description="/llm requests turned away by the fair-share queue, by reason.",
+            tag_keys=("tenant", "priority", "reason"),
+        )
+        self.fair_share_queue_depth = metrics.Gauge(
+            "serve_app_fair_share_queue_depth",
+            description="Requests waiting in the ingress fair-share queue, by priority class.",
+            tag_keys=("priority",),
+        )
+    
+    def observe_tenant(self, tenant, priority, latency_ms, wait_ms, tokens):
+        tags = {"tenant": tenant, "priority": priority}
+        self.tenant_requests.inc(tags=tags)
+        self.tenant_latency.observe(latency_ms, tags=tags)
+        self.tenant_queue_wait.observe(wait_ms, tags=tags)
+        if tokens:
+            self.tenant_tokens.inc(tokens, tags=tags)
+    
+    def observe_tenant_rejection(self, tenant, priority, reason):
+        self.tenant_rejections.inc(tags={"tenant": tenant, "priority": priority, "reason": reason})
+    
+    def observe_fair_share_queue(self, depths):
+        for priority, depth in depths.items():
+            self.fair_share_queue_depth.set(depth, tags={"priority": priority})
+
+
+def tracked(route):
+    """Wrap a service method so every call is recorded by ``self.metrics``."""
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            with self.metrics.track(route) as outcome:
+                return outcome.check(await method(self, *args, **kwargs))
+        return wrapper
+    return decorate
+
+
+# Span kinds, as numbered in OTLP.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# Phases reported in Server-Timing, in request order. "queue" runs from the
+# ingress calling the handle to the replica starting the request (routing,
+# the handle hop and Serve's queue in front of the replica); "return" from
+# the replica finishing to the ingress holding the result.
+TRACE_PHASES = ("parse", "fair_share", "queue", "prompt", "cache", "admission", "model", "generate", "return")
+
+# The trace of the request a replica is working on; see traced_request().
+_ACTIVE_TRACE = contextvars.ContextVar("serve_app_trace", default=None)
+_NO_SPAN = contextlib.nullcontext()
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    service: str = "ingress"
+    kind: int = SPAN_KIND_INTERNAL
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class RequestTrace:
+    """
+    Spans of one sampled request.
+    
+    The ingress starts the trace and passes ``context()`` to the replica in
+    ``ServeRequest.trace``; the replica continues it with ``from_context()``
+    and returns its spans in the result's ``"trace"`` field, which the ingress
+    ``merge()``s before reporting Server-Timing and exporting the trace.
+    Timestamps are wall-clock nanoseconds, so "queue" and "return" include
+    any clock skew when the ingress and the replica run on different nodes.
+    """
+    
+    def __init__(self, trace_id=None, parent_id=None, service="ingress", timing=False):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.service = service
+        # The client asked for the phases in its response (X-Request-Timing).
+        self.timing = timing
+        self.spans = []
+        self.finished = False
+        self._parents = [parent_id]
+    
+    @classmethod
+    def from_context(cls, context, service):
+        """Continue a trace from ``ServeRequest.trace`` in a downstream service."""
+        trace = cls(context["trace_id"], context["parent_id"], service, context.get("timing", False))
+        trace.spans.append(Span(
+            "queue", uuid.uuid4().hex[:16], context["parent_id"], context["sent_ns"], time.time_ns(), service
+        ))
+        return trace
+    
+    def context(self):
+        """Propagation context for a call made from the innermost open span."""
+        return {"trace_id": self.trace_id, "parent_id": self._parents[-1], "sent_ns": time.time_ns(),
+                "timing": self.timing}
+    
+    def start(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        span = Span(name, uuid.uuid4().hex[:16], self._parents[-1], time.time_ns(), service=self.service,
+                    kind=kind, attributes=attributes)
+        self.spans.append(span)
+        self._parents.append(span.span_id)
+        return span
+    
+    def end(self, span):
+        span.end_ns = time.time_ns()
+        if span.span_id in self._parents:
+            self._parents.remove(span.span_id)
+    
+    @contextlib.contextmanager
+    def span(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        span = self.start(name, kind, **attributes)
+        try:
+            yield span
+        finally:
+            self.end(span)
+    
+    def finish(self):
+        """End every span still open and return them as picklable dicts."""
+        now = time.time_ns()
+        for span in self.spans:
+            if not span.end_ns:
+                span.end_ns = now
+        self.finished = True
+        return [dataclasses.asdict(span) for span in self.spans]
+    
+    def merge(self, spans):
+        """Add the spans a downstream service returned."""
+        self.spans.extend(Span(**span) for span in spans or ())
+    
+    def phases_ms(self):
+        """Milliseconds per phase in TRACE_PHASES order, plus the request total."""
+        totals = {}
+        for span in self.spans:
+            if span.name in TRACE_PHASES:
+                totals[span.name] = totals.get(span.name, 0) + span.end_ns - span.start_ns
+        handles = {span.span_id: span for span in self.spans if span.kind == SPAN_KIND_CLIENT}
+        for span in self.spans:
+            handle = handles.get(span.parent_id)
+            if span.kind == SPAN_KIND_SERVER and handle is not None:
+                totals["return"] = totals.get("return", 0) + max(0, handle.end_ns - span.end_ns)
+        phases = {name: round(totals[name] / 1e6, 3) for name in TRACE_PHASES if name in totals}
+        if self.spans:
+            phases["total"] = round((self.spans[0].end_ns - self.spans[0].start_ns) / 1e6, 3)
+        return phases
+    
+    def server_timing(self):
+        """The phases as a ``Server-Timing`` header value."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.phases_ms().items())
+    
+    def summary(self):
+        return {"trace_id": self.trace_id, "phases_ms": self.phases_ms()}
+    
+    def to_otlp(self):
+        """The trace as an OTLP/JSON ``ExportTraceServiceRequest``, one resource per service."""
+        services = {}
+        for span in self.spans:
+            services.setdefault(span.service, []).append({
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            })
+        return {"resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", service)]},
+                "scopeSpans": [{"scope": {"name": "serve_app"}, "spans": spans}],
+            }
+            for service, spans in services.items()
+        ]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def parse_traceparent(value):
+    """``(trace_id, parent_span_id, sampled)`` from a W3C ``traceparent`` header, or None."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Tracer:
+    """
+    Sampling and export of request traces in the ingress.
+    
+    A request is traced when the client asks for its timings
+    (``X-Request-Timing: 1``), when an incoming ``traceparent`` header is
+    sampled, or with probability ``sample_rate``. Untraced requests cost one
+    random draw. Finished traces are appended to ``path`` (if set) as OTLP/JSON
+    lines, the format of the OpenTelemetry Collector's file exporter; each line
+    is written with one ``O_APPEND`` write, so ingress replicas can share a file.
+    """
+    
+    def __init__(self, sample_rate=0.0, path=None):
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.path = path or None
+        self.exported = 0
+        self._fd = None
+    
+    def start(self, headers):
+        """A new ``RequestTrace`` for an incoming request, or None if it is not sampled."""
+        timing = headers.get("x-request-timing", "").lower() in ("1", "true", "yes")
+        parent = parse_traceparent(headers.get("traceparent"))
+        if not (timing or (parent is not None and parent[2]) or random.random() < self.sample_rate):
+            return None
+        if parent is None:
+            return RequestTrace(timing=timing)
+        return RequestTrace(parent[0], parent[1], timing=timing)
+    
+    def export(self, trace):
+        if self.path is None:
+            return
+        if self._fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, (json.dumps(trace.to_otlp(), separators=(",", ":")) + "\n").encode("utf-8"))
+        self.exported += 1
+
+
+def load_trace_settings():
+    """Tracer settings from SERVE_TRACE_SAMPLE_RATE and SERVE_TRACE_FILE."""
+    try:
+        sample_rate = float(os.getenv("SERVE_TRACE_SAMPLE_RATE", "0"))
+    except ValueError:
+        sample_rate = 0.0
+    return {"sample_rate": sample_rate, "path": os.getenv("SERVE_TRACE_FILE") or None}
+
+
+def trace_span(name, trace=None, **attributes):
+    """A span in ``trace`` (default: the active trace); a no-op for untraced requests."""
+    trace = trace if trace is not None else _ACTIVE_TRACE.get()
+    return trace.span(name, **attributes) if trace is not None else _NO_SPAN
+
+
+@contextlib.contextmanager
+def traced_request(request, service):
+    """
+    Continue the trace of ``request`` in a service and make it the active one.
+    
+    Yields the ``RequestTrace`` (None for untraced requests); pass results
+    through ``attach_trace()`` so the spans travel back to the ingress.
+    """
+    if request.trace is None:
+        yield None
+        return
+    trace = RequestTrace.from_context(request.trace, service)
+    token = _ACTIVE_TRACE.set(trace)
+    try:
+        with trace.span(f"{service} {request.path}", SPAN_KIND_SERVER):
+            yield trace
+    finally:
+        try:
+            _ACTIVE_TRACE.reset(token)
+        except ValueError:
+            # A streaming generator closed from another context.
+            pass
+
+
+def attach_trace(result, trace):
+    """Return ``result`` carrying the finished spans of ``trace`` for the ingress."""
+    if trace is not None and isinstance(result, dict):
+        result["trace"] = trace.finish()
+    return result
+
+
+class ResponseCache:
+    """
+    Per-replica LRU cache of generated text (and its token usage) with TTL and a memory bound.
+    
+    Entries are evicted least-recently-used first whenever either the entry
+    count or the approximate byte size (key plus cached text) exceeds its
+    limit, and are dropped on lookup once older than ``ttl_s``.
+    """
+    
+    # Rough per-entry bookkeeping cost (OrderedDict node, tuple, floats).
+    ENTRY_OVERHEAD_BYTES = 200
+    
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024, ttl_s=600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(model_path, prompt, sampling_params):
+        """Hash the model, the prompt exactly as given and the sampling params into a key."""
+        material = json.dumps(
+            {
+                "model": model_path,
+                "prompt": prompt,
+                "max_tokens": sampling_params.max_tokens,
+                "temperature": sampling_params.temperature,
+                "seed": getattr(sampling_params, "seed", None),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def get(self, key) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Return ``(text, usage)`` for a live entry, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, size, text, usage = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text, usage
+    
+    def put(self, key, text, usage=None):
+        size = len(key) + len(text.encode("utf-8")) + self.ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_s, size, text, usage)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def _remove(self, key):
+        size = self._entries.pop(key)[1]
+        self._bytes -= size
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@dataclass
+class LoadedModel:
+    """A registry model that is resident (or being loaded) on this replica."""
+    
+    model_id: str
+    path: str
+    memory_bytes: int
+    engine: Any = None
+    active: int = 0
+    evicting: bool = False
+
+
+class ModelRegistry:
+    """
+    Models from a registry directory, loaded on first use and evicted LRU.
+    
+    Every subdirectory of ``root`` holding a ``config.json`` is a model,
+    addressed by its directory name; ``extra_models`` (id -> path) adds models
+    that live elsewhere. ``load(model_id, path, memory_bytes)`` builds an
+    engine in a worker thread and ``unload(engine)`` releases it.
+    
+    Before a load, idle models are unloaded least recently used first until
+    both budgets fit: at most ``max_loaded`` resident models and, when
+    ``memory_budget_bytes`` is set, their estimated GPU memory (weight files
+    times ``memory_overhead``, for KV cache and activations) within it. Models
+    serving requests are never evicted; a load that cannot fit waits for them.
+    A model being evicted still counts against both budgets until its engine
+    has been unloaded.
+    """
+    
+    WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".gguf")
+    
+    def __init__(self, root, load, unload, extra_models=None, max_loaded=1,
+                 memory_budget_bytes=0, memory_overhead=1.5, metrics=None):
+        self.root = root
+        self.extra_models = dict(extra_models or {})
+        self.max_loaded = max(1, max_loaded)
+        self.memory_budget_bytes = max(0, memory_budget_bytes)
+        self.memory_overhead = memory_overhead
+        self.metrics = metrics
+        self._load = load
+        self._unload = unload
+        self._loaded = OrderedDict()
+        self._changed = asyncio.Condition()
+        self.loads = 0
+        self.evictions = 0
+    
+    def available(self):
+        """Map every model id in the registry to its directory."""
+        models = {}
+        if self.root and os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                path = os.path.join(self.root, name)
+                if os.path.isfile(os.path.join(path, "config.json")):
+                    models[name] = path
+        models.update(self.extra_models)
+        return models
+    
+    def estimate_memory(self, path):
+        """Estimated GPU bytes for a model: its weight files times the overhead."""
+        weights = 0
+        for directory, _, files in os.walk(path):
+            for name in files:
+                if name.endswith(self.WEIGHT_SUFFIXES):
+                    weights += os.path.getsize(os.path.join(directory, name))
+        return int(weights * self.memory_overhead)
+    
+    def preload(self, model_id):
+        """Load ``model_id`` synchronously (replica start-up, no requests yet)."""
+        path = self.resolve(model_id)
+        memory = self._check_fits(model_id, path)
+        started = time.perf_counter()
+        engine = self._load(model_id, path, memory)
+        self._loaded[model_id] = LoadedModel(model_id, path, memory, engine)
+        self._record_load(model_id, started)
+    
+    @contextlib.asynccontextmanager
+    async def use(self, model_id):
+        """Hold ``model_id`` loaded (and un-evictable) for the duration of a request."""
+        with trace_span("model", model=model_id):
+            model = await self._acquire(model_id)
+        try:
+            yield model
+        finally:
+            async with self._changed:
+                model.active -= 1
+                self._loaded.move_to_end(model_id)
+                self._changed.notify_all()
+    
+    async def _acquire(self, model_id):
+        async with self._changed:
+            while True:
+                model = self._loaded.get(model_id)
+                if model is not None:
+                    if model.engine is not None and not model.evicting:
+                        model.active += 1
+                        self._loaded.move_to_end(model_id)
+                        return model
+                    # Another request is loading it, or it is being evicted
+                    # and has to be loaded again once that is done.
+                    await self._changed.wait()
+                    continue
+                path = self.resolve(model_id)
+                memory = self._check_fits(model_id, path)
+                victims = self._plan_eviction(memory)
+                if victims is not None:
+                    break
+                # Every model that could make room is serving requests.
+                await self._changed.wait()
+            for victim in victims:
+                victim.evicting = True
+            # Placeholder: reserves the budget and makes concurrent requests
+            # for the same model wait for this load instead of starting another.
+            model = LoadedModel(model_id, path, memory, active=1)
+            self._loaded[model_id] = model
+        
+        try:
+            if victims:
+                # Shielded: a cancelled request must not leave victims half evicted.
+                await asyncio.shield(self._evict(victims))
+            started = time.perf_counter()
+            model.engine = await asyncio.to_thread(self._load, model_id, path, memory)
+            self._record_load(model_id, started)
+        except BaseException:
+            async with self._changed:
+                self._loaded.pop(model_id, None)
+                self._changed.notify_all()
+            raise
+        async with self._changed:
+            self._changed.notify_all()
+        return model
+    
+    def resolve(self, model_id):
+        """Directory of ``model_id``, loaded or not; raises ``KeyError`` for unknown models."""
+        path = self.available().get(model_id)
+        if path is None:
+            raise KeyError(model_id)
+        return path
+    
+    def _check_fits(self, model_id, path):
+        memory = self.estimate_memory(path)
+        if self.memory_budget_bytes and memory > self.memory_budget_bytes:
+            raise MemoryError(
+                f"Model {model_id} needs ~{memory / 2**30:.1f} GiB, more than the "
+                f"{self.memory_budget_bytes / 2**30:.1f} GiB GPU memory budget"
+            )
+        return memory
+    
+    def _plan_eviction(self, memory):
+        """Idle models to unload (LRU first) so ``memory`` fits, or None if it cannot yet."""
+        count = len(self._loaded)
+        used = sum(model.memory_bytes for model in self._loaded.values())
+        
+        def fits():
+            within_memory = not self.memory_budget_bytes or used + memory <= self.memory_budget_bytes
+            return count + 1 <= self.max_loaded and within_memory
+        
+        victims = []
+        for model in self._loaded.values():
+            if fits():
+                break
+            if model.active == 0 and model.engine is not None and not model.evicting:
+                victims.append(model)
+                count -= 1
+                used -= model.memory_bytes
+        return victims if fits() else None
+    
+    async def _evict(self, victims):
+        """Unload ``victims``; each stays in ``_loaded`` (and in the budget) until its engine is freed."""
+        for index, model in enumerate(victims):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._unload, model.engine)
+            except BaseException:
+                # Still resident: it and the victims after it stay loaded and idle.
+                async with self._changed:
+                    for victim in victims[index:]:
+                        victim.evicting = False
+                    self._changed.notify_all()
+                raise
+            async with self._changed:
+                model.engine = None
+                del self._loaded[model.model_id]
+                self._changed.notify_all()
+            self.evictions += 1
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            print(f"Evicted model {model.model_id} in {elapsed_ms:.0f} ms")
+            if self.metrics is not None:
+                self.metrics.observe_model_eviction(model.model_id, elapsed_ms, len(self._loaded))
+    
+    def _record_load(self, model_id, started):
+        self.loads += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        print(f"Loaded model {model_id} in {elapsed_ms:.0f} ms")
+        if self.metrics is not None:
+            self.metrics.observe_model_load(model_id, elapsed_ms, len(self._loaded))
+    
+    def stats(self):
+        return {
+            "available": sorted(self.available()),
+            "loaded": [
+                {"model": model.model_id, "memory_mb": round(model.memory_bytes / 2**20, 1), "active": model.active}
+                for model in self._loaded.values() if model.engine is not None and not model.evicting
+            ],
+            "max_loaded": self.max_loaded,
+            "memory_budget_mb": round(self.memory_budget_bytes / 2**20, 1) if self.memory_budget_bytes else None,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+# Request fields an /llm/batch body may set for all of its prompts at once.
+BATCH_SAMPLING_FIELDS = ("max_tokens", "temperature", "seed", "n")
+
+
+class Overloaded(Exception):
+    """Raised by ``AdmissionController.admit()`` when a request is turned away."""
+    
+    def __init__(self, reason, retry_after_s, message):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+    
+    @property
+    def status_code(self):
+        # A full queue means "slow down" (429); a request that waited out its
+        # queue timeout means the service cannot keep up right now (503).
+        return 429 if self.reason == "queue_full" else 503
+    
+    def response(self, service):
+        """Error response for the rejected request; the ingress maps it to 429/503."""
+        return {
+            "error": str(self),
+            "error_type": "overloaded" if self.reason == "queue_full" else "queue_timeout",
+            "status_code": self.status_code,
+            "retry_after_s": self.retry_after_s,
+            "service": service,
+        }
+
+
+def estimate_request_tokens(data):
+    """
+    Admission cost of an /llm request: rough prompt tokens plus ``max_tokens``.
+    
+    For an /llm/batch body this is the sum over its ``prompts``, each item
+    inheriting the top-level sampling fields and costing ``n`` completions.
+    """
+    if isinstance(data.get("prompts"), list):
+        defaults = {key: data[key] for key in BATCH_SAMPLING_FIELDS if key in data}
+        return sum(
+            estimate_request_tokens({**defaults, **(item if isinstance(item, dict) else {"prompt": item})})
+            for item in data["prompts"]
+        )
+    if isinstance(data.get("messages"), list):
+        messages = data["messages"]
+        text = " ".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+        overhead = 4 * len(messages)  # role markers of the chat template
+    else:
+        text = str(data.get("prompt", ""))
+        overhead = 0
+    try:
+        max_tokens = max(1, int(data.get("max_tokens", 100)))
+    except (TypeError, ValueError):
+        max_tokens = 100
+    try:
+        samples = max(1, int(data.get("n", 1)))
+    except (TypeError, ValueError):
+        samples = 1
+    # About four characters per token for English text; exact counts would
+    # need the tokenizer, which is too slow to run before admission.
+    return len(text) // 4 + 1 + overhead + max_tokens * samples
+
+
+class AdmissionController:
+    """
+    Token-budget admission control with a bounded FIFO queue.
+    
+    A request costs its estimated prompt tokens plus ``max_tokens`` (capped at
+    ``token_budget`` so an oversized request can still run alone). Requests run
+    while the tokens in flight fit in ``token_budget``; the rest wait in
+    arrival order. When ``max_queue`` requests are already waiting a new one is
+    rejected at once, and one that waits longer than ``queue_timeout_s`` is
+    rejected as well. Both rejections carry a Retry-After estimate based on
+    recent request durations, so an overload turns into fast errors instead of
+    an unbounded queue that clients abandon.
+    """
+    
+    def __init__(self, token_budget, max_queue=128, queue_timeout_s=30.0, metrics=None):
+        self.token_budget = max(1, token_budget)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = max(0.0, queue_timeout_s)
+        self.metrics = metrics
+        self.tokens_in_flight = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self._queue = deque()
+        self._changed = asyncio.Condition()
+        self._avg_duration_s = None
+    
+    @contextlib.asynccontextmanager
+    async def admit(self, cost):
+        """Hold ``cost`` tokens of budget for a request; raises ``Overloaded``."""
+        cost = max(1, min(int(cost), self.token_budget))
+        with trace_span("admission", cost=cost):
+            await self._enter(cost)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.tokens_in_flight -= cost
+                self.running -= 1
+                elapsed = time.perf_counter() - started
+                self._avg_duration_s = elapsed if self._avg_duration_s is None else (
+                    0.8 * self._avg_duration_s + 0.2 * elapsed
+                )
+                self._publish()
+                self._changed.notify_all()
+    
+    async def _enter(self, cost):
+        async with self._changed:
+            if not self._queue and self._fits(cost):
+                self._take(cost, 0.0)
+                return
+            if len(self._queue) >= self.max_queue:
+                raise self._reject("queue_full", cost)
+            ticket = [cost]
+            self._queue.append(ticket)
+            self._publish()
+            loop = asyncio.get_running_loop()
+            enqueued = loop.time()
+            try:
+                # First in, first out: only the head of the queue may take
+                # budget, so large requests are not starved by small ones.
+                while not (self._queue[0] is ticket and self._fits(cost)):
+                    remaining = enqueued + self.queue_timeout_s - loop.time()
+                    if remaining <= 0:
+                        raise self._reject("queue_timeout", cost)
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                self._take(cost, loop.time() - enqueued)
+            finally:
+                self._queue.remove(ticket)
+                self._publish()
+                self._changed.notify_all()
+    
+    def _fits(self, cost):
+        return self.tokens_in_flight + cost <= self.token_budget
+    
+    def _take(self, cost, waited_s):
+        self.tokens_in_flight += cost
+        self.running += 1
+        self.admitted += 1
+        self._publish()
+        if self.metrics is not None:
+            self.metrics.admission_wait.observe(waited_s * 1000.0)
+    
+    def _reject(self, reason, cost):
+        self.rejected[reason] += 1
+        if self.metrics is not None:
+            self.metrics.observe_rejection(reason)
+        return Overloaded(
+            reason,
+            self.retry_after_s(cost),
+            f"Server overloaded ({reason.replace('_', ' ')}): {self.tokens_in_flight} of "
+            f"{self.token_budget} tokens in flight, {len(self._queue)} requests queued",
+        )
+    
+    def retry_after_s(self, cost):
+        """Whole seconds until roughly enough budget has drained for ``cost``."""
+        queued_tokens = sum(ticket[0] for ticket in self._queue) + cost
+        budgets_ahead = max(1.0, queued_tokens / self.token_budget)
+        return max(1, min(60, math.ceil((self._avg_duration_s or 1.0) * budgets_ahead)))
+    
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.observe_admission(len(self._queue), self.tokens_in_flight)
+    
+    def stats(self):
+        return {
+            "token_budget": self.token_budget,
+            "tokens_in_flight": self.tokens_in_flight,
+            "running": self.running,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout_s,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_request_s": round(self._avg_duration_s, 3) if self._avg_duration_s is not None else None,
+        }
+
+
+# Priority classes of the ingress fair-share scheduler, highest first.
+PRIORITY_CLASSES = ("interactive", "batch")
+DEFAULT_TENANT = "anonymous"
+# Tenants beyond this many distinct (tenant, priority) flows share one flow,
+# so arbitrary X-Tenant values cannot grow the scheduler or metric series.
+OVERFLOW_TENANT = "other"
+
+
+class TenantFlow:
+    """One tenant's queue within a priority class, plus its counters."""
+    
+    def __init__(self, tenant, priority, weight):
+        self.tenant = tenant
+        self.priority = priority
+        self.weight = weight
+        self.queue = deque()
+        self.deficit = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.tokens = 0
+        self.latencies_ms = deque(maxlen=1024)
+    
+    def stats(self):
+        ordered = sorted(self.latencies_ms)
+        
+        def percentile(q):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3) if ordered else None
+        
+        return {
+            "tenant": self.tenant,
+            "priority": self.priority,
+            "weight": self.weight,
+            "queued": len(self.queue),
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "completion_tokens": self.tokens,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+        }
+
+
+class FairShareGrant:
+    """Handed out by ``FairShareScheduler.slot()``; set ``tokens`` to the tokens generated."""
+    
+    __slots__ = ("flow", "cost", "arrived", "waited_s", "tokens")
+    
+    def __init__(self, flow, cost, arrived):
+        self.flow = flow
+        self.cost = cost
+        self.arrived = arrived
+        self.waited_s = 0.0
+        self.tokens = 0
+
+
+class FairShareScheduler:
+    """
+    Weighted fair queueing of /llm requests across tenants.
+    
+    Requests are dispatched while the estimated tokens in flight fit in
+    ``token_budget``. Once that budget is used up, requests queue per
+    ``(tenant, priority class)`` flow. Priority classes are strict: a batch
+    request is dispatched only while no interactive request is waiting. Within
+    a class, flows take turns by deficit round robin measured in tokens. Each
+    turn adds ``quantum * weight`` tokens of credit to a flow, and the flow
+    spends that credit on its own queued requests. A tenant with weight 2 thus
+    gets about twice the token throughput of a tenant with weight 1, however
+    many requests either one sends. Queue overflow and queue timeouts raise
+    ``Overloaded``, just as in ``AdmissionController``.
+    """
+    
+    def __init__(self, token_budget, quantum=512, max_queue=1024, queue_timeout_s=60.0,
+                 max_flows=64, metrics=None):
+        self.token_budget = max(1, token_budget)
+        self.quantum = max(1, quantum)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = max(0.0, queue_timeout_s)
+        self.max_flows = max(1, max_flows)
+        self.metrics = metrics
+        self.tokens_in_flight = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self._flows = {}
+        self._active = {priority: deque() for priority in PRIORITY_CLASSES}
+        self._avg_duration_s = None
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant, priority, weight, cost):
+        """Hold ``cost`` tokens of the budget for one request of ``tenant``; yields a ``FairShareGrant``."""
+        flow = self._flow(tenant, priority, weight)
+        loop = asyncio.get_running_loop()
+        grant = FairShareGrant(flow, max(1, min(int(cost), self.token_budget)), loop.time())
+        await self._enter(grant)
+        started = loop.time()
+        try:
+            yield grant
+        finally:
+            finished = loop.time()
+            self._release(grant)
+            elapsed = finished - started
+            self._avg_duration_s = elapsed if self._avg_duration_s is None else (
+                0.8 * self._avg_duration_s + 0.2 * elapsed
+            )
+            latency_ms = (finished - grant.arrived) * 1000.0
+            flow.completed += 1
+            flow.tokens += grant.tokens
+            flow.latencies_ms.append(latency_ms)
+            if self.metrics is not None:
+                self.metrics.observe_tenant(
+                    flow.tenant, flow.priority, latency_ms, grant.waited_s * 1000.0, grant.tokens
+                )
+    
+    def _flow(self, tenant, priority, weight):
+        key = (tenant, priority)
+        if key not in self._flows and len(self._flows) >= self.max_flows:
+            key = (OVERFLOW_TENANT, priority)
+        flow = self._flows.get(key)
+        if flow is None:
+            flow = self._flows[key] = TenantFlow(key[0], priority, weight)
+        return flow
+    
+    async def _enter(self, grant):
+        if not self.queued and self._fits(grant.cost):
+            self._grant(grant)
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full", grant)
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        flow = grant.flow
+        flow.queue.append((grant, waiter))
+        if len(flow.queue) == 1:
+            self._active[flow.priority].append(flow)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return
+            self._withdraw(flow, grant, waiter)
+            raise self._reject("queue_timeout", grant)
+        except asyncio.CancelledError:
+            # The client went away: give back a grant made at the last moment,
+            # or leave the queue.
+            if waiter.done():
+                self._release(grant)
+            else:
+                self._withdraw(flow, grant, waiter)
+            raise
+    
+    def _dispatch(self):
+        """Start queued requests, highest priority class first, while budget allows."""
+        for priority in PRIORITY_CLASSES:
+            ring = self._active[priority]
+            while ring:
+                flow = ring[0]
+                grant, waiter = flow.queue[0]
+                if flow.deficit < grant.cost:
+                    # Turn over: credit this flow for its next turn and move on.
+                    flow.deficit += self.quantum * flow.weight
+                    ring.rotate(-1)
+                    continue
+                if not self._fits(grant.cost):
+                    # Lower classes must not take the budget this request waits for.
+                    self._publish()
+                    return
+                flow.queue.popleft()
+                self.queued -= 1
+                flow.deficit -= grant.cost
+                if not flow.queue:
+                    flow.deficit = 0
+                    ring.popleft()
+                self._grant(grant)
+                waiter.set_result(None)
+        self._publish()
+    
+    def _fits(self, cost):
+        return self.tokens_in_flight + cost <= self.token_budget
+    
+    def _grant(self, grant):
+        self.tokens_in_flight += grant.cost
+        grant.flow.in_flight += 1
+        grant.flow.admitted += 1
+        grant.waited_s = asyncio.get_running_loop().time() - grant.arrived
+    
+    def _release(self, grant):
+        self.tokens_in_flight -= grant.cost
+        grant.flow.in_flight -= 1
+        self._dispatch()
+    
+    def _withdraw(self, flow, grant, waiter):
+        flow.queue.remove((grant, waiter))
+        self.queued -= 1
+        if not flow.queue:
+            flow.deficit = 0
+            self._active[flow.priority].remove(flow)
+        self._dispatch()
+    
+    def _reject(self, reason, grant):
+        flow = grant.flow
+        self.rejected[reason] += 1
+        flow.rejected += 1
+        if self.metrics is not None:
+            self.metrics.observe_tenant_rejection(flow.tenant, flow.priority, reason)
+        queued_tokens = sum(g.cost for f in self._flows.values() for g, _ in f.queue) + grant.cost
+        budgets_ahead = max(1.0, queued_tokens / self.token_budget)
+        retry_after_s = max(1, min(60, math.ceil((self._avg_duration_s or 1.0) * budgets_ahead)))
+        return Overloaded(
+            reason,
+            retry_after_s,
+            f"Server overloaded ({reason.replace('_', ' ')}): {self.queued} requests queued "
+            f"at the ingress for tenant scheduling",
+        )
+    
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.observe_fair_share_queue({
+                priority: sum(len(flow.queue) for flow in ring)
+                for priority, ring in self._active.items()
+            })
+    
+    def stats(self):
+        return {
+            "token_budget": self.token_budget,
+            "quantum": self.quantum,
+            "tokens_in_flight": self.tokens_in_flight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout_s,
+            "rejected": dict(self.rejected),
+            "tenants": [flow.stats() for flow in self._flows.values()],
+        }
+
+
+def load_fair_share_settings():
+    """
+    Resolve the ingress fair-share scheduler settings and tenant table.
+    
+    ``SERVE_FAIR_SHARE_TOKEN_BUDGET`` (default 16384, 0 disables),
+    ``SERVE_FAIR_SHARE_QUANTUM``, ``SERVE_FAIR_SHARE_QUEUE`` and
+    ``SERVE_FAIR_SHARE_TIMEOUT_S`` configure the scheduler. The JSON/YAML file
+    named by ``SERVE_TENANT_CONFIG`` describes the tenants::
+        
+        {"default": {"weight": 1, "priority": "interactive"},
+         "tenants": {"chat": {"weight": 4, "api_keys": ["sk-chat"]},
+                     "etl": {"weight": 1, "priority": "batch", "api_keys": ["sk-etl"]}}}
+    
+    The result is passed to ``Ingress`` as a bind argument, so the values seen
+    by deploy_serve.py are the ones the ingress replicas use.
+    """
+    settings = {
+        "token_budget": max(0, int(os.getenv("SERVE_FAIR_SHARE_TOKEN_BUDGET", "16384"))),
+        "quantum": max(1, int(os.getenv("SERVE_FAIR_SHARE_QUANTUM", "512"))),
+        "max_queue": max(0, int(os.getenv("SERVE_FAIR_SHARE_QUEUE", "1024"))),
+        "queue_timeout_s": max(0.0, float(os.getenv("SERVE_FAIR_SHARE_TIMEOUT_S", "60"))),
+        "default": {"weight": 1.0, "priority": PRIORITY_CLASSES[0]},
+        "tenants": {},
+    }
+    config_path = os.getenv("SERVE_TENANT_CONFIG")
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as f:
+            if config_path.endswith((".yaml", ".yml")):
+                import yaml
+                config = yaml.safe_load(f) or {}
+            else:
+                config = json.load(f)
+        settings["default"].update(config.get("default") or {})
+        for name, values in (config.get("tenants") or {}).items():
+            tenant = dict(settings["default"], api_keys=[])
+            tenant.update(values or {})
+            settings["tenants"][name] = tenant
+    
+    for name, policy in [("default", settings["default"]), *settings["tenants"].items()]:
+        if policy["priority"] not in PRIORITY_CLASSES:
+            raise ValueError(f"{name}: priority must be one of {', '.join(PRIORITY_CLASSES)}")
+        policy["weight"] = float(policy["weight"])
+        if policy["weight"] <= 0:
+            raise ValueError(f"{name}: weight must be positive")
+    return settings
+
+
+def identify_tenant(headers, settings):
+    """
+    Return ``(tenant, priority, weight)`` for a request's headers.
+    
+    An API key (``X-API-Key`` or ``Authorization: Bearer``) listed in the
+    tenant table selects that tenant. Otherwise ``X-Tenant`` names the tenant,
+    except for tenants that have API keys, and unknown tenants get the default
+    policy. ``X-Priority: batch`` lowers a request's class; it can never rise
+    above its tenant's class.
+    """
+    tenants = settings["tenants"]
+    key = headers.get("x-api-key")
+    authorization = headers.get("authorization", "")
+    if not key and authorization.lower().startswith("bearer "):
+        key = authorization[len("bearer "):].strip()
+    tenant = None
+    if key:
+        tenant = next((name for name, policy in tenants.items() if key in policy.get("api_keys", ())), None)
+    if tenant is None:
+        tenant = headers.get("x-tenant") or DEFAULT_TENANT
+        if tenants.get(tenant, {}).get("api_keys"):
+            tenant = DEFAULT_TENANT
+    policy = tenants.get(tenant, settings["default"])
+    priority = policy["priority"]
+    requested = headers.get("x-priority", "").lower()
+    if requested in PRIORITY_CLASSES and PRIORITY_CLASSES.index(requested) > PRIORITY_CLASSES.index(priority):
+        priority = requested
+    return tenant, priority, policy["weight"]
+
+
+def routing_prefix(data, max_chars=256):
+    """
+    Normalized prompt prefix that /llm requests sharing context have in common.
+
+    Chat messages are flattened as ``role: content`` lines (so the system
+    prompt and earlier turns come first) and whitespace is collapsed; the key
+    is the model plus the first ``max_chars`` characters. Returns ``None`` for
+    requests without a prompt. An /llm/batch body is keyed by its first item.
+    """
+    if isinstance(data.get("prompts"), list) and data["prompts"]:
+        first = data["prompts"][0]
+        return routing_prefix({"model": data.get("model"), **(first if isinstance(first, dict) else {"prompt": first})},
+                              max_chars)
+    if isinstance(data.get("messages"), list):
+        text = "\n".join(
+            f"{m.get('role', 'user')}: {m.get('content', '')}" for m in data["messages"] if isinstance(m, dict)
+        )
+    elif isinstance(data.get("prompt"), str):
+        text = data["prompt"]
+    else:
+        return None
+    text = " ".join(text.split())[:max_chars]
+    return f"{data.get('model') or ''}\x00{text}" if text else None
+
+
+def _ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class PrefixAffinityRouter(FIFOMixin, RequestRouter):
+    """
+    Route /llm requests that share a prompt prefix to the same tinyllama replica.
+    
+    Serve's default power-of-two-choices routing spreads a shared system
+    prompt or a conversation over every replica, so each one prefills the same
+    prefix again. This router hashes ``routing_prefix()`` onto a consistent
+    hash ring (``virtual_nodes`` points per replica, so adding or removing a
+    replica only moves the keys next to it) and prefers the replica that owns
+    the key, then the next one on the ring. When the preferred replica has
+    ``imbalance_threshold`` more requests in flight than the least loaded one,
+    or is at ``max_ongoing_requests``, the request goes to the least loaded
+    replica instead. Requests without a prompt use plain least-loaded routing.
+    
+    Serve also runs routing tasks that are not tied to a request; FIFOMixin
+    hands the replicas those pick to the oldest waiting request, as Serve's
+    default router does. Loads are this router's own in-flight counts, i.e. the
+    view of one ingress replica. ``stats()`` reports the routing decisions, the load imbalance
+    (max / mean in-flight requests) and each replica's prefix-cache hit rate
+    from ``TinyLlamaService.record_routing_stats()``.
+    """
+    
+    # Routers live inside the handles of this process; GET /llm/routing reads them.
+    instances = []
+    
+    def initialize_state(self, virtual_nodes=64, prefix_chars=256, imbalance_threshold=8):
+        self.virtual_nodes = max(1, int(virtual_nodes))
+        self.prefix_chars = max(1, int(prefix_chars))
+        self.imbalance_threshold = max(0, int(imbalance_threshold))
+        self._ring_ids = ()
+        self._ring = []
+        self._in_flight = {}
+        self._finished_early = OrderedDict()
+        self._routed = {}
+        self._preferred = OrderedDict()
+        self.decisions = {"affinity": 0, "spill": 0, "fallback": 0, "no_prefix": 0}
+        self._decision_counter = metrics.Counter(
+            "serve_app_llm_routing_decisions",
+            description="tinyllama routing decisions: affinity, spill (next replica on the ring), "
+                        "fallback (least loaded) or no_prefix.",
+            tag_keys=("decision",),
+        )
+        self._imbalance_gauge = metrics.Gauge(
+            "serve_app_llm_replica_load_imbalance",
+            description="Max / mean in-flight requests over tinyllama replicas, seen by one ingress replica.",
+        )
+        # Serve ships router classes to handles by value, so this class may be
+        # a copy; register with the importable module that Ingress reads.
+        module = sys.modules.get(__name__)
+        getattr(module, "PrefixAffinityRouter", PrefixAffinityRouter).instances.append(self)
+    
+    async def choose_replicas(self, candidate_replicas, pending_request=None):
+        if not candidate_replicas:
+            return []
+        key = None
+        if pending_request is not None and pending_request.args:
+            # Duck-typed: the router's by-value copy of serve_app has its own
+            # ServeRequest class.
+            request = pending_request.args[0]
+            if getattr(request, "method", None) == "POST" and isinstance(getattr(request, "data", None), dict):
+                key = routing_prefix(request.data, self.prefix_chars)
+        by_load = sorted(candidate_replicas, key=self._load)
+        if pending_request is not None:
+            # Every candidate is offered, so let Serve back off before asking again.
+            pending_request.routing_context.should_backoff = True
+        if key is None or len(candidate_replicas) == 1:
+            self._remember(pending_request, None, "no_prefix")
+            return [by_load]
+        
+        order = self._ring_order(candidate_replicas, key)
+        preferred = order[0]
+        overloaded = (
+            self._load(preferred) >= preferred.max_ongoing_requests
+            or self._load(preferred) - self._load(by_load[0]) > self.imbalance_threshold
+        )
+        if overloaded:
+            self._remember(pending_request, preferred.replica_id, "fallback")
+            return [by_load]
+        self._remember(pending_request, preferred.replica_id, "affinity")
+        # Ranks are tried in order when a replica rejects the request (full).
+        return [[preferred], [order[1]], order[2:]] if len(order) > 2 else [[preferred], order[1:]]
+    
+    def on_request_routed(self, pending_request, replica_id, result):
+        request_id = pending_request.metadata.internal_request_id
+        # A fast request can complete before the replica's acceptance arrives.
+        if self._finished_early.pop((replica_id, request_id), None) is None:
+            self._in_flight.setdefault(replica_id, set()).add(request_id)
+        self._routed[replica_id] = self._routed.get(replica_id, 0) + 1
+        preferred, decision = self._preferred.pop(request_id, (None, "no_prefix"))
+        if decision == "affinity" and replica_id != preferred:
+            decision = "spill"
+        self.decisions[decision] += 1
+        self._decision_counter.inc(tags={"decision": decision})
+        self._imbalance_gauge.set(self.load_imbalance())
+    
+    def on_request_completed(self, replica_id, internal_request_id):
+        in_flight = self._in_flight.get(replica_id, set())
+        if internal_request_id in in_flight:
+            in_flight.discard(internal_request_id)
+            return
+        # Also fires for requests the replica rejected; those never get routed.
+        self._finished_early[(replica_id, internal_request_id)] = True
+        while len(self._finished_early) > 4096:
+            self._finished_early.popitem(last=False)
+    
+    def on_replica_actor_died(self, replica_id):
+        super().on_replica_actor_died(replica_id)
+        self._in_flight.pop(replica_id, None)
+    
+    def _remember(self, pending_request, preferred, decision):
+        if pending_request is None:
+            return
+        self._preferred[pending_request.metadata.internal_request_id] = (preferred, decision)
+        # Requests cancelled before routing never reach on_request_routed.
+        while len(self._preferred) > 4096:
+            self._preferred.popitem(last=False)
+    
+    def _load(self, replica):
+        return len(self._in_flight.get(replica.replica_id, ()))
+    
+    def _ring_order(self, replicas, key):
+        """Replicas in ring order starting at the owner of ``key``."""
+        by_id = {replica.replica_id.unique_id: replica for replica in replicas}
+        ids = tuple(sorted(by_id))
+        if ids != self._ring_ids:
+            self._ring = sorted(
+                (_ring_hash(f"{replica_id}#{point}"), replica_id)
+                for replica_id in ids for point in range(self.virtual_nodes)
+            )
+            self._ring_ids = ids
+        start = bisect.bisect(self._ring, (_ring_hash(key), ""))
+        order = []
+        for offset in range(len(self._ring)):
+            replica_id = self._ring[(start + offset) % len(self._ring)][1]
+            if replica_id not in order:
+                order.append(replica_id)
+                if len(order) == len(ids):
+                    break
+        return [by_id[replica_id] for replica_id in order]
+    
+    def load_imbalance(self):
+        loads = [len(self._in_flight.get(replica_id, ())) for replica_id in list(self.curr_replicas)] or [0]
+        mean = sum(loads) / len(loads)
+        return round(max(loads) / mean, 3) if mean else 1.0
+    
+    def stats(self):
+        replicas = {}
+        for replica in list(self.curr_replicas.values()):
+            replica_stats = replica.routing_stats or {}
+            replicas[replica.replica_id.unique_id] = {
+                "in_flight": self._load(replica),
+                "routed": self._routed.get(replica.replica_id, 0),
+                "prefix_cache": replica_stats.get("prefix_cache"),
+            }
+        return {
+            "decisions": dict(self.decisions),
+            "load_imbalance": self.load_imbalance(),
+            "replicas": replicas,
+        }
+    
+    @classmethod
+    def combined_stats(cls):
+        """Stats of every router in this process (one per handle to tinyllama)."""
+        if not cls.instances:
+            return {"prefix_routing": None}
+        decisions = {}
+        replicas = {}
+        for router in cls.instances:
+            router_stats = router.stats()
+            for decision, count in router_stats["decisions"].items():
+                decisions[decision] = decisions.get(decision, 0) + count
+            for replica_id, replica_stats in router_stats["replicas"].items():
+                merged = replicas.setdefault(replica_id, {"in_flight": 0, "routed": 0})
+                merged["in_flight"] += replica_stats["in_flight"]
+                merged["routed"] += replica_stats["routed"]
+                merged["prefix_cache"] = replica_stats["prefix_cache"]
+        loads = [replica["in_flight"] for replica in replicas.values()] or [0]
+        mean = sum(loads) / len(loads)
+        routed = sum(decisions.values())
+        return {
+            "prefix_routing": True,
+            "decisions": decisions,
+            "affinity_rate": round(decisions.get("affinity", 0) / routed, 4) if routed else None,
+            "load_imbalance": round(max(loads) / mean, 3) if mean else 1.0,
+            "replicas": replicas,
+        }
+
+
+def prefetch_weights(path, chunk_bytes=16 * 1024 * 1024):
+    """
+    Read a model's weight files once so the engine loads them from page cache.
+    
+    Returns the number of bytes read. Timing this separately from engine
+    construction splits shared-storage I/O from GPU initialization.
+    """
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.endswith(ModelRegistry.WEIGHT_SUFFIXES):
+                continue
+            with open(os.path.join(directory, name), "rb", buffering=0) as f:
+                while True:
+                    chunk = f.read(chunk_bytes)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+    return total
+
+
+def node_local_copy(path, local_root):
+    """
+    Return this node's replica of a model directory, or ``path`` itself.
+
+    ``scripts/helpers/replicate_model.py`` copies models from shared storage
+    to ``<local_root>/<model name>`` and writes ``.stage_manifest.json`` last,
+    so a copy counts only once its manifest exists and every listed file has
+    the recorded size.
+    """
+    if not local_root:
+        return path
+    local = os.path.join(local_root, os.path.basename(path.rstrip("/")))
+    try:
+        with open(os.path.join(local, ".stage_manifest.json")) as f:
+            files = json.load(f)["files"]
+        for name, entry in files.items():
+            if os.path.getsize(os.path.join(local, name)) != entry["size"]:
+                return path
+    except (OSError, ValueError, KeyError, TypeError):
+        return path
+    return local
+
+
+# Chunk size of the streaming echo unless the request sets ?chunk_size=.
+ECHO_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+@serve.deployment(name="echo_service")
 class EchoService:
-    """Simple echo service that returns the input message."""
+    """
+    Simple echo service that returns the input message.
+    
+    It is also the transport benchmark: ``/echo/raw`` returns the request body
+    byte for byte and ``/echo/stream`` returns it in ``chunk_size`` pieces,
+    so the cost of moving a payload through Serve can be measured alone (see
+    scripts/helpers/bench_echo_transport.py). Deployed as its own application
+    (``echo_direct_app``) it serves HTTP itself, without the ingress hop.
+    """
     
     def __init__(self):
         self.service_name = "EchoService"
+        self.metrics = ServiceMetrics()
     
     async def __call__(self, request):
-        """Handle HTTP requests."""
-        if hasattr(request, "method") and request.method == "POST":
-            data = await request.json()
-            message = data.get("message", "Hello from Ray Serve!")
-            return {"echo": message, "service": self.service_name}
-        elif isinstance(request, dict):
-            # Handle direct dict input
-            message = request.get("message", "Hello from Ray Serve!")
+        """Handle requests forwarded by the ingress, or HTTP requests directly."""
+        if isinstance(request, Request):
+            return await self._serve_http(request)
+        return await self._echo(request)
+    
+    @tracked("/echo")
+    async def _echo(self, request: ServeRequest):
+        if request.body is not None:
+            return request.body
+        if request.method == "POST":
+            message = request.data.get("message", "Hello from Ray Serve!")
             return {"echo": message, "service": self.service_name}
-        else:
-            return {"message": "Send a POST request with a 'message' field", "service": self.service_name}
+        return {"message": "Send a POST request with a 'message' field", "service": self.service_name}
+    
+    async def stream(self, request: ServeRequest):
+        """Yield the raw request body in ``chunk_size`` byte pieces."""
+        try:
+            chunk_size = int(request.data.get("chunk_size") or ECHO_STREAM_CHUNK_BYTES)
+        except ValueError:
+            chunk_size = ECHO_STREAM_CHUNK_BYTES
+        chunk_size = max(1, min(chunk_size, 16 * 1024 * 1024))
+        body = memoryview(request.body or b"")
+        with self.metrics.track("/echo/stream"):
+            for start in range(0, len(body), chunk_size):
+                yield bytes(body[start:start + chunk_size])
+    
+    async def _serve_http(self, http_request):
+        """Serve /echo, /echo/raw and /echo/stream under this app's route prefix."""
+        mode = http_request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        body = await http_request.body() if http_request.method == "POST" else b""
+        if mode in ("raw", "stream"):
+            request = ServeRequest(path=f"/echo/{mode}", method=http_request.method,
+                                   data=dict(http_request.query_params), body=body)
+            if mode == "stream":
+                return StreamingResponse(self.stream(request), media_type="application/octet-stream")
+            return Response(await self._echo(request), media_type="application/octet-stream")
+        return await self._echo(ServeRequest(path="/echo", method=http_request.method, data=parse_json_object(body)))
 
 
-@serve.deployment(
-    name="calculator",
-    num_replicas=1
-)
+@serve.deployment(name="calculator")
 class Calculator:
     """Simple calculator service."""
     
     def __init__(self):
         self.service_name = "Calculator"
+        self.metrics = ServiceMetrics()
     
-    async def __call__(self, request):
-        """Handle HTTP requests for calculations."""
-        if hasattr(request, "method") and request.method == "POST":
-            data = await request.json()
-        elif isinstance(request, dict):
-            data = request
-        else:
+    @tracked("/calc")
+    async def __call__(self, request: ServeRequest):
+        """Handle calculation requests forwarded by the ingress."""
+        data = request.data
+        if request.method != "POST":
             return {
                 "message": "Send a POST request with 'operation' (add/subtract/multiply/divide), 'a', and 'b'",
                 "service": self.service_name
@@ -85,111 +1937,817 @@ class Calculator:
             "result": result,
             "service": self.service_name
         }
+    
+    # Vectorized kernels for the batch endpoint, in operation-code order.
+    BATCH_OPERATIONS = ("add", "subtract", "multiply", "divide")
+    
+    @tracked("/calc/batch")
+    async def batch(self, request: ServeRequest):
+        """
+        Evaluate many operations in one request with NumPy (``/calc/batch``).
+        
+        The body carries column arrays ``a`` and ``b`` plus either
+        ``operation`` (one name applied to every element, or a column of
+        names) or ``operations`` (a list of names, each applied to the whole
+        arrays). Divisions by zero and results that are not finite (overflow
+        to infinity) are masked per element: their positions are listed under
+        ``invalid`` and their results are ``null``. With
+        ``"encoding": "base64"`` the operands and results are little-endian
+        float64 buffers instead of JSON lists. Malformed requests get a 400.
+        """
+        data = request.data
+        if request.method != "POST":
+            return {
+                "message": "POST column arrays 'a' and 'b' with 'operation' (name or list) or 'operations'",
+                "service": self.service_name
+            }
+        
+        encoding = data.get("encoding", "json")
+        try:
+            a = self._decode_column(data.get("a", []), encoding)
+            b = self._decode_column(data.get("b", []), encoding)
+        except (TypeError, ValueError) as e:
+            return self._bad_request(f"Invalid operands: {e}")
+        if a.shape != b.shape:
+            return self._bad_request(f"Operand length mismatch: {a.size} vs {b.size}")
+        
+        if "operations" in data:
+            operations = data["operations"]
+            if not isinstance(operations, list) or not all(isinstance(name, str) for name in operations):
+                return self._bad_request("'operations' must be a list of operation names")
+            results, invalid = {}, {}
+            for operation in operations:
+                if operation not in self.BATCH_OPERATIONS:
+                    return self._bad_request(f"Unknown operation: {operation}")
+                codes = np.full(a.size, self.BATCH_OPERATIONS.index(operation))
+                values, masked = self._evaluate(codes, a, b)
+                results[operation] = self._encode_column(values, masked, encoding)
+                invalid[operation] = masked.tolist()
+            return {"count": int(a.size), "results": results, "invalid": invalid, "service": self.service_name}
+        
+        operation = data.get("operation")
+        if isinstance(operation, list):
+            names = np.asarray(operation, dtype=object)
+            if names.shape != a.shape:
+                return self._bad_request(f"Operation column length mismatch: {names.size} vs {a.size}")
+            codes = np.full(a.size, -1)
+            for code, name in enumerate(self.BATCH_OPERATIONS):
+                codes[names == name] = code
+            unknown = sorted({str(name) for name in names[codes < 0]})
+            if unknown:
+                return self._bad_request(f"Unknown operation(s): {', '.join(unknown)}")
+        elif operation in self.BATCH_OPERATIONS:
+            codes = np.full(a.size, self.BATCH_OPERATIONS.index(operation))
+        else:
+            return self._bad_request(f"Unknown operation: {operation}")
+        
+        values, masked = self._evaluate(codes, a, b)
+        return {
+            "count": int(a.size),
+            "result": self._encode_column(values, masked, encoding),
+            "invalid": masked.tolist(),
+            "service": self.service_name
+        }
+    
+    @staticmethod
+    def _bad_request(message):
+        return {"error": message, "error_type": "bad_request", "status_code": 400}
+    
+    @staticmethod
+    def _evaluate(codes, a, b):
+        """Apply per-element operation codes; return ``(values, invalid_indices)``."""
+        values = np.empty(a.size, dtype=np.float64)
+        # Overflow is expected here; it is masked below instead of warned about.
+        with np.errstate(over="ignore", invalid="ignore"):
+            for code, kernel in enumerate((np.add, np.subtract, np.multiply)):
+                mask = codes == code
+                if mask.any():
+                    values[mask] = kernel(a[mask], b[mask])
+            divide = codes == 3
+            zero_division = divide & (b == 0)
+            divide &= ~zero_division
+            if divide.any():
+                values[divide] = a[divide] / b[divide]
+        values[zero_division] = np.nan
+        # JSON has no infinity or NaN, so those results are masked like x / 0.
+        invalid = ~np.isfinite(values)
+        values[invalid] = np.nan
+        return values, np.flatnonzero(invalid)
+    
+    @staticmethod
+    def _decode_column(column, encoding):
+        if encoding == "base64":
+            return np.frombuffer(base64.b64decode(column), dtype="<f8")
+        if encoding != "json":
+            raise ValueError(f"unsupported encoding '{encoding}'")
+        return np.asarray(column, dtype=np.float64).reshape(-1)
+    
+    @staticmethod
+    def _encode_column(values, masked, encoding):
+        if encoding == "base64":
+            # Masked positions stay NaN in the binary form.
+            return base64.b64encode(values.astype("<f8").tobytes()).decode("ascii")
+        result = values.tolist()
+        for index in masked.tolist():
+            result[index] = None
+        return result
 
 
-def create_tinyllama_deployment():
-    """Create TinyLlama deployment with appropriate GPU allocation."""
-    env_tensor_parallel = os.getenv("TENSOR_PARALLEL_SIZE", "1")
+DEFAULT_MODEL_DIR = "/mnt/shared/cluster-llm/TinyLlama-1.1B-Chat-v1.0"
+
+
+def llm_engine_settings():
+    """
+    Model and engine settings shared by the Serve LLM deployment and batch_infer.py.
+    
+    Read from the environment of the calling process (the driver): MODEL_DIR,
+    TENSOR_PARALLEL_SIZE, SERVE_LLM_PREFIX_CACHING and the node-local model
+    root (SERVE_LLM_LOCAL_MODEL_ROOT, falling back to MODEL_LOCAL_ROOT).
+    """
     try:
-        tensor_parallel_size = max(1, int(env_tensor_parallel))
+        tensor_parallel_size = max(1, int(os.getenv("TENSOR_PARALLEL_SIZE", "1")))
     except ValueError:
         tensor_parallel_size = 1
+    return {
+        "model_dir": os.getenv("MODEL_DIR", DEFAULT_MODEL_DIR),
+        "tensor_parallel_size": tensor_parallel_size,
+        # Automatic prefix caching lets requests that share a prompt prefix
+        # (system prompt, earlier conversation turns) reuse KV-cache blocks.
+        "enable_prefix_caching": os.getenv("SERVE_LLM_PREFIX_CACHING", "1") != "0",
+        # Node-local model copies (scripts/helpers/replicate_model.py) are
+        # used instead of the shared mount when the node has one.
+        "local_model_root": os.getenv("SERVE_LLM_LOCAL_MODEL_ROOT", os.getenv("MODEL_LOCAL_ROOT", "")),
+    }
+
+
+def vllm_engine_kwargs(model_path, tensor_parallel_size, enable_prefix_caching):
+    """Keyword arguments for ``vllm.LLM`` / ``AsyncEngineArgs`` for one model."""
+    return {
+        "model": model_path,
+        "tensor_parallel_size": tensor_parallel_size,
+        "trust_remote_code": True,
+        "enable_prefix_caching": enable_prefix_caching,
+    }
+
+
+def create_tinyllama_deployment():
+    """Create TinyLlama deployment with appropriate GPU allocation."""
+    engine_settings = llm_engine_settings()
+    tensor_parallel_size = engine_settings["tensor_parallel_size"]
     num_gpus = tensor_parallel_size if tensor_parallel_size > 0 else 1
+    if USE_STUB_ENGINE:
+        # The stub engine runs entirely on CPU.
+        num_gpus = 0
     ray_actor_options = {
         "num_gpus": num_gpus,
         "runtime_env": {"env_vars": {"TENSOR_PARALLEL_SIZE": str(tensor_parallel_size)}},
     }
     
+    # Micro-batching settings for the "sync" engine mode.
+    try:
+        batch_max_size = max(1, int(os.getenv("SERVE_LLM_BATCH_MAX_SIZE", "16")))
+    except ValueError:
+        batch_max_size = 16
+    try:
+        batch_wait_timeout_s = max(0.0, float(os.getenv("SERVE_LLM_BATCH_WAIT_MS", "10")) / 1000.0)
+    except ValueError:
+        batch_wait_timeout_s = 0.01
+    
+    enable_prefix_caching = engine_settings["enable_prefix_caching"]
+    
+    # Response cache for deterministic (temperature 0, unseeded) requests.
+    cache_enabled = os.getenv("SERVE_LLM_CACHE", "1") != "0"
+    try:
+        cache_max_entries = max(1, int(os.getenv("SERVE_LLM_CACHE_MAX_ENTRIES", "4096")))
+        cache_max_bytes = max(1, int(os.getenv("SERVE_LLM_CACHE_MAX_MB", "64"))) * 1024 * 1024
+        cache_ttl_s = max(0.0, float(os.getenv("SERVE_LLM_CACHE_TTL_S", "600")))
+    except ValueError:
+        cache_max_entries, cache_max_bytes, cache_ttl_s = 4096, 64 * 1024 * 1024, 600.0
+    
+    # Model registry: every model directory under SERVE_LLM_MODEL_REGISTRY (the
+    # shared model directory by default) can be requested with "model".
+    registry_dir = os.getenv("SERVE_LLM_MODEL_REGISTRY") or os.getenv(
+        "SHARED_DIR", os.path.dirname(engine_settings["model_dir"].rstrip("/"))
+    )
+    try:
+        max_loaded_models = max(1, int(os.getenv("SERVE_LLM_MAX_LOADED_MODELS", "1")))
+        gpu_memory_budget_bytes = int(float(os.getenv("SERVE_LLM_GPU_MEMORY_BUDGET_GB", "0")) * 2**30)
+        model_memory_overhead = max(1.0, float(os.getenv("SERVE_LLM_MODEL_MEMORY_OVERHEAD", "1.5")))
+    except ValueError:
+        max_loaded_models, gpu_memory_budget_bytes, model_memory_overhead = 1, 0, 1.5
+    
+    # Cold start: read weights into page cache before building the engine,
+    # then run warm-up generations so the first real request does not pay
+    # for lazy allocations, kernel selection and CUDA graph replay setup.
+    prefetch_enabled = os.getenv("SERVE_LLM_PREFETCH_WEIGHTS", "1") != "0"
+    try:
+        warmup_requests = max(0, int(os.getenv("SERVE_LLM_WARMUP_REQUESTS", "1")))
+        warmup_tokens = max(1, int(os.getenv("SERVE_LLM_WARMUP_TOKENS", "16")))
+    except ValueError:
+        warmup_requests, warmup_tokens = 1, 16
+    
+    local_model_root = engine_settings["local_model_root"]
+    
+    # Largest number of prompts one /llm/batch request may carry.
+    try:
+        batch_max_prompts = max(1, int(os.getenv("SERVE_LLM_BATCH_MAX_PROMPTS", "256")))
+    except ValueError:
+        batch_max_prompts = 256
+    
+    # Admission control: token budget in flight per replica (0 disables),
+    # bounded wait queue and how long a request may wait in it.
+    try:
+        admission_token_budget = max(0, int(os.getenv("SERVE_LLM_TOKEN_BUDGET", "16384")))
+        admission_max_queue = max(0, int(os.getenv("SERVE_LLM_ADMISSION_QUEUE", "128")))
+        admission_timeout_s = max(0.0, float(os.getenv("SERVE_LLM_ADMISSION_TIMEOUT_S", "30")))
+    except ValueError:
+        admission_token_budget, admission_max_queue, admission_timeout_s = 16384, 128, 30.0
+    
     @serve.deployment(
         name="tinyllama",
-        num_replicas=1,
         ray_actor_options=ray_actor_options
     )
     class TinyLlamaService:
-        """TinyLlama LLM service using vLLM."""
+        """
+        LLM service hosting the models of a registry directory.
         
-        def __init__(self, tensor_parallel=tensor_parallel_size):
-            if not VLLM_AVAILABLE:
-                raise RuntimeError("vLLM is not available. Please install vllm package.")
-            
+        ``MODEL_DIR`` (TinyLlama by default) is loaded at start-up and serves
+        requests without a ``model`` field; other registry models load on
+        first use and are evicted least recently used (see ``ModelRegistry``).
+        """
+        
+        async def __init__(self, tensor_parallel=tensor_parallel_size, engine_mode=LLM_ENGINE_MODE):
+            # Serve awaits an async constructor before the replica reports
+            # ready, so the warm-up below happens before any traffic arrives.
             # Get model path from environment or use default
-            model_path = os.getenv("MODEL_DIR", "/mnt/shared/cluster-llm/TinyLlama-1.1B-Chat-v1.0")
-            tensor_parallel_size = tensor_parallel
+            model_path = os.getenv("MODEL_DIR", DEFAULT_MODEL_DIR)
+            self.tensor_parallel_size = tensor_parallel
+            self.service_name = "TinyLlamaService"
+            self.default_model = os.path.basename(model_path.rstrip("/"))
+            self.cache = ResponseCache(cache_max_entries, cache_max_bytes, cache_ttl_s) if cache_enabled else None
+            if engine_mode not in ("async", "sync"):
+                raise ValueError(f"Unknown SERVE_LLM_ENGINE: {engine_mode} (expected 'async' or 'sync')")
+            self.engine_mode = engine_mode
+            self.batch_stats = {"batches": 0, "requests": 0, "total_wait_ms": 0.0, "max_batch_size": 0}
+            self.metrics = LLMMetrics()
+            self.load_phases = {}
+            self.admission = AdmissionController(
+                admission_token_budget, admission_max_queue, admission_timeout_s, metrics=self.metrics
+            ) if admission_token_budget else None
             
-            print(f"Loading TinyLlama model from: {model_path}")
-            print(f"Tensor parallel size: {tensor_parallel_size}")
+            import_started = time.perf_counter()
+            if USE_STUB_ENGINE:
+                from stub_engine import SamplingParams as StubSamplingParams
+                
+                print(f"Using stub engine instead of vLLM (model label: {model_path})")
+                self.sampling_params_cls = StubSamplingParams
+            else:
+                if not VLLM_AVAILABLE:
+                    raise RuntimeError("vLLM is not available. Please install vllm package.")
+                from vllm import SamplingParams
+                
+                print(f"Tensor parallel size: {self.tensor_parallel_size}")
+                print(f"Engine mode: {engine_mode}")
+                print(f"Prefix caching: {enable_prefix_caching}")
+                self.sampling_params_cls = SamplingParams
+            import_ms = (time.perf_counter() - import_started) * 1000.0
             
-            # Initialize vLLM LLM engine
-            self.llm = LLM(
-                model=model_path,
-                tensor_parallel_size=tensor_parallel_size,
-                trust_remote_code=True
+            self.registry = ModelRegistry(
+                registry_dir,
+                load=self._load_engine,
+                unload=self._unload_engine,
+                extra_models={self.default_model: model_path},
+                max_loaded=max_loaded_models,
+                memory_budget_bytes=gpu_memory_budget_bytes,
+                memory_overhead=model_memory_overhead,
+                metrics=self.metrics,
             )
-            self.service_name = "TinyLlamaService"
+            print(f"Model registry: {registry_dir} ({len(self.registry.available())} models, "
+                  f"max_loaded={max_loaded_models}, budget={gpu_memory_budget_bytes / 2**30:.1f} GiB)")
+            self.registry.preload(self.default_model)
+            
+            warmup_started = time.perf_counter()
+            await self._warm_up(self.default_model)
+            self.startup_phases_ms = {
+                "import": round(import_ms, 1),
+                **self.load_phases[self.default_model],
+                "warmup": round((time.perf_counter() - warmup_started) * 1000.0, 1),
+            }
+            self.metrics.observe_startup(self.startup_phases_ms)
+            print("Startup phases (ms): " + ", ".join(
+                f"{phase}={elapsed:.0f}" for phase, elapsed in self.startup_phases_ms.items()
+            ))
+            if engine_mode == "sync":
+                print(f"Micro-batching: max_batch_size={batch_max_size}, "
+                      f"batch_wait_timeout_s={batch_wait_timeout_s}")
             print(f"{self.service_name} initialized successfully")
         
-        async def __call__(self, request):
-            """Handle HTTP requests for LLM inference."""
-            if hasattr(request, "method") and request.method == "POST":
-                data = await request.json()
-            elif isinstance(request, dict):
-                data = request
-            else:
+        async def _warm_up(self, model_id):
+            """Run SERVE_LLM_WARMUP_REQUESTS concurrent generations on a fresh engine."""
+            if not warmup_requests:
+                return
+            async with self.registry.use(model_id) as model:
+                prompts = [f"Warm-up request {index}: say hello." for index in range(warmup_requests)]
+                params = self.sampling_params_cls(max_tokens=warmup_tokens, temperature=0.0)
+                if self.engine_mode == "sync":
+                    await asyncio.to_thread(model.engine.generate, prompts, sampling_params=params)
+                    return
+                
+                async def generate(prompt):
+                    async for _ in model.engine.generate(prompt, params, uuid.uuid4().hex):
+                        pass
+                
+                await asyncio.gather(*(generate(prompt) for prompt in prompts))
+        
+        def _load_engine(self, model_id, model_path, memory_bytes):
+            """Build the engine for one registry model (runs in a worker thread)."""
+            model_path = node_local_copy(model_path, local_model_root)
+            print(f"Loading model {model_id} from: {model_path}")
+            print(f"Chat template: {'model template' if load_chat_template(model_path) else 'plain role prefixes'}")
+            started = time.perf_counter()
+            if prefetch_enabled:
+                read_bytes = prefetch_weights(model_path)
+                print(f"Prefetched {read_bytes / 2**20:.0f} MiB of weights for {model_id}")
+            weights_loaded = time.perf_counter()
+            engine = self._build_engine(model_path, memory_bytes)
+            self.load_phases[model_id] = {
+                "weight_load": round((weights_loaded - started) * 1000.0, 1),
+                "engine_init": round((time.perf_counter() - weights_loaded) * 1000.0, 1),
+            }
+            return engine
+        
+        def _build_engine(self, model_path, memory_bytes):
+            if USE_STUB_ENGINE:
+                from stub_engine import StubAsyncEngine, StubLLM
+                
+                engine_cls = StubAsyncEngine if self.engine_mode == "async" else StubLLM
+                return engine_cls(model=model_path, enable_prefix_caching=enable_prefix_caching)
+            
+            from vllm import AsyncEngineArgs, AsyncLLMEngine, LLM
+            
+            engine_kwargs = vllm_engine_kwargs(model_path, self.tensor_parallel_size, enable_prefix_caching)
+            if gpu_memory_budget_bytes and memory_bytes:
+                # Give each model only its share of the GPU instead of vLLM's
+                # default 90%, so several registry models fit side by side.
+                import torch
+                total = torch.cuda.get_device_properties(0).total_memory
+                engine_kwargs["gpu_memory_utilization"] = min(0.95, max(0.05, memory_bytes / total))
+            if self.engine_mode == "async":
+                # The async engine keeps generation off the replica's event
+                # loop, so concurrent requests are continuously batched by
+                # vLLM instead of being served one at a time.
+                return AsyncLLMEngine.from_engine_args(AsyncEngineArgs(**engine_kwargs))
+            return LLM(**engine_kwargs)
+        
+        @staticmethod
+        def _unload_engine(engine):
+            """Release an evicted engine and the GPU memory it holds."""
+            shutdown = getattr(engine, "shutdown", None) or getattr(engine, "shutdown_background_loop", None)
+            if callable(shutdown):
+                shutdown()
+            del engine
+            gc.collect()
+            if not USE_STUB_ENGINE:
+                import torch
+                torch.cuda.empty_cache()
+        
+        async def __call__(self, request: ServeRequest):
+            """Handle LLM inference requests forwarded by the ingress."""
+            if request.method != "POST" and request.path.endswith("/stats"):
+                return self.stats()
+            if request.method != "POST" and request.path.endswith("/models"):
+                return {"service": self.service_name, "default_model": self.default_model, **self.registry.stats()}
+            with self.metrics.track("/llm") as outcome, traced_request(request, "tinyllama") as trace:
+                if request.method != "POST":
+                    return outcome.check(attach_trace({
+                        "error": "Send a POST request with 'prompt' or 'messages' field",
+                        "service": self.service_name
+                    }, trace))
+                # Errors and cache hits need no engine work, so only misses are admitted.
+                response, job = self._prepare(request.data)
+                if response is None:
+                    try:
+                        async with self._admit(request):
+                            response = await self._complete(*job)
+                    except Overloaded as e:
+                        response = e.response(self.service_name)
+                return outcome.check(attach_trace(response, trace))
+        
+        def _admit(self, request: ServeRequest):
+            """Admission context for a generation request (a no-op when disabled)."""
+            if self.admission is None or request.method != "POST":
+                return contextlib.nullcontext()
+            return self.admission.admit(estimate_request_tokens(request.data))
+        
+        async def _complete(self, model_id, prompt, sampling_params, cache_key):
+            try:
+                async with self.registry.use(model_id) as model:
+                    return await self._complete_with(model, prompt, sampling_params, cache_key)
+            except (KeyError, MemoryError) as e:
+                return self._model_error(model_id, e)
+        
+        def _prepare(self, data):
+            """
+            Return ``(response, job)`` for an /llm body, without touching the engine.
+            
+            ``response`` is an error or a response-cache hit; otherwise ``job``
+            is ``(model_id, prompt, sampling_params, cache_key)`` for
+            ``_complete()``. The cache is checked before the model is
+            acquired, so a hit never loads a model or evicts the ones in use.
+            """
+            model_id = data.get("model") or self.default_model
+            try:
+                path = self.registry.resolve(model_id)
+            except KeyError as e:
+                return self._model_error(model_id, e), None
+            with trace_span("prompt"):
+                prompt, sampling_params, error = self._parse_request(data, path)
+            if error:
+                return error, None
+            
+            cache_key = None
+            if self._is_cacheable(data, sampling_params):
+                with trace_span("cache"):
+                    cache_key = ResponseCache.make_key(path, prompt, sampling_params)
+                    cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return {
+                        "prompt": prompt,
+                        "response": cached[0],
+                        "usage": cached[1],
+                        "service": self.service_name,
+                        "model": model_id,
+                        "cached": True,
+                    }, None
+            return None, (model_id, prompt, sampling_params, cache_key)
+        
+        async def _complete_with(self, model, prompt, sampling_params, cache_key):
+            try:
+                started = time.perf_counter()
+                first_token_at = None
+                result = {"prompt": prompt, "service": self.service_name, "model": model.model_id}
+                with trace_span("generate", engine=self.engine_mode):
+                    if self.engine_mode == "sync":
+                        final_output, batch_info = await self._generate_batch(
+                            (model.engine, prompt, sampling_params, started)
+                        )
+                        result["batch"] = batch_info
+                    else:
+                        final_output = None
+                        async for output in model.engine.generate(prompt, sampling_params, uuid.uuid4().hex):
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            final_output = output
+                finished_at = time.perf_counter()
+                generated_text = final_output.outputs[0].text if final_output and final_output.outputs else ""
+                result["response"] = generated_text
+                result["usage"] = self._usage(final_output)
+                # The blocking engine returns whole completions: first token = last.
+                self.metrics.observe_generation(
+                    "/llm", started, first_token_at or finished_at, finished_at, result["usage"]
+                )
+                if cache_key is not None:
+                    self.cache.put(cache_key, generated_text, result["usage"])
+                return result
+            except Exception as e:
                 return {
-                    "error": "Send a POST request with 'prompt' or 'messages' field",
+                    "error": str(e),
+                    "error_type": type(e).__name__,
                     "service": self.service_name
                 }
+        
+        def _model_error(self, model_id, error):
+            """Error response for an unknown model or one that can never fit the budget."""
+            if isinstance(error, KeyError):
+                return {
+                    "error": f"Unknown model: {model_id}",
+                    "error_type": "model_not_found",
+                    "available_models": sorted(self.registry.available()),
+                    "service": self.service_name,
+                }
+            return {"error": str(error), "error_type": "model_too_large", "service": self.service_name}
+        
+        async def batch(self, request: ServeRequest):
+            """
+            Generate for many prompts in one call (POST /llm/batch).
+            
+            The body carries ``"prompts"``: prompt strings, or objects with
+            ``"prompt"`` or ``"messages"`` and their own ``max_tokens``,
+            ``temperature``, ``seed`` and ``n``. Top-level values of those
+            fields (and ``"model"``) apply to every item that does not set
+            them. Results come back in input order, each with its ``n``
+            completions and usage; an invalid item gets an error entry
+            without failing the rest of the batch.
+            """
+            with self.metrics.track("/llm/batch") as outcome, traced_request(request, "tinyllama") as trace:
+                try:
+                    async with self._admit(request):
+                        return outcome.check(attach_trace(await self._complete_batch(request), trace))
+                except Overloaded as e:
+                    return outcome.check(attach_trace(e.response(self.service_name), trace))
+        
+        async def _complete_batch(self, request: ServeRequest):
+            items = request.data.get("prompts")
+            if request.method != "POST" or not isinstance(items, list) or not items:
+                return {
+                    "error": "Send a POST request with a non-empty 'prompts' list",
+                    "error_type": "bad_request",
+                    "service": self.service_name,
+                }
+            if len(items) > batch_max_prompts:
+                return {
+                    "error": f"Too many prompts: {len(items)} (limit {batch_max_prompts})",
+                    "error_type": "bad_request",
+                    "service": self.service_name,
+                }
+            model_id = request.data.get("model") or self.default_model
+            try:
+                async with self.registry.use(model_id) as model:
+                    return await self._batch_with(model, request.data)
+            except (KeyError, MemoryError) as e:
+                return self._model_error(model_id, e)
+        
+        async def _batch_with(self, model, data):
+            defaults = {key: data[key] for key in BATCH_SAMPLING_FIELDS if key in data}
+            results = [None] * len(data["prompts"])
+            jobs = []
+            for index, item in enumerate(data["prompts"]):
+                if isinstance(item, str):
+                    item = {"prompt": item}
+                if not isinstance(item, dict):
+                    results[index] = {"index": index, "error": "Each item must be a prompt string or an object",
+                                      "error_type": "bad_request"}
+                    continue
+                with trace_span("prompt", index=index):
+                    prompt, sampling_params, error = self._parse_request(
+                        {**defaults, **item}, model.path, samples=True
+                    )
+                if error:
+                    results[index] = {"index": index, "error": error["error"], "error_type": "bad_request"}
+                else:
+                    jobs.append((index, prompt, sampling_params))
+            
+            started = time.perf_counter()
+            try:
+                with trace_span("generate", engine=self.engine_mode, prompts=len(jobs)):
+                    if not jobs:
+                        outputs = []
+                    elif self.engine_mode == "sync":
+                        # One generate() over the whole list; the Serve
+                        # micro-batcher is for single requests and is bypassed.
+                        outputs = await asyncio.to_thread(
+                            model.engine.generate,
+                            [prompt for _, prompt, _ in jobs],
+                            sampling_params=[params for _, _, params in jobs],
+                        )
+                    else:
+                        # AsyncLLMEngine takes one prompt per call; submitting
+                        # them together lets it schedule them as one
+                        # continuous batch.
+                        outputs = await asyncio.gather(
+                            *(self._final_output(model.engine, prompt, params) for _, prompt, params in jobs),
+                            return_exceptions=True,
+                        )
+            except Exception as e:
+                return {"error": str(e), "error_type": type(e).__name__, "service": self.service_name}
+            finished_at = time.perf_counter()
+            
+            totals = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_prompt_tokens": 0}
+            for (index, prompt, _), output in zip(jobs, outputs):
+                if isinstance(output, Exception):
+                    results[index] = {"index": index, "error": str(output), "error_type": type(output).__name__}
+                    continue
+                usage = self._usage(output)
+                results[index] = {
+                    "index": index,
+                    "prompt": prompt,
+                    "choices": [
+                        {"index": completion.index, "text": completion.text,
+                         "finish_reason": completion.finish_reason}
+                        for completion in output.outputs
+                    ],
+                    "usage": usage,
+                }
+                for key in totals:
+                    totals[key] += usage[key] or 0
+            self.metrics.observe_generation("/llm/batch", started, None, finished_at, totals)
+            return {
+                "results": results,
+                "usage": totals,
+                "service": self.service_name,
+                "model": model.model_id,
+                "total_ms": round((finished_at - started) * 1000.0, 3),
+            }
+        
+        @staticmethod
+        async def _final_output(engine, prompt, sampling_params):
+            final_output = None
+            async for output in engine.generate(prompt, sampling_params, uuid.uuid4().hex):
+                final_output = output
+            return final_output
+        
+        async def stream(self, request: ServeRequest):
+            """
+            Stream generated text as it is produced.
+            
+            Called through a streaming handle (``handle.options(stream=True)``).
+            Yields ``{"token": ...}`` events with the newly generated text and a
+            final ``{"done": True, ...}`` event carrying the full response,
+            time-to-first-token and inter-token latency measured in the replica.
+            """
+            with self.metrics.track("/llm") as outcome, traced_request(request, "tinyllama") as trace:
+                try:
+                    async with self._admit(request):
+                        async for event in self._stream_events(request):
+                            # The final (or error) event carries the spans.
+                            yield outcome.check(event if "token" in event else attach_trace(event, trace))
+                except Overloaded as e:
+                    yield outcome.check(attach_trace(e.response(self.service_name), trace))
+        
+        async def _stream_events(self, request: ServeRequest):
+            model_id = request.data.get("model") or self.default_model
+            try:
+                async with self.registry.use(model_id) as model:
+                    async for event in self._stream_with(model, request.data):
+                        yield event
+            except (KeyError, MemoryError) as e:
+                yield self._model_error(model_id, e)
+        
+        async def _stream_with(self, model, data):
+            with trace_span("prompt"):
+                prompt, sampling_params, error = self._parse_request(data, model.path)
+            if error:
+                yield error
+                return
+            
+            started = time.perf_counter()
+            token_times = []
+            generated_text = ""
+            final_output = None
+            try:
+                with trace_span("generate", engine=self.engine_mode):
+                    if self.engine_mode == "sync":
+                        # The blocking engine only returns whole completions,
+                        # so the stream degrades to a single chunk.
+                        final_output, _ = await self._generate_batch(
+                            (model.engine, prompt, sampling_params, started)
+                        )
+                        generated_text = final_output.outputs[0].text if final_output.outputs else ""
+                        token_times.append(time.perf_counter())
+                        yield {"token": generated_text, "index": 0}
+                    else:
+                        async for output in model.engine.generate(prompt, sampling_params, uuid.uuid4().hex):
+                            final_output = output
+                            text = output.outputs[0].text if output.outputs else ""
+                            delta = text[len(generated_text):]
+                            generated_text = text
+                            if not delta:
+                                continue
+                            token_times.append(time.perf_counter())
+                            yield {"token": delta, "index": len(token_times) - 1}
+            except Exception as e:
+                yield {"error": str(e), "error_type": type(e).__name__, "service": self.service_name}
+                return
+            
+            finished_at = time.perf_counter()
+            self.metrics.observe_generation(
+                "/llm", started, token_times[0] if token_times else None, finished_at, self._usage(final_output)
+            )
+            gaps_ms = [(later - earlier) * 1000.0 for earlier, later in zip(token_times, token_times[1:])]
+            yield {
+                "done": True,
+                "prompt": prompt,
+                "response": generated_text,
+                "service": self.service_name,
+                "model": model.model_id,
+                "ttft_ms": round((token_times[0] - started) * 1000.0, 3) if token_times else None,
+                "itl_ms_mean": round(sum(gaps_ms) / len(gaps_ms), 3) if gaps_ms else None,
+                "itl_ms_max": round(max(gaps_ms), 3) if gaps_ms else None,
+                "total_ms": round((finished_at - started) * 1000.0, 3),
+            }
+        
+        def _parse_request(self, data, model_path, samples=False):
+            """
+            Return ``(prompt, sampling_params, error)`` for a request body.
             
+            ``n`` is honoured only with ``samples=True`` (/llm/batch): single
+            /llm responses carry one completion.
+            """
             # Handle both prompt and messages format (OpenAI-compatible)
             if "messages" in data:
                 # OpenAI chat format
                 messages = data["messages"]
-                prompt = self._messages_to_prompt(messages)
+                try:
+                    prompt = messages_to_prompt(messages, load_chat_template(model_path))
+                except Exception as e:
+                    return None, None, {"error": str(e), "service": self.service_name}
             elif "prompt" in data:
                 prompt = data["prompt"]
             else:
-                return {
+                return None, None, {
                     "error": "Missing 'prompt' or 'messages' field",
                     "service": self.service_name
                 }
             
-            # Generate response
             max_tokens = data.get("max_tokens", 100)
             temperature = data.get("temperature", 0.7)
-            
             try:
-                # Use SamplingParams for vLLM
-                sampling_params = SamplingParams(
+                sampling_params = self.sampling_params_cls(
                     max_tokens=max_tokens,
-                    temperature=temperature
+                    temperature=temperature,
+                    seed=data.get("seed"),
+                    n=data.get("n", 1) if samples else 1
                 )
-                outputs = self.llm.generate([prompt], sampling_params=sampling_params)
-                generated_text = outputs[0].outputs[0].text if outputs else ""
-                
-                return {
-                    "prompt": prompt,
-                    "response": generated_text,
-                    "service": self.service_name
-                }
             except Exception as e:
-                return {
-                    "error": str(e),
-                    "service": self.service_name
-                }
+                return None, None, {"error": str(e), "service": self.service_name}
+            return prompt, sampling_params, None
         
-        def _messages_to_prompt(self, messages):
-            """Convert OpenAI messages format to prompt string."""
-            prompt_parts = []
-            for msg in messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                if role == "system":
-                    prompt_parts.append(f"System: {content}")
-                elif role == "user":
-                    prompt_parts.append(f"User: {content}")
-                elif role == "assistant":
-                    prompt_parts.append(f"Assistant: {content}")
-            return "\n".join(prompt_parts)
+        @staticmethod
+        def _usage(output):
+            """Token usage for a finished request, including prefix-cache hits."""
+            if output is None:
+                return None
+            prompt_tokens = len(output.prompt_token_ids or [])
+            # Every one of the n samples counts towards completion tokens.
+            completion_tokens = sum(len(completion.token_ids) for completion in output.outputs)
+            return {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cached_prompt_tokens": getattr(output, "num_cached_tokens", None),
+            }
+        
+        def _is_cacheable(self, data, sampling_params):
+            """
+            Decide whether a request may use the response cache.
+            
+            Only deterministic requests (temperature 0, no seed) are cached by
+            default. Callers can opt sampled requests in with ``"cache": true``
+            or force a fresh generation with ``"cache": false``.
+            """
+            if self.cache is None:
+                return False
+            opt_in = data.get("cache")
+            if opt_in is not None:
+                return bool(opt_in)
+            return sampling_params.temperature == 0 and getattr(sampling_params, "seed", None) is None
+        
+        def stats(self):
+            """Per-replica cache, batching and admission counters (GET /llm/stats)."""
+            return {
+                "service": self.service_name,
+                "cache": self.cache.stats() if self.cache is not None else None,
+                "batch": dict(self.batch_stats),
+                "admission": self.admission.stats() if self.admission is not None else None,
+                "models": self.registry.stats(),
+                "startup_ms": self.startup_phases_ms,
+                "prefix_cache": self.metrics.prefix_cache_stats(),
+            }
+        
+        async def record_routing_stats(self):
+            """Polled by Serve; PrefixAffinityRouter reports it per replica."""
+            return {"prefix_cache": self.metrics.prefix_cache_stats()}
+        
+        @serve.batch(max_batch_size=batch_max_size, batch_wait_timeout_s=batch_wait_timeout_s)
+        async def _generate_batch(self, jobs):
+            """
+            Run one blocking ``generate()`` over every request gathered by Serve.
+            
+            Each job is ``(engine, prompt, sampling_params, enqueued_at)``; each
+            caller gets back only its own ``(request_output, batch_info)`` tuple.
+            Jobs for different registry models are grouped into one
+            ``generate()`` per engine. The engine calls run in a worker thread
+            so the event loop keeps accepting (and batching) new requests while
+            the GPU is busy.
+            """
+            batch_started = time.perf_counter()
+            groups = {}
+            for position, (engine, prompt, sampling_params, _) in enumerate(jobs):
+                group = groups.setdefault(id(engine), (engine, [], [], []))
+                group[1].append(position)
+                group[2].append(prompt)
+                group[3].append(sampling_params)
+            outputs = [None] * len(jobs)
+            for engine, positions, prompts, params in groups.values():
+                results = await asyncio.to_thread(engine.generate, prompts, sampling_params=params)
+                for position, output in zip(positions, results):
+                    outputs[position] = output
+            
+            wait_ms = [(batch_started - enqueued_at) * 1000.0 for _, _, _, enqueued_at in jobs]
+            self.batch_stats["batches"] += 1
+            self.batch_stats["requests"] += len(jobs)
+            self.batch_stats["total_wait_ms"] += sum(wait_ms)
+            self.batch_stats["max_batch_size"] = max(self.batch_stats["max_batch_size"], len(jobs))
+            if self.batch_stats["batches"] % 100 == 0:
+                stats = self.batch_stats
+                print(f"[{self.service_name}] {stats['batches']} batches, "
+                      f"avg size {stats['requests'] / stats['batches']:.1f}, "
+                      f"avg wait {stats['total_wait_ms'] / stats['requests']:.1f} ms")
+            
+            return [
+                (output, {"size": len(jobs), "wait_ms": round(waited, 3)})
+                for output, waited in zip(outputs, wait_ms)
+            ]
     
     return TinyLlamaService
 
@@ -197,67 +2755,378 @@ def create_tinyllama_deployment():
 # Create an ingress deployment that routes to different services
 @serve.deployment
 class Ingress:
-    def __init__(self, echo_handle, calc_handle, llm_handle=None):
+    def __init__(self, echo_handle, calc_handle, llm_handle=None, fair_share=None, tracing=None):
         self.echo_handle = echo_handle
         self.calc_handle = calc_handle
         self.llm_handle = llm_handle
+        self.metrics = IngressMetrics()
+        # Per-request phase tracing (see Tracer and load_trace_settings()).
+        self.tracer = Tracer(**(tracing or {}))
+        
+        # Per-tenant fair-share scheduling of /llm generations (see
+        # load_fair_share_settings()); disabled without settings or a budget.
+        self.fair_share = fair_share
+        self.scheduler = None
+        if fair_share and fair_share["token_budget"] > 0:
+            self.scheduler = FairShareScheduler(
+                fair_share["token_budget"],
+                quantum=fair_share["quantum"],
+                max_queue=fair_share["max_queue"],
+                queue_timeout_s=fair_share["queue_timeout_s"],
+                metrics=self.metrics,
+            )
+        
+        # Route table: exact path or first path segment -> (handle, streaming
+        # handle). The handles are configured once here rather than on every
+        # request.
+        # A ``None`` handle marks a known route whose service is not deployed.
+        self.routes = {
+            "/echo": (echo_handle, None),
+            "/echo/raw": (echo_handle, None),
+            "/echo/stream": (None, echo_handle.options(stream=True, method_name="stream")),
+            "/calc": (calc_handle, None),
+            "/calc/batch": (calc_handle.options(method_name="batch"), None),
+            "/llm": (
+                llm_handle,
+                llm_handle.options(stream=True, method_name="stream") if llm_handle else None,
+            ),
+            "/llm/batch": (llm_handle.options(method_name="batch") if llm_handle else None, None),
+        }
     
     async def __call__(self, request):
         path = request.url.path.rstrip("/")
+        prefix = "/" + path.split("/", 2)[1] if path else ""
+        
+        # Label metrics with the matched route, never the raw path, so
+        # arbitrary URLs cannot blow up the number of series.
+        route_key = path if path in self.routes else prefix if prefix in self.routes else None
+        if route_key is None:
+            with self.metrics.track("/"):
+                return {
+                    "message": "Ray Serve Application",
+                    "available_endpoints": {
+                        "/echo": "Echo service - POST with {'message': 'text'}; POST raw bytes to /echo/raw, or to /echo/stream?chunk_size=N to get them back in chunks",
+                        "/calc": "Calculator service - POST with {'operation': 'add|subtract|multiply|divide', 'a': number, 'b': number}",
+                        "/calc/batch": "Vectorized calculator - POST with {'operation': name or [names], 'a': [numbers], 'b': [numbers]}",
+                        "/llm": "TinyLlama LLM service - POST with {'prompt': 'text', 'max_tokens': number, 'stream': bool, 'model': registry id}; GET /llm/models, /llm/stats, /llm/tenants, /llm/routing",
+                        "/llm/batch": "Multi-prompt generation - POST with {'prompts': ['text' or {'prompt'|'messages', 'max_tokens', 'temperature', 'seed', 'n'}], plus defaults for those fields}"
+                    }
+                }
+        handle, stream_handle = self.routes[route_key]
+        if route_key in ("/echo/raw", "/echo/stream"):
+            return await self._echo_bytes(request, route_key, handle, stream_handle)
+        if path == "/llm/tenants":
+            with self.metrics.track(route_key):
+                return self.scheduler.stats() if self.scheduler is not None else {"fair_share": None}
+        if path == "/llm/routing":
+            with self.metrics.track(route_key):
+                return PrefixAffinityRouter.combined_stats()
+        
+        trace = self.tracer.start(request.headers)
+        if trace is not None:
+            trace.start(f"{request.method} {route_key}", SPAN_KIND_SERVER, route=route_key)
         
-        # Extract request data if it's a POST request
-        if hasattr(request, "method") and request.method == "POST":
+        # Decode the body once; downstream services get the parsed dict.
+        data = {}
+        with trace_span("parse", trace):
+            if request.method == "POST":
+                data = parse_json_object(await request.body())
+        serve_request = ServeRequest(path=path, method=request.method, data=data)
+        
+        # Generations wait for their tenant's fair share of the token budget;
+        # the slot is held until the response (or the whole stream) is done.
+        slot = contextlib.AsyncExitStack()
+        grant = None
+        if (self.scheduler is not None and path in ("/llm", "/llm/batch") and request.method == "POST"
+                and handle is not None):
+            tenant, priority, weight = identify_tenant(request.headers, self.fair_share)
             try:
-                data = await request.json()
-            except:
-                data = {}
-        else:
-            data = {}
+                with trace_span("fair_share", trace, tenant=tenant, priority=priority):
+                    grant = await slot.enter_async_context(
+                        self.scheduler.slot(tenant, priority, weight, estimate_request_tokens(data))
+                    )
+            except Overloaded as e:
+                with self.metrics.track(route_key) as outcome:
+                    return self._respond(outcome.check(e.response("ingress")), trace)
         
-        if path == "/echo" or path.startswith("/echo/"):
-            # Forward the request to echo service
-            result = await self.echo_handle.remote(data if data else request)
-            return result
-        elif path == "/calc" or path.startswith("/calc/"):
-            # Forward the request to calculator service
-            result = await self.calc_handle.remote(data if data else request)
+        if trace is not None:
+            # The downstream service continues the trace under this span.
+            trace.start("handle", SPAN_KIND_CLIENT, route=route_key)
+            serve_request.trace = trace.context()
+        if stream_handle is not None and data.get("stream"):
+            # Wait for the first event before answering, so an admission
+            # rejection becomes a real 429/503 instead of a 200 event stream.
+            try:
+                events = stream_handle.remote(serve_request)
+                first_event, events = await self._first_event(events)
+            except BaseException:
+                # Cancelled (the client went away) before the stream started.
+                await slot.aclose()
+                raise
+            if self._http_status(first_event):
+                await slot.aclose()
+                with self.metrics.track(route_key) as outcome:
+                    return self._respond(outcome.check(first_event), trace)
+            # _stream releases the slot when it ends; the background task covers
+            # a stream Starlette never starts. Closing the slot twice is a no-op.
+            return StreamingResponse(
+                self._stream(events, first_event, route_key, slot, grant, trace),
+                media_type="text/event-stream",
+                background=BackgroundTask(slot.aclose),
+            )
+        async with slot:
+            with self.metrics.track(route_key) as outcome:
+                if handle is None:
+                    outcome.error_type = "service_unavailable"
+                    return self._respond({"error": f"{prefix[1:].upper()} service not available"}, trace)
+                try:
+                    result = await handle.remote(serve_request)
+                except BackPressureError as e:
+                    result = self._backpressure_error(e)
+                if grant is not None and isinstance(result, dict) and result.get("usage"):
+                    grant.tokens = result["usage"]["completion_tokens"]
+                return self._respond(outcome.check(result), trace)
+    
+    async def _echo_bytes(self, request, route_key, handle, stream_handle):
+        """Raw echo: pass the body to EchoService undecoded and return its bytes."""
+        body = await request.body() if request.method == "POST" else b""
+        serve_request = ServeRequest(path=route_key, method=request.method,
+                                     data=dict(request.query_params), body=body)
+        if stream_handle is not None:
+            return StreamingResponse(
+                self._relay_bytes(stream_handle.remote(serve_request), route_key),
+                media_type="application/octet-stream",
+            )
+        with self.metrics.track(route_key):
+            return Response(await handle.remote(serve_request), media_type="application/octet-stream")
+    
+    async def _relay_bytes(self, chunks, route_key):
+        with self.metrics.track(route_key):
+            async for chunk in chunks:
+                yield chunk
+    
+    @staticmethod
+    def _backpressure_error(error):
+        """Serve's own queue in front of the replicas is full (max_queued_requests)."""
+        return {"error": str(error), "error_type": "backpressure", "status_code": 503, "retry_after_s": 1}
+    
+    @staticmethod
+    def _http_status(result):
+        return result.get("status_code") if isinstance(result, dict) else None
+    
+    def _error_response(self, result):
+        """Send service errors that carry an HTTP status (rejections) with that status."""
+        status = self._http_status(result)
+        if not status:
             return result
-        elif path == "/llm" or path.startswith("/llm/"):
-            if self.llm_handle:
-                result = await self.llm_handle.remote(data if data else request)
-                return result
-            else:
-                return {"error": "LLM service not available"}
-        else:
-            return {
-                "message": "Ray Serve Application",
-                "available_endpoints": {
-                    "/echo": "Echo service - POST with {'message': 'text'}",
-                    "/calc": "Calculator service - POST with {'operation': 'add|subtract|multiply|divide', 'a': number, 'b': number}",
-                    "/llm": "TinyLlama LLM service - POST with {'prompt': 'text', 'max_tokens': number}"
-                }
-            }
+        headers = {"Retry-After": str(result["retry_after_s"])} if result.get("retry_after_s") else None
+        return JSONResponse(result, status_code=status, headers=headers)
+    
+    def _respond(self, result, trace=None):
+        """
+        ``_error_response()`` for a traced request: finish and export the trace.
+        
+        The spans a service sent back in ``"trace"`` are merged first. When
+        the client asked for timings (X-Request-Timing), the response gets a
+        ``Server-Timing`` header and a ``"timing"`` field.
+        """
+        if trace is None:
+            return self._error_response(result)
+        if isinstance(result, dict):
+            trace.merge(result.pop("trace", None))
+        trace.finish()
+        self.tracer.export(trace)
+        if not trace.timing:
+            return self._error_response(result)
+        if isinstance(result, dict):
+            result = {**result, "timing": trace.summary()}
+        response = self._error_response(result)
+        if not isinstance(response, JSONResponse):
+            response = JSONResponse(response)
+        response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    
+    async def _first_event(self, events):
+        """Return ``(first event, remaining events)``; failures become an error event."""
+        try:
+            return await events.__anext__(), events
+        except StopAsyncIteration:
+            return None, None
+        except BackPressureError as e:
+            return self._backpressure_error(e), None
+        except Exception as e:
+            return {"error": str(e), "error_type": type(e).__name__}, None
+    
+    async def _stream(self, events, first_event, route_key, slot, grant, trace=None):
+        """
+        Relay a service's event stream to the client as Server-Sent Events.
+        
+        ``slot`` holds the request's fair-share grant (if any) and is closed
+        when the stream ends or the client disconnects. A traced stream ends
+        at the service's final event, which gets the ``"timing"`` field when
+        the client asked for it.
+        """
+        async with slot:
+            with self.metrics.track(route_key) as outcome:
+                try:
+                    if first_event is not None:
+                        yield self._event(outcome.check(first_event), grant, trace)
+                    if events is not None:
+                        async for event in events:
+                            yield self._event(outcome.check(event), grant, trace)
+                except Exception as e:
+                    outcome.error_type = type(e).__name__
+                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                finally:
+                    if trace is not None and not trace.finished:
+                        trace.finish()
+                        self.tracer.export(trace)
+                yield "data: [DONE]\n\n"
+    
+    def _event(self, event, grant, trace=None):
+        if grant is not None and isinstance(event, dict) and "token" in event:
+            grant.tokens += 1
+        if trace is not None and isinstance(event, dict) and "trace" in event:
+            trace.merge(event.pop("trace"))
+            trace.finish()
+            self.tracer.export(trace)
+            if trace.timing:
+                event["timing"] = trace.summary()
+        return f"data: {json.dumps(event)}\n\n"
 
 """
 Environment flags:
 - SERVE_ENABLE_TINYLLAMA: if set to "0", skip deploying the TinyLlama service
   so the app can be deployed alongside an external vLLM server that already
   occupies the GPUs. Default: "1" (deploy when vLLM is installed).
+- SERVE_LLM_STUB: if set to "1", deploy TinyLlama on the CPU-only stub engine
+  (see stub_engine.py) instead of vLLM. SERVE_LLM_STUB_TOKEN_LATENCY_MS sets
+  the simulated per-token latency, SERVE_LLM_STUB_PREFILL_MS_PER_TOKEN the
+  prompt cost, SERVE_LLM_STUB_MAX_CONCURRENCY the number of sequences decoded
+  at once (0 = unlimited) and SERVE_LLM_STUB_NATURAL_TOKENS the typical answer
+  length before the stub stops on its own (0 = always max_tokens).
+  Default: "0".
+- SERVE_LLM_MODEL_REGISTRY: directory whose model subdirectories (those with
+  a config.json) /llm serves by name via the "model" field; default
+  SHARED_DIR. MODEL_DIR is preloaded and used when "model" is omitted; others
+  load on first use. Least recently used idle models are evicted to stay
+  within SERVE_LLM_MAX_LOADED_MODELS (default 1) and, if set,
+  SERVE_LLM_GPU_MEMORY_BUDGET_GB (weights x SERVE_LLM_MODEL_MEMORY_OVERHEAD,
+  default 1.5). GET /llm/models lists available and loaded models.
+- SERVE_LLM_PREFETCH_WEIGHTS: read weight files into page cache before
+  building an engine, so weight I/O is timed apart from engine init. Default
+  "1". SERVE_LLM_WARMUP_REQUESTS (default 1, 0 disables) concurrent warm-up
+  generations of SERVE_LLM_WARMUP_TOKENS (default 16) run before a replica
+  reports ready. Startup phases (import, weight_load, engine_init, warmup)
+  are logged, exported and shown in GET /llm/stats.
+- SERVE_LLM_TOKEN_BUDGET: admission control per TinyLlama replica. A request
+  costs its estimated prompt tokens plus max_tokens; requests run while the
+  tokens in flight fit the budget (default 16384, 0 disables) and wait in a
+  FIFO queue otherwise. Once SERVE_LLM_ADMISSION_QUEUE (default 128) requests
+  are waiting, new ones get 429; requests queued longer than
+  SERVE_LLM_ADMISSION_TIMEOUT_S (default 30) get 503. Both carry Retry-After.
+  Response-cache hits are served without admission.
+  The tinyllama deployment's max_queued_requests (default 128) bounds Serve's
+  own queue in front of the replicas; overflowing it also returns 503.
+- SERVE_FAIR_SHARE_TOKEN_BUDGET: per-tenant fair-share scheduling of /llm
+  generations in each ingress replica (default 16384 estimated tokens in
+  flight, 0 disables). Requests beyond the budget queue per tenant and are
+  dispatched by deficit round robin in tokens (SERVE_FAIR_SHARE_QUANTUM,
+  default 512, times the tenant weight per turn), interactive before batch.
+  Queue bounds: SERVE_FAIR_SHARE_QUEUE (default 1024, then 429) and
+  SERVE_FAIR_SHARE_TIMEOUT_S (default 60, then 503). Tenants come from
+  X-API-Key / Authorization: Bearer keys or the X-Tenant header, with weights
+  and classes from the JSON/YAML file named by SERVE_TENANT_CONFIG (see
+  load_fair_share_settings()); X-Priority: batch demotes a request. Per-tenant
+  latency and throughput are exported and served at GET /llm/tenants.
+- SERVE_LLM_LOCAL_MODEL_ROOT: node-local directory holding model copies made
+  by scripts/helpers/replicate_model.py; a replica loads <root>/<model name>
+  instead of the shared copy when its node has a complete one. Default
+  MODEL_LOCAL_ROOT (unset: always read from shared storage).
+- SERVE_LLM_ENGINE: "async" (default) uses vLLM's AsyncLLMEngine; "sync" uses
+  the blocking LLM engine behind a micro-batching layer configured by
+  SERVE_LLM_BATCH_MAX_SIZE (default 16) and SERVE_LLM_BATCH_WAIT_MS
+  (default 10). Each /llm response then carries its batch size and wait time.
+- SERVE_LLM_BATCH_MAX_PROMPTS: most prompts accepted by one POST /llm/batch
+  (default 256). /llm/batch runs a list of prompts or conversations, each with
+  optional sampling fields and n > 1, through one engine call and returns the
+  results in order with per-item usage.
+- SERVE_LLM_CACHE: per-replica response cache for temperature-0, unseeded /llm
+  requests (requests opt in or out with "cache": true/false). Bounded by
+  SERVE_LLM_CACHE_MAX_ENTRIES (default 4096), SERVE_LLM_CACHE_MAX_MB
+  (default 64) and SERVE_LLM_CACHE_TTL_S (default 600). Set to "0" to disable.
+  Hit/miss counters are served at GET /llm/stats.
+- SERVE_LLM_PREFIX_CACHING: enable vLLM automatic prefix caching so shared
+  system prompts and multi-turn histories reuse KV blocks. Default: "1".
+  Chat messages are rendered with the model's own chat template (compiled once
+  per model from tokenizer_config.json) so prompt prefixes stay stable.
+- SERVE_LLM_PREFIX_ROUTING: route /llm requests to tinyllama replicas by a
+  consistent hash of their normalized prompt prefix (the first
+  SERVE_LLM_PREFIX_ROUTING_CHARS characters, default 256), so requests that
+  share a system prompt or conversation hit the replica whose prefix cache
+  holds it. A replica more than SERVE_LLM_PREFIX_ROUTING_IMBALANCE (default 8)
+  in-flight requests busier than the least loaded one is skipped. Decisions,
+  load imbalance and per-replica prefix-cache hit rates are served at
+  GET /llm/routing. Default: "1"; set to "0" for Serve's default routing.
+- SERVE_TRACE_SAMPLE_RATE: fraction of requests traced end to end (default 0).
+  A traced request records spans for the ingress JSON parse, fair-share wait
+  and handle call, and in the replica for its queueing, prompt building,
+  cache lookup, admission, model acquisition and generation. Requests with
+  X-Request-Timing: 1 or a sampled W3C traceparent header are always traced;
+  the former get the phases back in a Server-Timing header and a "timing"
+  field (the final event of a stream). SERVE_TRACE_FILE names an OTLP/JSON
+  lines file that every finished trace is appended to (default: no export).
+- SERVE_ECHO_DIRECT: if set to "1", deploy_serve.py also runs EchoService as
+  its own application at /echo-direct, so transport benchmarks can compare
+  the direct replica path with the path through the ingress. Default: "0".
+- SERVE_DEPLOYMENT_CONFIG: optional JSON/YAML file mapping deployment names
+  (ingress, echo_service, calculator, tinyllama) to scaling settings:
+  min_replicas, max_replicas, target_ongoing_requests, upscale_delay_s,
+  downscale_delay_s and max_ongoing_requests. Individual settings can also be
+  overridden with SERVE_<DEPLOYMENT>_<SETTING>, e.g. SERVE_TINYLLAMA_MAX_REPLICAS.
+  Deployments with min_replicas < max_replicas autoscale on ongoing requests.
 """
 
-# Create bound deployments
-echo_service = EchoService.bind()
-calculator = Calculator.bind()
+def prefix_routing_options():
+    """``Deployment.options()`` kwargs that route tinyllama by prompt prefix."""
+    if os.getenv("SERVE_LLM_PREFIX_ROUTING", "1") == "0":
+        return {}
+    return {
+        "request_router_config": RequestRouterConfig(
+            request_router_class=PrefixAffinityRouter,
+            request_router_kwargs={
+                "prefix_chars": int(os.getenv("SERVE_LLM_PREFIX_ROUTING_CHARS", "256")),
+                "imbalance_threshold": int(os.getenv("SERVE_LLM_PREFIX_ROUTING_IMBALANCE", "8")),
+            },
+            request_routing_stats_period_s=5,
+        ),
+    }
+
+
+# Create bound deployments with their scaling settings applied
+deployment_settings = load_deployment_settings()
+fair_share_settings = load_fair_share_settings()
+trace_settings = load_trace_settings()
+echo_service = EchoService.options(**deployment_options("echo_service", deployment_settings)).bind()
+# The same echo service as its own application, reached without the ingress
+# (deploy_serve.py runs it at /echo-direct with SERVE_ECHO_DIRECT=1).
+echo_direct_app = EchoService.options(**deployment_options("echo_service", deployment_settings)).bind()
+calculator = Calculator.options(**deployment_options("calculator", deployment_settings)).bind()
+ingress = Ingress.options(**deployment_options("ingress", deployment_settings))
 
 # Only include TinyLlama if enabled AND vLLM is available
 enable_tinyllama = os.getenv("SERVE_ENABLE_TINYLLAMA", "1") != "0"
-if enable_tinyllama and VLLM_AVAILABLE:
+if enable_tinyllama and (VLLM_AVAILABLE or USE_STUB_ENGINE):
     TinyLlamaService = create_tinyllama_deployment()
-    tinyllama_service = TinyLlamaService.bind()
-    app = Ingress.bind(echo_service, calculator, tinyllama_service)
+    tinyllama_service = TinyLlamaService.options(
+        **deployment_options("tinyllama", deployment_settings), **prefix_routing_options()
+    ).bind()
+    app = ingress.bind(
+        echo_service, calculator, tinyllama_service, fair_share=fair_share_settings, tracing=trace_settings
+    )
     print("TinyLlama service will be deployed")
 else:
-    app = Ingress.bind(echo_service, calculator, None)
+    app = ingress.bind(echo_service, calculator, None, tracing=trace_settings)
     if not enable_tinyllama:
         print("TinyLlama service disabled by SERVE_ENABLE_TINYLLAMA=0")
     else:
@@ -0,0 +1,323 @@
+"""
+CPU-only stand-in for vLLM's async engine.
+
+The stub mimics the parts of ``vllm.AsyncLLMEngine`` that ``serve_app.py``
+relies on (``generate()`` yielding cumulative ``RequestOutput``-like objects)
+and simulates per-token latency with ``asyncio.sleep``. Because it never blocks
+the event loop, many requests can be in flight inside one replica, which makes
+the concurrency behaviour of the Serve deployment testable without a GPU.
+
+Prompt processing (prefill) is charged per uncached prompt token. With
+``enable_prefix_caching`` the stubs keep a block-level prefix cache modelled on
+vLLM's automatic prefix caching, so shared system prompts and multi-turn
+histories skip part of the prefill just like they do on a GPU.
+
+``StubLLM`` is the blocking counterpart of ``vllm.LLM``: ``generate()`` takes
+a list of prompts and sleeps for one decode pass over the whole batch, which is
+how the micro-batched ``SERVE_LLM_ENGINE=sync`` mode behaves on a GPU.
+
+Enable it for the Serve deployment with ``SERVE_LLM_STUB=1``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Sequence, Tuple, Union
+
+# Small fixed vocabulary so generated text looks like words and stays stable
+# across runs for the same prompt.
+_VOCAB = (
+    "the", "a", "model", "ray", "serve", "token", "cluster", "node", "gpu",
+    "batch", "prompt", "reply", "fast", "small", "stream", "engine", "cache",
+    "request", "latency", "queue", "island", "java", "bali", "hello", "world",
+)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into rough tokens (words and punctuation)."""
+    return _TOKEN_PATTERN.findall(text or "")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count used by the stub (words and punctuation)."""
+    return len(tokenize(text))
+
+
+@dataclass
+class SamplingParams:
+    """Subset of ``vllm.SamplingParams`` understood by the stub engine."""
+
+    max_tokens: int = 16
+    temperature: float = 1.0
+    seed: Optional[int] = None
+    ignore_eos: bool = False
+    n: int = 1
+
+
+@dataclass
+class CompletionOutput:
+    index: int
+    text: str
+    token_ids: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class RequestOutput:
+    request_id: str
+    prompt: str
+    prompt_token_ids: List[int]
+    outputs: List[CompletionOutput]
+    finished: bool = False
+    num_cached_tokens: int = 0
+
+
+def _default_token_latency() -> float:
+    return float(os.getenv("SERVE_LLM_STUB_TOKEN_LATENCY_MS", "20")) / 1000.0
+
+
+def _default_prefill_latency() -> float:
+    return float(os.getenv("SERVE_LLM_STUB_PREFILL_MS_PER_TOKEN", "0.1")) / 1000.0
+
+
+class PrefixCache:
+    """
+    Block-level prompt prefix cache.
+
+    Prompts are split into fixed-size token blocks; each block is identified by
+    a hash chained over every block before it, so a block only matches when
+    the whole prefix up to it matches. Least-recently-used blocks are evicted
+    once ``max_blocks`` is exceeded.
+    """
+
+    def __init__(self, block_size: int = 16, max_blocks: int = 8192):
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self._blocks: "OrderedDict[str, None]" = OrderedDict()
+        self.queried_tokens = 0
+        self.hit_tokens = 0
+
+    def match_and_insert(self, tokens: List[str]) -> int:
+        """Return how many leading tokens were cached, then cache all full blocks."""
+        cached_tokens = 0
+        matching = True
+        parent = ""
+        full_blocks = len(tokens) // self.block_size
+        for block in range(full_blocks):
+            chunk = tokens[block * self.block_size:(block + 1) * self.block_size]
+            block_hash = hashlib.sha1((parent + "\x00" + "\x00".join(chunk)).encode("utf-8")).hexdigest()
+            if matching and block_hash in self._blocks:
+                cached_tokens += self.block_size
+                self._blocks.move_to_end(block_hash)
+            else:
+                matching = False
+                self._blocks[block_hash] = None
+            parent = block_hash
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        self.queried_tokens += len(tokens)
+        self.hit_tokens += cached_tokens
+        return cached_tokens
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hit_tokens / self.queried_tokens if self.queried_tokens else 0.0
+
+
+def sample_tokens(
+    prompt: str, sampling_params: SamplingParams, natural_tokens: int = 0, index: int = 0
+) -> List[int]:
+    """
+    Deterministically pick vocabulary ids for ``prompt``.
+
+    Generates ``max_tokens`` ids, or fewer when ``natural_tokens`` is set: the
+    stub then "emits EOS" somewhere between half and all of ``natural_tokens``
+    unless ``ignore_eos`` is requested, like a real model answering briefly.
+    ``index`` selects one of the ``n`` samples of a request.
+    """
+    seed_material = f"{prompt}|{sampling_params.temperature}|{sampling_params.seed}"
+    if index:
+        seed_material += f"|{index}"
+    digest = hashlib.sha256(seed_material.encode("utf-8")).digest()
+    length = max(1, int(sampling_params.max_tokens or 1))
+    if natural_tokens > 0 and not sampling_params.ignore_eos:
+        shortest = max(1, natural_tokens // 2)
+        length = min(length, shortest + digest[-1] % (natural_tokens - shortest + 1))
+    return [digest[step % len(digest)] % len(_VOCAB) for step in range(length)]
+
+
+def detokenize(token_ids: List[int]) -> str:
+    return " ".join(_VOCAB[token_id] for token_id in token_ids)
+
+
+def sample_all(prompt: str, sampling_params: SamplingParams, natural_tokens: int = 0) -> List[List[int]]:
+    """Token ids of each of the request's ``n`` samples."""
+    return [
+        sample_tokens(prompt, sampling_params, natural_tokens, index)
+        for index in range(max(1, int(sampling_params.n or 1)))
+    ]
+
+
+def _request_output(
+    request_id: str,
+    prompt: str,
+    samples: List[List[int]],
+    finished: bool,
+    num_cached_tokens: int = 0,
+    max_tokens: Optional[int] = None,
+) -> RequestOutput:
+    return RequestOutput(
+        request_id=request_id,
+        prompt=prompt,
+        prompt_token_ids=list(range(count_tokens(prompt))),
+        outputs=[
+            CompletionOutput(
+                index=index,
+                text=detokenize(token_ids),
+                token_ids=list(token_ids),
+                finish_reason=_finish_reason(finished, len(token_ids), max_tokens),
+            )
+            for index, token_ids in enumerate(samples)
+        ],
+        finished=finished,
+        num_cached_tokens=num_cached_tokens,
+    )
+
+
+def _finish_reason(finished: bool, generated: int, max_tokens: Optional[int]) -> Optional[str]:
+    if not finished:
+        return None
+    return "stop" if max_tokens is not None and generated < max_tokens else "length"
+
+
+class _StubEngineBase:
+    """
+    Latency model and prefix cache shared by both stub engines.
+
+    Defaults come from the ``SERVE_LLM_STUB_*`` environment variables so the
+    Serve stub and ``scripts/helpers/mock_vllm_server.py`` share one set of
+    knobs: per-token decode latency, per-token prefill cost, the maximum number
+    of sequences running at once (0 = unlimited) and the natural answer length
+    (0 = always generate ``max_tokens``).
+    """
+
+    def __init__(
+        self,
+        model: str = "stub",
+        token_latency_s: Optional[float] = None,
+        prefill_latency_s: Optional[float] = None,
+        enable_prefix_caching: bool = False,
+        max_concurrency: Optional[int] = None,
+        natural_tokens: Optional[int] = None,
+    ):
+        if token_latency_s is None:
+            token_latency_s = _default_token_latency()
+        if prefill_latency_s is None:
+            prefill_latency_s = _default_prefill_latency()
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("SERVE_LLM_STUB_MAX_CONCURRENCY", "0"))
+        if natural_tokens is None:
+            natural_tokens = int(os.getenv("SERVE_LLM_STUB_NATURAL_TOKENS", "0"))
+        self.model = model
+        self.token_latency_s = max(0.0, token_latency_s)
+        self.prefill_latency_s = max(0.0, prefill_latency_s)
+        self.prefix_cache = PrefixCache() if enable_prefix_caching else None
+        self.max_concurrency = max(0, max_concurrency)
+        self.natural_tokens = max(0, natural_tokens)
+        self.running = 0
+        self.waiting = 0
+
+    def _prefill(self, prompt: str) -> Tuple[float, int]:
+        """Return ``(prefill_seconds, cached_tokens)`` for ``prompt``."""
+        tokens = tokenize(prompt)
+        cached = self.prefix_cache.match_and_insert(tokens) if self.prefix_cache else 0
+        return (len(tokens) - cached) * self.prefill_latency_s, cached
+
+
+class StubAsyncEngine(_StubEngineBase):
+    """Async engine that fakes generation with a fixed per-token latency."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slots = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+
+    async def generate(
+        self, prompt: str, sampling_params: SamplingParams, request_id: str
+    ) -> AsyncIterator[RequestOutput]:
+        """Yield cumulative outputs, one new token per step, like vLLM does."""
+        if self._slots is not None:
+            # Beyond max_concurrency, sequences wait for a free slot (queueing).
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+        self.running += 1
+        try:
+            samples = sample_all(prompt, sampling_params, self.natural_tokens)
+            steps = max(len(token_ids) for token_ids in samples)
+            prefill_s, cached = self._prefill(prompt)
+            await asyncio.sleep(prefill_s)
+            # The n samples of a request decode side by side, one token per step.
+            for step in range(steps):
+                await asyncio.sleep(self.token_latency_s)
+                yield _request_output(
+                    request_id,
+                    prompt,
+                    [token_ids[: step + 1] for token_ids in samples],
+                    finished=step == steps - 1,
+                    num_cached_tokens=cached,
+                    max_tokens=sampling_params.max_tokens,
+                )
+        finally:
+            self.running -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+
+class StubLLM(_StubEngineBase):
+    """Blocking engine with the list-of-prompts ``generate()`` of ``vllm.LLM``."""
+
+    def generate(
+        self,
+        prompts: List[str],
+        sampling_params: Union[SamplingParams, Sequence[SamplingParams]],
+    ) -> List[RequestOutput]:
+        """Generate for every prompt in one simulated batched decode pass."""
+        if isinstance(sampling_params, SamplingParams):
+            sampling_params = [sampling_params] * len(prompts)
+        sample_lists = [
+            sample_all(prompt, params, self.natural_tokens)
+            for prompt, params in zip(prompts, sampling_params)
+        ]
+        prefills = [self._prefill(prompt) for prompt in prompts]
+        # Prefill work adds up across the batch; decoding runs in lockstep, so
+        # each wave of at most max_concurrency sequences (n per request) costs
+        # as much as its longest member.
+        sequences = [tokens for samples in sample_lists for tokens in samples]
+        wave = self.max_concurrency or max(1, len(sequences))
+        decode_steps = sum(
+            max((len(tokens) for tokens in sequences[start:start + wave]), default=0)
+            for start in range(0, len(sequences), wave)
+        )
+        time.sleep(sum(seconds for seconds, _ in prefills) + decode_steps * self.token_latency_s)
+        return [
+            _request_output(
+                uuid.uuid4().hex,
+                prompt,
+                samples,
+                finished=True,
+                num_cached_tokens=cached,
+                max_tokens=params.max_tokens,
+            )
+            for prompt, samples, (_, cached), params in zip(prompts, sample_lists, prefills, sampling_params)
+        ]
@@ -4,82 +4,245 @@ Shared pytest fixtures and utilities for service-level integration tests.
 
 from __future__ import annotations
 
+import asyncio
+import http.client
+import importlib.util
+import io
 import json
 import os
+import threading
 import time
-from typing import Any, Dict, Tuple, Callable
-from urllib import error, request
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Callable
+from urllib import error
+from urllib.parse import urlsplit
 
 import pytest
 
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
 JsonDict = Dict[str, Any]
 HttpRequester = Callable[[str, str, JsonDict | None, float], Tuple[int, JsonDict | str | None]]
 
 
-def _http_request(url: str, method: str = "GET", payload: JsonDict | None = None, timeout: float = 30.0) -> Tuple[int, JsonDict | str | None]:
-    """Make a simple JSON HTTP request using stdlib ``urllib``."""
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
+def _decode_body(raw: bytes) -> JsonDict | str | None:
+    if not raw:
+        return None
+    body = raw.decode("utf-8")
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError:
+        # Some endpoints (e.g. plain text) may not return JSON.
+        return body
 
-    req = request.Request(url, data=data, method=method.upper())
-    req.add_header("Accept", "application/json")
-    if payload is not None:
-        req.add_header("Content-Type", "application/json")
 
-    with request.urlopen(req, timeout=timeout) as resp:
-        raw = resp.read()
-        if not raw:
-            return resp.status, None
+class PooledHTTPClient:
+    """
+    Thread-safe JSON HTTP client that keeps connections alive between calls.
 
-        body = raw.decode("utf-8")
-        try:
-            return resp.status, json.loads(body)
-        except json.JSONDecodeError:
-            # Some endpoints (e.g. plain text) may not return JSON.
-            return resp.status, body
+    Idle ``http.client`` connections are pooled per host, so sequential and
+    threaded tests reuse sockets instead of reconnecting for every request.
+    Calling an instance returns ``(status, json_or_text)`` and raises
+    ``urllib.error.HTTPError`` for 4xx/5xx responses, like ``urlopen`` does.
+    """
+
+    def __init__(self, max_idle_per_host: int = 64):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[Tuple[str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, host: str, port: int, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get((host, port))
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return http.client.HTTPConnection(host, port, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, host: str, port: int, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault((host, port), [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def __call__(
+        self, url: str, method: str = "GET", payload: JsonDict | None = None, timeout: float = 30.0
+    ) -> Tuple[int, JsonDict | str | None]:
+        parts = urlsplit(url)
+        host, port = parts.hostname or "127.0.0.1", parts.port or 80
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+
+        while True:
+            conn, reused = self._acquire(host, port, timeout)
+            try:
+                conn.request(method.upper(), path, body=body, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # The server may close a pooled connection while it sits idle;
+                # retry on a fresh one, but never retry a fresh connection.
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        self._release(host, port, conn, not resp.will_close)
+        if resp.status >= 400:
+            raise error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(raw))
+        return resp.status, _decode_body(raw)
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
 
 
-def _wait_for_endpoint(url: str, timeout: float = 60.0) -> int:
+def _wait_for_endpoint(url: str, timeout: float = 60.0, client: PooledHTTPClient | None = None) -> int:
     """
     Poll ``url`` until the service responds or ``timeout`` seconds elapse.
 
-    Returns the last HTTP status code received. Raises the last connection error
-    if the endpoint never becomes reachable.
+    Retries with exponential backoff (0.1 s doubling up to 2 s) and returns as
+    soon as any HTTP status is received. Raises the last connection error if
+    the endpoint never becomes reachable.
     """
-    deadline = time.time() + timeout
+    client = client or PooledHTTPClient()
+    deadline = time.monotonic() + timeout
+    delay = 0.1
     last_exc: Exception | None = None
 
-    while time.time() < deadline:
+    while True:
         try:
-            with request.urlopen(url, timeout=5.0) as resp:
-                return resp.status
+            status, _ = client(url, timeout=5.0)
+            return status
         except error.HTTPError as http_err:
             # HTTPError still indicates the service responded.
             return http_err.code
-        except Exception as exc:  # URLError, socket timeout, etc.
+        except Exception as exc:  # connection refused, socket timeout, etc.
             last_exc = exc
-            time.sleep(2.0)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 2.0)
 
     if last_exc is None:
         raise TimeoutError(f"Timed out waiting for {url}")
     raise last_exc
 
 
+def _load_helper_module(name: str):
+    """Import ``scripts/helpers/<name>.py`` (not a package) by path."""
+    path = REPO_ROOT / "scripts" / "helpers" / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _fire_concurrently(
+    url: str, payloads: List[JsonDict], method: str = "POST", timeout: float = 180.0
+) -> List[Tuple[int, JsonDict | str | None, float]]:
+    """
+    Send one request per payload, all at once, on an asyncio HTTP client.
+
+    Returns ``(status, json_or_text, latency_s)`` per payload, in order.
+    """
+    client_cls = _load_helper_module("load_generator").AsyncHTTPClient
+
+    async def run():
+        client = client_cls()
+
+        async def one(payload):
+            start = time.perf_counter()
+            status, _, raw = await asyncio.wait_for(client.request(method, url, payload=payload), timeout)
+            return status, _decode_body(raw), time.perf_counter() - start
+
+        try:
+            return await asyncio.gather(*(one(payload) for payload in payloads))
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
 @pytest.fixture(scope="session")
 def http_client() -> HttpRequester:
-    """Expose the lightweight HTTP helper to individual tests."""
-    return _http_request
+    """Session-wide pooled HTTP client shared by every test and fixture."""
+    client = PooledHTTPClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def concurrent_requests() -> Callable[..., List[Tuple[int, JsonDict | str | None, float]]]:
+    """Fire many requests in parallel; see ``_fire_concurrently``."""
+    return _fire_concurrently
+
+
+@pytest.fixture
+def record_latencies(record_property):
+    """Summarize request latencies, print them and attach them to the test report."""
+
+    def record(name: str, latencies: List[float]) -> Dict[str, float]:
+        ordered = sorted(latencies)
+        summary = {
+            "count": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+        record_property(name, json.dumps(summary))
+        print(f"{name}: {summary}")
+        return summary
+
+    return record
+
+
+@pytest.fixture(scope="session")
+def mock_vllm_server():
+    """
+    Run the CPU-only mock vLLM server in-process on a free port.
+
+    Uses a short per-token latency so tests stay fast; the concurrency limit
+    is left unlimited and can be exercised with a dedicated server instance.
+    """
+    module = _load_helper_module("mock_vllm_server")
+    server = module.MockVLLMServer(port=0, model="mock-tinyllama", token_latency_ms=2, prefill_ms_per_token=0)
+    server.start()
+    yield server
+    server.stop()
 
 
 @pytest.fixture(scope="session")
-def vllm_service(http_client: HttpRequester) -> Dict[str, Any]:
+def vllm_service(http_client: HttpRequester, request: pytest.FixtureRequest) -> Dict[str, Any]:
     """
     Ensure the standalone vLLM OpenAI-compatible endpoint is reachable.
 
     Returns a configuration dictionary containing the ``base_url`` and a model
-    identifier that can be used for completion requests.
+    identifier that can be used for completion requests. With
+    ``VLLM_TEST_MOCK=1`` the tests run against the in-process mock server
+    instead of a GPU-backed vLLM.
     """
+    if os.getenv("VLLM_TEST_MOCK") == "1":
+        server = request.getfixturevalue("mock_vllm_server")
+        return {"base_url": server.base_url, "model": server.model}
+
     host = (
         os.getenv("VLLM_TEST_HOST")
         or os.getenv("VLLM_HOST_IP")
@@ -93,7 +256,7 @@ def vllm_service(http_client: HttpRequester) -> Dict[str, Any]:
     probe_urls = (f"{base_url}/health", f"{base_url}/v1/models")
     for probe in probe_urls:
         try:
-            _wait_for_endpoint(probe, timeout=45.0)
+            _wait_for_endpoint(probe, timeout=45.0, client=http_client)
             break
         except Exception:
             continue
@@ -141,7 +304,7 @@ def ray_serve_service(http_client: HttpRequester) -> Dict[str, Any]:
     base_url = f"http://{host}:{port}"
 
     try:
-        _wait_for_endpoint(base_url, timeout=45.0)
+        _wait_for_endpoint(base_url, timeout=45.0, client=http_client)
     except Exception:  # pragma: no cover - skip when Serve not deployed.
         pytest.skip(f"Ray Serve ingress not reachable at {base_url}")
 
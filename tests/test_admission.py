@@ -0,0 +1,89 @@
+"""
+Unit tests for the /llm admission controller in serve_app.py.
+
+They drive ``AdmissionController`` directly on an event loop, so they need Ray
+Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _hold(controller, cost, release, started=None):
+    async with controller.admit(cost):
+        if started is not None:
+            started.append(cost)
+        await release.wait()
+
+
+def test_admission_queues_within_budget_and_rejects_when_full():
+    async def scenario():
+        controller = serve_app.AdmissionController(token_budget=100, max_queue=1, queue_timeout_s=5.0)
+        release = asyncio.Event()
+        started = []
+        first = asyncio.create_task(_hold(controller, 60, release, started))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(_hold(controller, 60, release, started))
+        await asyncio.sleep(0)
+        assert started == [60] and controller.stats()["queued"] == 1
+
+        with pytest.raises(serve_app.Overloaded) as excinfo:
+            async with controller.admit(10):
+                pass
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.retry_after_s >= 1
+
+        release.set()
+        await asyncio.gather(first, queued)
+        return controller.stats()
+
+    stats = _run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["rejected"]["queue_full"] == 1
+    assert stats["tokens_in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_admission_times_out_queued_requests_with_503():
+    async def scenario():
+        controller = serve_app.AdmissionController(token_budget=50, max_queue=4, queue_timeout_s=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, 50, release))
+        await asyncio.sleep(0)
+        with pytest.raises(serve_app.Overloaded) as excinfo:
+            async with controller.admit(10):
+                pass
+        release.set()
+        await holder
+        return excinfo.value, controller.stats()
+
+    error, stats = _run(scenario())
+    assert error.status_code == 503
+    assert stats["rejected"]["queue_timeout"] == 1 and stats["queued"] == 0
+
+
+def test_oversized_request_runs_alone():
+    async def scenario():
+        controller = serve_app.AdmissionController(token_budget=10, max_queue=0)
+        async with controller.admit(10_000):
+            return controller.stats()["tokens_in_flight"]
+
+    assert _run(scenario()) == 10
+
+
+def test_estimate_request_tokens_counts_prompt_and_max_tokens():
+    assert serve_app.estimate_request_tokens({"prompt": "x" * 40, "max_tokens": 20}) == 31
+    chat = {"messages": [{"role": "user", "content": "x" * 8}]}
+    assert serve_app.estimate_request_tokens(chat) == 2 + 1 + 4 + 100
+    batch = {"prompts": ["x" * 40, {"prompt": "", "n": 3}], "max_tokens": 10}
+    assert serve_app.estimate_request_tokens(batch) == (10 + 1 + 10) + (0 + 1 + 3 * 10)
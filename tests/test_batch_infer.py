@@ -0,0 +1,121 @@
+"""
+Tests for batch_infer.py run in-process on the stub engine (no Ray cluster).
+"""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import batch_infer  # noqa: E402
+
+
+def _write_input(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(count):
+            if index == 3:
+                f.write("{not json\n")
+            elif index % 4 == 0:
+                f.write(json.dumps({"id": f"r{index}", "messages": [{"role": "user", "content": "hi"}], "n": 2}) + "\n")
+            else:
+                f.write(json.dumps({"id": f"r{index}", "prompt": f"prompt {index}"}) + "\n")
+
+
+def _pool(tmp_path):
+    settings = {"model_dir": str(tmp_path / "model"), "tensor_parallel_size": 1,
+                "enable_prefix_caching": False, "local_model_root": ""}
+    worker = batch_infer.InferenceWorker(settings, stub=True)
+    worker.llm.token_latency_s = 0.0
+    worker.llm.prefill_latency_s = 0.0
+    return batch_infer.LocalPool(worker)
+
+
+def _results(output_dir):
+    with open(output_dir / batch_infer.RESULTS_NAME, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class FailingPool(batch_infer.LocalPool):
+    """Fails while running the given chunk, like a crashed worker."""
+
+    def __init__(self, pool, fail_chunk):
+        super().__init__(pool._worker)
+        self.fail_chunk = fail_chunk
+
+    def submit(self, chunk_id, jobs):
+        if chunk_id == self.fail_chunk:
+            raise RuntimeError("worker died")
+        super().submit(chunk_id, jobs)
+
+
+def test_batch_infer_runs_every_record(tmp_path):
+    _write_input(tmp_path / "in.jsonl", 25)
+    summary = batch_infer.run_job(
+        str(tmp_path / "in.jsonl"), str(tmp_path / "out"), _pool(tmp_path),
+        chunk_size=10, defaults={"max_tokens": 4, "temperature": 0.0, "n": 1},
+    )
+
+    results = sorted(_results(tmp_path / "out"), key=lambda result: result["index"])
+    assert [result["index"] for result in results] == list(range(25))
+    assert "error" in results[3] and results[3]["id"] == 3
+    assert len(results[0]["choices"]) == 2 and len(results[1]["choices"]) == 1
+    assert summary["this_run"]["records"] == 25 and summary["this_run"]["errors"] == 1
+    assert summary["this_run"]["completion_tokens"] == sum(
+        result["usage"]["completion_tokens"] for result in results if "usage" in result
+    )
+    assert json.loads((tmp_path / "out" / batch_infer.CHECKPOINT_NAME).read_text())["complete"] is True
+
+
+def test_batch_infer_resumes_after_failure(tmp_path):
+    _write_input(tmp_path / "in.jsonl", 45)
+    pool = _pool(tmp_path)
+    args = (str(tmp_path / "in.jsonl"), str(tmp_path / "out"))
+    options = {"chunk_size": 10, "defaults": {"max_tokens": 4}, "checkpoint_every_s": 0.0}
+
+    with pytest.raises(RuntimeError):
+        batch_infer.run_job(*args, FailingPool(pool, fail_chunk=3), **options)
+    checkpoint = json.loads((tmp_path / "out" / batch_infer.CHECKPOINT_NAME).read_text())
+    assert checkpoint["completed_chunks"] == [0, 1, 2] and not checkpoint["complete"]
+
+    # A different chunking would map the checkpoint onto the wrong records.
+    with pytest.raises(batch_infer.JobError):
+        batch_infer.run_job(*args, pool, chunk_size=20, defaults={"max_tokens": 4})
+
+    summary = batch_infer.run_job(*args, pool, **options)
+    assert summary["resumed"] and summary["this_run"]["records"] == 15
+    assert summary["job_totals"]["records"] == 45
+    assert sorted(result["index"] for result in _results(tmp_path / "out")) == list(range(45))
+
+
+class UnserializablePool(batch_infer.LocalPool):
+    """Returns a result ``json.dumps`` rejects half-way through the given chunk."""
+
+    def __init__(self, pool, bad_chunk):
+        super().__init__(pool._worker)
+        self.bad_chunk = bad_chunk
+
+    def wait(self):
+        done = super().wait()
+        for chunk_id, results, _ in done:
+            if chunk_id == self.bad_chunk:
+                results[len(results) // 2]["id"] = object()
+        return done
+
+
+def test_batch_infer_failure_mid_chunk_writes_no_partial_results(tmp_path):
+    _write_input(tmp_path / "in.jsonl", 30)
+    pool = _pool(tmp_path)
+    args = (str(tmp_path / "in.jsonl"), str(tmp_path / "out"))
+    options = {"chunk_size": 10, "defaults": {"max_tokens": 4}, "checkpoint_every_s": 0.0}
+
+    with pytest.raises(TypeError):
+        batch_infer.run_job(*args, UnserializablePool(pool, bad_chunk=1), **options)
+    checkpoint = json.loads((tmp_path / "out" / batch_infer.CHECKPOINT_NAME).read_text())
+    assert checkpoint["completed_chunks"] == [0]
+    assert checkpoint["results_bytes"] == (tmp_path / "out" / batch_infer.RESULTS_NAME).stat().st_size
+
+    batch_infer.run_job(*args, pool, **options)
+    assert sorted(result["index"] for result in _results(tmp_path / "out")) == list(range(30))
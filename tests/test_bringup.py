@@ -0,0 +1,100 @@
+"""
+Tests for the DAG bring-up orchestrator (scripts/helpers/bringup.py).
+
+They run small throwaway scripts, never the real numbered ones.
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from tests.conftest import _load_helper_module
+
+bringup = _load_helper_module("bringup")
+
+
+def _script(directory, name, body="exit 0"):
+    (directory / name).write_text(f"#!/usr/bin/env bash\n{body}\n")
+    return name
+
+
+def _runner(tmp_path, steps, **kwargs):
+    scripts = tmp_path / "scripts"
+    logs = tmp_path / "logs"
+    logs.mkdir(exist_ok=True)
+    return bringup.BringUp(steps, str(scripts), str(logs / "run_all.log"), str(logs), **kwargs)
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    directory = tmp_path / "scripts"
+    directory.mkdir()
+    return directory
+
+
+def test_independent_steps_run_concurrently(tmp_path, scripts):
+    steps = [
+        bringup.Step(_script(scripts, "01_a.sh", "sleep 0.4"), "A"),
+        bringup.Step(_script(scripts, "02_b.sh", "sleep 0.4"), "B"),
+        bringup.Step(_script(scripts, "03_c.sh", "echo done"), "C", requires=("01", "02")),
+    ]
+    runner = _runner(tmp_path, steps)
+
+    started = time.monotonic()
+    results = runner.run()
+    elapsed = time.monotonic() - started
+
+    assert all(result.status == "ok" for result in results.values())
+    assert elapsed < 0.75, f"independent steps ran serially ({elapsed:.2f}s)"
+    assert results["03"].started >= max(results["01"].finished, results["02"].finished)
+    assert "done" in (tmp_path / "logs" / "03_c.log").read_text()
+    assert "Completed: C" in (tmp_path / "logs" / "run_all.log").read_text()
+
+    path, total = runner.critical_path()
+    assert path[-1] == "03" and len(path) == 2
+    assert total == pytest.approx(results["03"].finished, abs=0.2)
+
+
+def test_failed_requirement_blocks_dependents(tmp_path, scripts):
+    steps = [
+        bringup.Step(_script(scripts, "01_fail.sh", "exit 3"), "Fail", critical=True),
+        bringup.Step(_script(scripts, "02_next.sh"), "Next", requires=("01",)),
+        bringup.Step(_script(scripts, "03_later.sh"), "Later", after=("01",)),
+    ]
+    runner = _runner(tmp_path, steps)
+    results = runner.run()
+
+    assert results["01"].status == "failed"
+    assert results["02"].status == "blocked"
+    assert results["03"].status == "ok"
+    assert runner.exit_code() == 1
+
+
+def test_valid_outputs_skip_step_and_readiness_is_polled(tmp_path, scripts):
+    marker = tmp_path / "ready"
+    steps = [
+        bringup.Step(_script(scripts, "01_done.sh", "exit 9"), "Done", valid=lambda: True),
+        bringup.Step(
+            _script(scripts, "02_service.sh", f"(sleep 0.3; touch {marker}) &"),
+            "Service",
+            ready=marker.exists,
+            ready_timeout_s=5.0,
+        ),
+    ]
+    results = _runner(tmp_path, steps).run()
+
+    assert results["01"].status == "skipped"
+    assert results["02"].status == "ok"
+    assert results["02"].duration >= 0.25
+
+
+def test_plan_groups_steps_into_waves(tmp_path, scripts):
+    steps = [
+        bringup.Step(_script(scripts, "01_a.sh"), "A"),
+        bringup.Step(_script(scripts, "02_b.sh"), "B", requires=("01",)),
+        bringup.Step(_script(scripts, "03_c.sh"), "C"),
+        bringup.Step(_script(scripts, "04_d.sh"), "D", after=("09",), enabled=True),
+    ]
+    assert _runner(tmp_path, steps).plan() == [["01", "03", "04"], ["02"]]
@@ -0,0 +1,50 @@
+"""
+Unit tests for chat-template rendering in serve_app.py.
+
+They need Ray Serve and jinja2 importable but no running cluster or model.
+"""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+pytest.importorskip("ray.serve")
+pytest.importorskip("jinja2")
+
+import serve_app  # noqa: E402
+
+# The Llama-2 chat template, which starts every user turn with the BOS token.
+LLAMA2_TEMPLATE = (
+    "{% for message in messages %}"
+    "{% if message['role'] == 'user' %}{{ bos_token + '[INST] ' + message['content'] + ' [/INST]' }}"
+    "{% elif message['role'] == 'assistant' %}{{ ' ' + message['content'] + ' ' + eos_token }}{% endif %}"
+    "{% endfor %}"
+)
+
+
+def _model(tmp_path, template):
+    config = {"chat_template": template, "bos_token": "<s>", "eos_token": "</s>"}
+    (tmp_path / "tokenizer_config.json").write_text(json.dumps(config))
+    return str(tmp_path)
+
+
+def test_rendered_prompt_leaves_the_leading_bos_to_the_tokenizer(tmp_path):
+    render = serve_app.load_chat_template(_model(tmp_path, LLAMA2_TEMPLATE))
+    messages = [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {"role": "user", "content": "Bye"},
+    ]
+    prompt = serve_app.messages_to_prompt(messages, render)
+    # Only the first BOS goes: later turns keep theirs, as the model was trained.
+    assert prompt == "[INST] Hi [/INST] Hello </s><s>[INST] Bye [/INST]"
+    # Each turn's prompt is still a prefix of the next turn's.
+    assert prompt.startswith(serve_app.messages_to_prompt(messages[:1], render))
+
+
+def test_templates_without_bos_are_unchanged(tmp_path):
+    template = "{% for message in messages %}<|{{ message['role'] }}|>\n{{ message['content'] }}\n{% endfor %}"
+    render = serve_app.load_chat_template(_model(tmp_path, template))
+    assert serve_app.messages_to_prompt([{"role": "user", "content": "Hi"}], render) == "<|user|>\nHi\n"
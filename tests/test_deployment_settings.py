@@ -0,0 +1,83 @@
+"""
+Unit tests for per-deployment scaling settings in serve_app.py.
+
+``load_deployment_settings`` and ``deployment_options`` are pure functions of
+the environment, so these need Ray Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    monkeypatch.delenv("SERVE_DEPLOYMENT_CONFIG", raising=False)
+    for name, values in serve_app.DEPLOYMENT_DEFAULTS.items():
+        for key in values:
+            monkeypatch.delenv(f"SERVE_{name.upper()}_{key.upper()}", raising=False)
+
+
+def _config(tmp_path, monkeypatch, overrides):
+    path = tmp_path / "deployments.json"
+    path.write_text(json.dumps(overrides))
+    monkeypatch.setenv("SERVE_DEPLOYMENT_CONFIG", str(path))
+
+
+def test_env_overrides_config_file_which_overrides_defaults(tmp_path, monkeypatch):
+    _config(tmp_path, monkeypatch, {"echo_service": {"max_replicas": 12, "target_ongoing_requests": 4}})
+    monkeypatch.setenv("SERVE_ECHO_SERVICE_MAX_REPLICAS", "16")
+
+    echo = serve_app.load_deployment_settings()["echo_service"]
+    assert echo["max_replicas"] == 16
+    assert echo["target_ongoing_requests"] == 4
+    assert echo["min_replicas"] == serve_app.DEPLOYMENT_DEFAULTS["echo_service"]["min_replicas"]
+
+
+def test_equal_min_and_max_give_a_fixed_replica_count(monkeypatch):
+    monkeypatch.setenv("SERVE_CALCULATOR_MIN_REPLICAS", "3")
+    monkeypatch.setenv("SERVE_CALCULATOR_MAX_REPLICAS", "3")
+    settings = serve_app.load_deployment_settings()
+
+    fixed = serve_app.deployment_options("calculator", settings)
+    assert fixed["num_replicas"] == 3 and "autoscaling_config" not in fixed
+
+    scaled = serve_app.deployment_options("ingress", settings)
+    assert "num_replicas" not in scaled
+    assert scaled["autoscaling_config"]["max_replicas"] == serve_app.DEPLOYMENT_DEFAULTS["ingress"]["max_replicas"]
+    # Only tinyllama bounds the queue in front of its replicas.
+    assert "max_queued_requests" not in scaled
+    assert serve_app.deployment_options("tinyllama", settings)["max_queued_requests"] == 128
+
+
+def test_min_above_max_is_rejected(monkeypatch):
+    monkeypatch.setenv("SERVE_INGRESS_MIN_REPLICAS", "5")
+    monkeypatch.setenv("SERVE_INGRESS_MAX_REPLICAS", "2")
+    with pytest.raises(ValueError, match="ingress: min_replicas"):
+        serve_app.load_deployment_settings()
+
+
+@pytest.mark.parametrize("overrides, match", [
+    ({"tinyllama": {"max_replica": 4}}, "max_replica"),
+    ({"not_a_deployment": {"max_replicas": 4}}, "not_a_deployment"),
+])
+def test_unknown_config_names_are_rejected(tmp_path, monkeypatch, overrides, match):
+    _config(tmp_path, monkeypatch, overrides)
+    with pytest.raises(ValueError, match=match):
+        serve_app.load_deployment_settings()
+
+
+@pytest.mark.parametrize("env_name, value", [
+    ("SERVE_INGRESS_MAX_REPLICAS", "4.0"),
+    ("SERVE_TINYLLAMA_UPSCALE_DELAY_S", "soon"),
+])
+def test_bad_env_values_name_the_variable(monkeypatch, env_name, value):
+    monkeypatch.setenv(env_name, value)
+    with pytest.raises(ValueError, match=f"{env_name} must be .*'{value}'"):
+        serve_app.load_deployment_settings()
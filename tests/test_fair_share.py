@@ -0,0 +1,178 @@
+"""
+Unit tests for the ingress fair-share scheduler in serve_app.py.
+
+Like test_admission.py they drive the scheduler on an event loop and need Ray
+Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _request(scheduler, order, tenant, priority="interactive", weight=1.0, cost=10, release=None):
+    async with scheduler.slot(tenant, priority, weight, cost):
+        order.append(tenant)
+        if release is not None:
+            await release.wait()
+        else:
+            await asyncio.sleep(0)
+
+
+def test_weighted_tenants_share_tokens_in_proportion():
+    async def scenario():
+        # One request fits at a time, so the dispatch order is the schedule.
+        scheduler = serve_app.FairShareScheduler(token_budget=10, quantum=10)
+        order = []
+        release = asyncio.Event()
+        blocker = asyncio.create_task(_request(scheduler, [], "blocker", release=release))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(_request(scheduler, order, "bulk")) for _ in range(12)]
+        tasks += [asyncio.create_task(_request(scheduler, order, "chat", weight=2.0)) for _ in range(8)]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 20
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order, scheduler.stats()
+
+    order, stats = _run(scenario())
+    # bulk queued first and was credited its first turn alone; after that, while
+    # both tenants are backlogged, chat (weight 2) gets twice bulk's turns.
+    assert order[:2] == ["bulk", "bulk"]
+    window = order[2:14]
+    assert window.count("chat") == 8 and window.count("bulk") == 4
+    assert stats["tokens_in_flight"] == 0 and stats["queued"] == 0
+    completed = {flow["tenant"]: flow["completed"] for flow in stats["tenants"]}
+    assert completed == {"blocker": 1, "bulk": 12, "chat": 8}
+
+
+def test_interactive_requests_overtake_queued_batch_work():
+    async def scenario():
+        scheduler = serve_app.FairShareScheduler(token_budget=10, quantum=10)
+        order = []
+        release = asyncio.Event()
+        blocker = asyncio.create_task(_request(scheduler, [], "blocker", release=release))
+        await asyncio.sleep(0)
+        batch = [asyncio.create_task(_request(scheduler, order, "etl", priority="batch")) for _ in range(5)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(_request(scheduler, order, "chat"))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, interactive, *batch)
+        return order
+
+    assert _run(scenario())[0] == "chat"
+
+
+def test_fair_share_queue_overflow_and_timeout_raise_overloaded():
+    async def scenario():
+        scheduler = serve_app.FairShareScheduler(token_budget=10, max_queue=1, queue_timeout_s=0.05)
+        release = asyncio.Event()
+        blocker = asyncio.create_task(_request(scheduler, [], "a", release=release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(_request(scheduler, [], "b"))
+        await asyncio.sleep(0)
+        with pytest.raises(serve_app.Overloaded) as full:
+            async with scheduler.slot("c", "interactive", 1.0, 10):
+                pass
+        with pytest.raises(serve_app.Overloaded) as timed_out:
+            await queued
+        release.set()
+        await blocker
+        return full.value, timed_out.value, scheduler.stats()
+
+    full, timed_out, stats = _run(scenario())
+    assert full.status_code == 429 and timed_out.status_code == 503
+    assert stats["rejected"] == {"queue_full": 1, "queue_timeout": 1}
+    assert stats["queued"] == 0 and stats["tokens_in_flight"] == 0
+
+
+def test_identify_tenant_by_api_key_header_and_priority():
+    settings = {
+        "default": {"weight": 1.0, "priority": "interactive"},
+        "tenants": {
+            "chat": {"weight": 4.0, "priority": "interactive", "api_keys": ["sk-chat"]},
+            "etl": {"weight": 1.0, "priority": "batch", "api_keys": []},
+        },
+    }
+    assert serve_app.identify_tenant({"authorization": "Bearer sk-chat"}, settings) == ("chat", "interactive", 4.0)
+    # A tenant with API keys cannot be claimed by name.
+    assert serve_app.identify_tenant({"x-tenant": "chat"}, settings)[0] == serve_app.DEFAULT_TENANT
+    # Batch tenants cannot promote themselves; interactive ones may demote.
+    assert serve_app.identify_tenant({"x-tenant": "etl", "x-priority": "interactive"}, settings)[1] == "batch"
+    assert serve_app.identify_tenant({"x-api-key": "sk-chat", "x-priority": "batch"}, settings)[1] == "batch"
+    assert serve_app.identify_tenant({}, settings) == (serve_app.DEFAULT_TENANT, "interactive", 1.0)
+
+
+class _StalledStream:
+    """A streaming handle whose first event never arrives."""
+
+    def options(self, **kwargs):
+        return self
+
+    def remote(self, request):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.Event().wait()
+
+
+class _OneEventStream(_StalledStream):
+    def remote(self, request):
+        async def events():
+            yield {"token": "hi"}
+        return events()
+
+
+def _stream_request(body=b'{"prompt": "hi", "stream": true}'):
+    from starlette.requests import Request
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/llm", "headers": [], "query_string": b""}
+    return Request(scope, receive)
+
+
+def _ingress(llm_handle, monkeypatch):
+    monkeypatch.delenv("SERVE_TENANT_CONFIG", raising=False)
+    monkeypatch.setenv("SERVE_FAIR_SHARE_TOKEN_BUDGET", "100")
+    settings = serve_app.load_fair_share_settings()
+    return serve_app.Ingress.func_or_class(_StalledStream(), _StalledStream(), llm_handle, fair_share=settings)
+
+
+def test_ingress_stream_releases_fair_share_slot(monkeypatch):
+    async def cancelled_before_first_event():
+        ingress = _ingress(_StalledStream(), monkeypatch)
+        call = asyncio.create_task(ingress(_stream_request()))
+        await asyncio.sleep(0.05)
+        assert ingress.scheduler.tokens_in_flight > 0
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return ingress.scheduler.stats()
+
+    async def stream_never_started():
+        ingress = _ingress(_OneEventStream(), monkeypatch)
+        response = await ingress(_stream_request())
+        assert ingress.scheduler.tokens_in_flight > 0
+        await response.background()
+        return ingress.scheduler.stats()
+
+    for scenario in (cancelled_before_first_event, stream_never_started):
+        stats = _run(scenario())
+        assert stats["tokens_in_flight"] == 0
+        assert [flow["in_flight"] for flow in stats["tenants"]] == [0]
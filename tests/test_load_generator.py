@@ -0,0 +1,118 @@
+"""
+Tests for the asyncio HTTP client in scripts/helpers/load_generator.py.
+
+``AsyncHTTPClient`` also carries the concurrency tests (conftest.py) and the
+vLLM gateway, so it is tested on its own against the in-process mock vLLM
+server; these always run.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from tests.conftest import _load_helper_module
+
+load_generator = _load_helper_module("load_generator")
+
+
+def _run(scenario):
+    async def run():
+        client = load_generator.AsyncHTTPClient()
+        try:
+            return await scenario(client)
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
+def _completion(server, **fields):
+    return {"model": server.model, "prompt": "hello", "max_tokens": 4, "ignore_eos": True, **fields}
+
+
+def test_keep_alive_connections_are_reused(mock_vllm_server):
+    url = f"{mock_vllm_server.base_url}/v1/completions"
+
+    async def scenario(client):
+        connections = []
+        for _ in range(3):
+            status, _, body = await client.request("POST", url, payload=_completion(mock_vllm_server))
+            assert status == 200 and json.loads(body)["usage"]["completion_tokens"] == 4
+            idle = client._idle[(mock_vllm_server.host, mock_vllm_server.port)]
+            assert len(idle) == 1
+            connections.append(idle[0][1])
+        return connections
+
+    first, *rest = _run(scenario)
+    assert all(writer is first for writer in rest)
+
+
+def test_chunked_stream_is_passed_on_line_by_line(mock_vllm_server):
+    url = f"{mock_vllm_server.base_url}/v1/completions"
+    calls = []
+
+    async def on_line(line):
+        # An awaitable result is awaited before the next line is read.
+        await asyncio.sleep(0)
+        calls.append(("line", line))
+
+    async def scenario(client):
+        return await client.request(
+            "POST", url, payload=_completion(mock_vllm_server, stream=True),
+            on_head=lambda status, headers: calls.append(("head", status)), on_line=on_line,
+        )
+
+    status, headers, body = _run(scenario)
+    assert status == 200 and headers["transfer-encoding"] == "chunked"
+    assert calls[0] == ("head", 200)
+    events = [line[len(b"data: "):] for kind, line in calls[1:] if line.startswith(b"data: ")]
+    assert len(events) == 5 and events[-1] == b"[DONE]"
+    assert body.count(b"data: ") == 5
+
+
+def test_error_statuses_are_returned_not_raised(mock_vllm_server):
+    base_url = mock_vllm_server.base_url
+
+    async def scenario(client):
+        missing = await client.request("GET", f"{base_url}/v1/nothing")
+        invalid = await client.request("POST", f"{base_url}/v1/completions", body=b"{not json")
+        # The connection survives error responses and serves the next request.
+        ok = await client.request("GET", f"{base_url}/v1/models")
+        return missing, invalid, ok
+
+    missing, invalid, ok = _run(scenario)
+    assert missing[0] == 404 and json.loads(missing[2])["type"] == "NotFoundError"
+    assert invalid[0] == 400 and json.loads(invalid[2])["object"] == "error"
+    assert ok[0] == 200
+
+
+def test_truncated_chunked_body_raises():
+    async def truncated(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def scenario(client):
+        server = await asyncio.start_server(truncated, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            with pytest.raises(asyncio.IncompleteReadError):
+                await client.request("GET", f"http://127.0.0.1:{port}/")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    _run(scenario)
+
+
+@pytest.mark.parametrize("dist", ["normal", "lognormal"])
+def test_prompt_len_must_be_positive_for_sampled_lengths(dist, capsys):
+    with pytest.raises(SystemExit):
+        load_generator.parse_args(["--prompt-len-dist", dist, "--prompt-len", "0"])
+    assert "--prompt-len must be at least 1" in capsys.readouterr().err
+    args = load_generator.parse_args(["--prompt-len-dist", dist, "--prompt-len", "1"])
+    assert 1 <= load_generator.PromptDataset(args)._length() <= args.prompt_len_max
@@ -0,0 +1,89 @@
+"""
+Unit tests for the application metrics in serve_app.py.
+
+``ray.serve.metrics`` is swapped for in-memory recorders, so these need Ray
+Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import types
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+class _Metric:
+    """Records every value reported to a counter, gauge or histogram."""
+
+    def __init__(self, name, description="", boundaries=None, tag_keys=()):
+        self.name = name
+        self.calls = []
+
+    def inc(self, value=1.0, tags=None):
+        self.calls.append((value, tags))
+
+    def set(self, value, tags=None):
+        self.calls.append((value, tags))
+
+    def observe(self, value, tags=None):
+        self.calls.append((value, tags))
+
+
+@pytest.fixture
+def fake_metrics(monkeypatch):
+    monkeypatch.setattr(serve_app, "metrics", types.SimpleNamespace(Counter=_Metric, Gauge=_Metric, Histogram=_Metric))
+
+
+def _tags(metric):
+    return [tags for _, tags in metric.calls]
+
+
+def test_track_records_ok_and_checked_errors(fake_metrics):
+    service = serve_app.ServiceMetrics()
+    with service.track("/echo") as outcome:
+        outcome.check({"echo": "hi"})
+    with service.track("/calc") as outcome:
+        outcome.check({"error": "Division by zero"})
+    with service.track("/calc") as outcome:
+        outcome.check({"error": "bad operation", "error_type": "bad_request", "status_code": 400})
+        # The first classification wins.
+        outcome.check({"error": "later", "error_type": "other"})
+
+    assert _tags(service.requests) == [
+        {"route": "/echo", "status": "ok"},
+        {"route": "/calc", "status": "error"},
+        {"route": "/calc", "status": "error"},
+    ]
+    assert [tags["error_type"] for tags in _tags(service.errors)] == ["bad_request", "bad_request"]
+    assert len(service.latency.calls) == 3
+
+
+def test_track_classifies_exceptions_and_restores_in_flight(fake_metrics):
+    service = serve_app.ServiceMetrics()
+    with service.track("/llm"):
+        with service.track("/llm"):
+            assert service._in_flight["/llm"] == 2
+    with pytest.raises(TimeoutError):
+        with service.track("/llm"):
+            raise TimeoutError("engine stalled")
+
+    assert _tags(service.requests)[-1] == {"route": "/llm", "status": "error"}
+    assert _tags(service.errors) == [{"route": "/llm", "error_type": "TimeoutError"}]
+    assert [value for value, _ in service.in_flight.calls] == [1, 2, 1, 0, 1, 0]
+    assert service._in_flight["/llm"] == 0
+
+
+def test_llm_metrics_count_tokens_and_prefix_cache_hits(fake_metrics):
+    llm = serve_app.LLMMetrics()
+    assert llm.prefix_cache_stats()["hit_rate"] is None
+    usage = {"prompt_tokens": 40, "completion_tokens": 8, "cached_prompt_tokens": 30}
+    llm.observe_generation("/llm", started=1.0, first_token_at=1.25, finished_at=2.0, usage=usage)
+
+    assert llm.ttft.calls == [(250.0, {"route": "/llm"})]
+    assert llm.generation_time.calls == [(1000.0, {"route": "/llm"})]
+    assert llm.completion_tokens.calls == [(8, {"route": "/llm"})]
+    assert llm.prefix_cache_stats() == {"prompt_tokens": 40, "cached_prompt_tokens": 30, "hit_rate": 0.75}
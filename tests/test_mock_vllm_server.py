@@ -0,0 +1,118 @@
+"""
+Tests for the CPU-only mock vLLM server (scripts/helpers/mock_vllm_server.py).
+
+These run without any external services, so they always execute in CI.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import error, request
+
+import pytest
+
+from tests.conftest import _load_helper_module
+
+
+def _stream_events(url: str, payload):
+    req = request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST")
+    req.add_header("Content-Type", "application/json")
+    events = []
+    with request.urlopen(req, timeout=30) as resp:
+        assert resp.headers.get("Content-Type", "").startswith("text/event-stream")
+        for raw_line in resp:
+            line = raw_line.decode("utf-8").strip()
+            if line.startswith("data: "):
+                events.append(line[len("data: "):])
+    return events
+
+
+def test_mock_health_and_models(mock_vllm_server, http_client):
+    base_url = mock_vllm_server.base_url
+
+    status, _ = http_client(f"{base_url}/health")
+    assert status == 200
+
+    status, payload = http_client(f"{base_url}/v1/models")
+    assert status == 200
+    assert payload["data"][0]["id"] == mock_vllm_server.model
+
+
+def test_mock_completions_report_usage(mock_vllm_server, http_client):
+    base_url = mock_vllm_server.base_url
+    payload = {"model": mock_vllm_server.model, "prompt": "Hello there", "max_tokens": 8, "ignore_eos": True}
+
+    status, response_json = http_client(f"{base_url}/v1/completions", method="POST", payload=payload)
+    assert status == 200
+    choice = response_json["choices"][0]
+    assert len(choice["text"].split()) == 8
+    assert choice["finish_reason"] == "length"
+    assert response_json["usage"]["completion_tokens"] == 8
+
+
+def test_mock_rejects_unknown_model(mock_vllm_server, http_client):
+    payload = {"model": "missing", "prompt": "hi"}
+    with pytest.raises(error.HTTPError) as excinfo:
+        http_client(f"{mock_vllm_server.base_url}/v1/completions", method="POST", payload=payload)
+    assert excinfo.value.code == 404
+
+
+def test_mock_chat_streaming(mock_vllm_server):
+    payload = {
+        "model": mock_vllm_server.model,
+        "messages": [{"role": "user", "content": "Stream please"}],
+        "max_tokens": 6,
+        "ignore_eos": True,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    events = _stream_events(f"{mock_vllm_server.base_url}/v1/chat/completions", payload)
+
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+    assert len(content.split()) == 6
+    assert chunks[-1]["usage"]["completion_tokens"] == 6
+
+
+def test_mock_concurrency_limit_queues_requests(http_client):
+    """With max_concurrency=2, four equal requests take two decode rounds."""
+    module = _load_helper_module("mock_vllm_server")
+    server = module.MockVLLMServer(
+        port=0, model="limited", token_latency_ms=20, prefill_ms_per_token=0, max_concurrency=2
+    ).start()
+    try:
+        url = f"{server.base_url}/v1/completions"
+        payload = {"model": "limited", "prompt": "queue", "max_tokens": 10, "ignore_eos": True}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: http_client(url, "POST", payload, 30.0), range(4)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    assert all(status == 200 for status, _ in results)
+    # One round is ~0.2 s; unlimited concurrency would finish in about that.
+    assert elapsed >= 0.38, f"Requests did not queue behind the concurrency limit ({elapsed:.2f}s)"
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/v1/completions", ["not", "an", "object"]),
+    ("/v1/completions", "just a string"),
+    ("/v1/completions", {"prompt": "hi", "max_tokens": "abc"}),
+    ("/v1/completions", {"prompt": "hi", "max_tokens": {}}),
+    ("/v1/completions", {"prompt": "hi", "max_tokens": 0}),
+    ("/v1/completions", {"prompt": "hi", "temperature": "abc"}),
+    ("/v1/completions", {"prompt": "hi", "temperature": {}}),
+    ("/v1/completions", {"prompt": "hi", "temperature": -1}),
+    ("/v1/chat/completions", {"messages": ["hi"]}),
+])
+def test_mock_rejects_invalid_requests_with_openai_errors(mock_vllm_server, http_client, path, payload):
+    with pytest.raises(error.HTTPError) as excinfo:
+        http_client(f"{mock_vllm_server.base_url}{path}", method="POST", payload=payload)
+    assert excinfo.value.code == 400
+    body = json.loads(excinfo.value.read())
+    assert body["object"] == "error" and body["type"] == "BadRequestError" and body["message"]
@@ -0,0 +1,97 @@
+"""
+Unit tests for the /llm model registry in serve_app.py.
+
+Engines are plain objects loaded and unloaded in worker threads, so these need
+Ray Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+def _registry_dir(tmp_path, sizes):
+    for name, size in sizes.items():
+        model = tmp_path / name
+        model.mkdir()
+        (model / "config.json").write_text("{}")
+        (model / "model.safetensors").write_bytes(b"\0" * size)
+    return str(tmp_path)
+
+
+class Engines:
+    """Load and unload callbacks that track the bytes actually resident."""
+
+    def __init__(self, unload_s=0.0, fail_unload=False):
+        self.unload_s = unload_s
+        self.fail_unload = fail_unload
+        self.resident = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def load(self, model_id, path, memory_bytes):
+        with self._lock:
+            self.resident += memory_bytes
+            self.peak = max(self.peak, self.resident)
+        return (model_id, memory_bytes)
+
+    def unload(self, engine):
+        time.sleep(self.unload_s)
+        if self.fail_unload:
+            raise RuntimeError("unload failed")
+        with self._lock:
+            self.resident -= engine[1]
+
+
+def _registry(tmp_path, engines, sizes, budget):
+    return serve_app.ModelRegistry(
+        _registry_dir(tmp_path, sizes), engines.load, engines.unload,
+        max_loaded=len(sizes), memory_budget_bytes=budget, memory_overhead=1.0,
+    )
+
+
+async def _use(registry, model_id, hold_s=0.0):
+    async with registry.use(model_id) as model:
+        await asyncio.sleep(hold_s)
+        return model.engine[0]
+
+
+def test_evicting_models_count_against_the_budget_until_unloaded(tmp_path):
+    engines = Engines(unload_s=0.2)
+    registry = _registry(tmp_path, engines, {"a": 800, "b": 200, "c": 700}, budget=900)
+
+    async def scenario():
+        registry.preload("a")
+        # Loading b evicts a; c and a itself arrive while a is still unloading.
+        first = asyncio.create_task(_use(registry, "b", hold_s=0.1))
+        await asyncio.sleep(0.05)
+        rest = [asyncio.create_task(_use(registry, model_id)) for model_id in ("c", "a")]
+        return await asyncio.gather(first, *rest)
+
+    assert asyncio.run(scenario()) == ["b", "c", "a"]
+    assert engines.peak <= 900
+    assert registry.evictions >= 2
+
+
+def test_failed_unload_keeps_the_model_loaded(tmp_path):
+    engines = Engines(fail_unload=True)
+    registry = _registry(tmp_path, engines, {"a": 600, "b": 600}, budget=1000)
+
+    async def scenario():
+        registry.preload("a")
+        with pytest.raises(RuntimeError):
+            await _use(registry, "b")
+        # a was never freed, so it is still loaded and usable.
+        return await _use(registry, "a")
+
+    assert asyncio.run(scenario()) == "a"
+    assert [model["model"] for model in registry.stats()["loaded"]] == ["a"]
+    assert engines.resident == 600 and registry.evictions == 0
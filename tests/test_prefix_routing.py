@@ -0,0 +1,101 @@
+"""
+Unit tests for prefix-affinity routing of tinyllama requests in serve_app.py.
+
+The router is driven directly with stand-in replicas, so these need Ray Serve
+importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+from ray.serve._private.common import DeploymentHandleSource, DeploymentID, ReplicaID  # noqa: E402
+
+import serve_app  # noqa: E402
+
+
+def _router(**kwargs):
+    router = serve_app.PrefixAffinityRouter(
+        DeploymentID(name="tinyllama", app_name="default"), DeploymentHandleSource.UNKNOWN
+    )
+    router.initialize_state(**kwargs)
+    return router
+
+
+def _replicas(*names, max_ongoing_requests=32):
+    deployment_id = DeploymentID(name="tinyllama", app_name="default")
+    return [
+        SimpleNamespace(
+            replica_id=ReplicaID(unique_id=name, deployment_id=deployment_id),
+            max_ongoing_requests=max_ongoing_requests,
+            routing_stats={},
+        )
+        for name in names
+    ]
+
+
+def _pending(data, request_id):
+    return SimpleNamespace(
+        args=[serve_app.ServeRequest(path="/llm", method="POST", data=data)],
+        metadata=SimpleNamespace(internal_request_id=request_id),
+        routing_context=SimpleNamespace(should_backoff=False),
+    )
+
+
+def _route(router, replicas, data, request_id="r", complete=True):
+    pending = _pending(data, request_id)
+    ranks = asyncio.run(router.choose_replicas(replicas, pending))
+    chosen = ranks[0][0]
+    router.on_request_routed(pending, chosen.replica_id, None)
+    if complete:
+        router.on_request_completed(chosen.replica_id, request_id)
+    return chosen.replica_id.unique_id
+
+
+def test_routing_prefix_normalizes_prompts_and_conversations():
+    system = {"role": "system", "content": "You are   terse.\n"}
+    first = serve_app.routing_prefix({"messages": [system, {"role": "user", "content": "hi"}]}, max_chars=24)
+    later = serve_app.routing_prefix({"messages": [system, {"role": "user", "content": "bye"}]}, max_chars=24)
+    assert first == later == "\x00system: You are terse. u"
+    assert serve_app.routing_prefix({"prompt": " a  b ", "model": "m"}) == "m\x00a b"
+    assert serve_app.routing_prefix({"prompts": ["a b"]}) == serve_app.routing_prefix({"prompt": "a  b"})
+    assert serve_app.routing_prefix({"prompt": "   "}) is None
+    assert serve_app.routing_prefix({}) is None
+
+
+def test_shared_prefixes_stick_to_one_replica_and_survive_scale_up():
+    router = _router(virtual_nodes=64, prefix_chars=32)
+    replicas = _replicas("a", "b", "c")
+    prompts = [{"prompt": f"system prompt {index}: question"} for index in range(60)]
+    owners = [_route(router, replicas, data, request_id=str(index)) for index, data in enumerate(prompts)]
+    assert owners == [_route(router, replicas, data) for data in prompts]
+    assert len(set(owners)) == 3
+    assert router.decisions["affinity"] == 120
+
+    # A new replica only takes keys over; no key moves between old replicas.
+    grown = [_route(router, replicas + _replicas("d"), data) for data in prompts]
+    assert all(new in (old, "d") for old, new in zip(owners, grown))
+    assert 0 < grown.count("d") < len(prompts)
+
+
+def test_busy_preferred_replica_falls_back_to_least_loaded():
+    router = _router(imbalance_threshold=2)
+    replicas = _replicas("a", "b")
+    data = {"prompt": "shared system prompt"}
+    owner = _route(router, replicas, data, request_id="0", complete=False)
+    for index in range(1, 3):
+        assert _route(router, replicas, data, request_id=str(index), complete=False) == owner
+    # The owner now has 3 in flight against 0: over the threshold.
+    assert _route(router, replicas, data, request_id="3", complete=False) != owner
+    assert router.decisions == {"affinity": 3, "spill": 0, "fallback": 1, "no_prefix": 0}
+    assert router.load_imbalance() == 1.0  # no replicas registered via update_replicas
+
+    by_id = {replica.replica_id.unique_id: replica.replica_id for replica in replicas}
+    for index in range(3):
+        router.on_request_completed(by_id[owner], str(index))
+    assert _route(router, replicas, data, request_id="4") == owner
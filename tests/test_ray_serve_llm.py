@@ -4,10 +4,17 @@ Integration tests for the Ray Serve TinyLlama deployment.
 
 from __future__ import annotations
 
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
+from urllib import error, request
 
 import pytest
 
+from tests.conftest import _load_helper_module
+
 
 def test_ray_serve_ingress_lists_endpoints(ray_serve_service: Dict[str, str], http_client):
     """
@@ -52,6 +59,294 @@ def test_ray_serve_tinyllama_completion(ray_serve_service: Dict[str, str], http_
         "Serve /llm response missing expected service metadata"
 
 
+def test_ray_serve_llm_streaming_sse(ray_serve_service: Dict[str, str], http_client):
+    """
+    ``stream: true`` on /llm should return Server-Sent Events token by token.
+    """
+    base_url = ray_serve_service["base_url"]
+    payload = {"prompt": "Say hello to Ray Serve.", "max_tokens": 16, "temperature": 0.0, "stream": True}
+
+    status, body = http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+    assert status == 200, f"Expected HTTP 200 from streaming /llm endpoint, got {status}"
+    if isinstance(body, dict):
+        pytest.skip(f"Serve /llm endpoint did not stream: {body}")
+    assert isinstance(body, str), "Expected an SSE text body from streaming /llm endpoint"
+
+    events = [
+        line[len("data: "):] for line in body.splitlines() if line.startswith("data: ")
+    ]
+    assert events and events[-1] == "[DONE]", "SSE stream did not terminate with [DONE]"
+    parsed = [json.loads(event) for event in events[:-1]]
+    if any("error" in event for event in parsed):
+        pytest.skip(f"Serve /llm streaming reported error: {parsed}")
+
+    tokens = [event["token"] for event in parsed if "token" in event]
+    final = parsed[-1]
+    assert tokens, "SSE stream did not contain any token events"
+    assert final.get("done") is True, "SSE stream did not end with a summary event"
+    assert "".join(tokens).strip() == final["response"].strip(), \
+        "Streamed tokens do not add up to the final response"
+    assert final.get("ttft_ms") is not None, "Streaming summary missing time-to-first-token"
+
+
+def test_ray_serve_llm_concurrent_requests_overlap(ray_serve_service: Dict[str, str], http_client):
+    """
+    Concurrent /llm requests should be served in parallel by the async engine.
+
+    Runs against vLLM or the CPU stub engine (SERVE_LLM_STUB=1).
+    """
+    base_url = ray_serve_service["base_url"]
+    # Bypass the response cache so every call reaches the engine.
+    payload = {"prompt": "Count to five.", "max_tokens": 32, "temperature": 0.0, "cache": False}
+
+    def call_llm(_):
+        start = time.perf_counter()
+        status, response_json = http_client(
+            f"{base_url}/llm", method="POST", payload=payload, timeout=180.0
+        )
+        return status, response_json, time.perf_counter() - start
+
+    status, response_json, single_latency = call_llm(0)
+    assert status == 200, f"Expected HTTP 200 from Serve /llm endpoint, got {status}"
+    if not isinstance(response_json, dict) or "error" in response_json:
+        pytest.skip(f"Serve /llm endpoint unavailable: {response_json}")
+
+    concurrency = 8
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call_llm, range(concurrency)))
+    wall_time = time.perf_counter() - start
+
+    for status, response_json, _ in results:
+        assert status == 200, f"Expected HTTP 200 from Serve /llm endpoint, got {status}"
+        assert "response" in response_json, "Concurrent /llm call did not include 'response'"
+    # Serialized execution would take roughly concurrency * single_latency.
+    assert wall_time < concurrency * single_latency * 0.5, \
+        f"/llm requests appear to run serially ({wall_time:.2f}s for {concurrency} calls)"
+
+
+def test_ray_serve_llm_64_simultaneous_requests(
+    ray_serve_service: Dict[str, str], concurrent_requests, record_latencies
+):
+    """
+    64 simultaneous /llm calls should all succeed and each get its own answer.
+    """
+    base_url = ray_serve_service["base_url"]
+    payloads = [
+        {"prompt": f"Request {index}: name an island.", "max_tokens": 8, "temperature": 0.0, "cache": False}
+        for index in range(64)
+    ]
+
+    results = concurrent_requests(f"{base_url}/llm", payloads)
+    if any(isinstance(body, dict) and "error" in body for _, body, _ in results):
+        pytest.skip(f"Serve /llm endpoint reported errors: {results[0][1]}")
+
+    for payload, (status, body, _) in zip(payloads, results):
+        assert status == 200, f"Expected HTTP 200 from Serve /llm endpoint, got {status}"
+        assert isinstance(body, dict) and str(body.get("response", "")).strip(), \
+            f"Concurrent /llm call returned no response: {body}"
+        assert body.get("prompt") == payload["prompt"], "Concurrent /llm responses were mixed up"
+    record_latencies("llm_64_concurrent", [latency for _, _, latency in results])
+
+
+def test_ray_serve_llm_micro_batching_groups_requests(ray_serve_service: Dict[str, str], http_client):
+    """
+    With SERVE_LLM_ENGINE=sync, concurrent /llm calls should share generate() batches.
+    """
+    base_url = ray_serve_service["base_url"]
+
+    def call_llm(index):
+        payload = {"prompt": f"Name island number {index}.", "max_tokens": 16, "temperature": 0.0}
+        return http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+
+    concurrency = 8
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call_llm, range(concurrency)))
+
+    responses = [response_json for _, response_json in results]
+    if not all(isinstance(r, dict) and "batch" in r for r in responses):
+        pytest.skip("Serve /llm endpoint is not running in micro-batching (sync) mode")
+    for index, response_json in enumerate(responses):
+        assert response_json["prompt"] == f"Name island number {index}.", \
+            "Micro-batched response was returned to the wrong caller"
+        assert response_json["batch"]["wait_ms"] >= 0
+    assert max(r["batch"]["size"] for r in responses) > 1, \
+        "Concurrent requests were never grouped into a shared batch"
+
+
+def test_ray_serve_llm_response_cache(ray_serve_service: Dict[str, str], http_client):
+    """
+    A repeated temperature-0 prompt should be served from the response cache
+    with the original usage, while sampled requests bypass it.
+    """
+    base_url = ray_serve_service["base_url"]
+    status, stats = http_client(f"{base_url}/llm/stats")
+    if status != 200 or not isinstance(stats, dict) or not stats.get("cache"):
+        pytest.skip("Serve /llm response cache is disabled")
+    # The cache is per replica: the repeat must reach the replica that cached
+    # the first answer, which prefix routing guarantees for an equal prompt.
+    _, routing = http_client(f"{base_url}/llm/routing")
+    if not routing.get("prefix_routing") and len(routing.get("replicas") or {}) != 1:
+        pytest.skip("Repeated prompts may reach different tinyllama replicas")
+
+    # A fresh prompt, so the first call cannot hit an entry from an earlier run.
+    payload = {"prompt": f"Classify the sentiment of: 'great service' ({time.time_ns()}).",
+               "max_tokens": 8, "temperature": 0.0}
+    responses = [
+        http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)[1]
+        for _ in range(2)
+    ]
+    if not all(isinstance(r, dict) and "response" in r for r in responses):
+        pytest.skip(f"Serve /llm endpoint unavailable: {responses}")
+
+    assert not responses[0].get("cached"), "First request for a new prompt was served from cache"
+    assert responses[1].get("cached") is True, "Repeated temperature-0 request missed the cache"
+    assert responses[1]["response"] == responses[0]["response"], \
+        "Cached response differs from the original generation"
+    assert responses[1]["usage"] == responses[0]["usage"], "Cached response lost its usage"
+
+    sampled = dict(payload, temperature=0.8)
+    for _ in range(2):
+        _, sampled_response = http_client(f"{base_url}/llm", method="POST", payload=sampled, timeout=180.0)
+        assert not sampled_response.get("cached"), "Sampled (temperature > 0) request was served from cache"
+
+
+def test_ray_serve_llm_model_registry(ray_serve_service: Dict[str, str], http_client):
+    """
+    /llm/models should list the registry, and unknown models should be rejected.
+    """
+    base_url = ray_serve_service["base_url"]
+
+    status, models = http_client(f"{base_url}/llm/models")
+    if status != 200 or not isinstance(models, dict) or "available" not in models:
+        pytest.skip(f"Serve /llm model registry unavailable: {models}")
+    assert models["default_model"] in models["available"], "Default model missing from the registry"
+
+    payload = {"prompt": "Hello", "max_tokens": 4, "model": "no-such-model"}
+    _, response_json = http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+    assert response_json.get("error_type") == "model_not_found", f"Unexpected response: {response_json}"
+    assert response_json.get("available_models") == models["available"]
+
+
+def test_ray_serve_llm_batch_endpoint(ray_serve_service: Dict[str, str], http_client):
+    """
+    /llm/batch should answer every prompt in input order, honour per-item
+    overrides and n > 1, and report per-item and total usage.
+    """
+    base_url = ray_serve_service["base_url"]
+    payload = {
+        "prompts": [
+            "Name a river.",
+            {"messages": [{"role": "user", "content": "Name a lake."}], "n": 2, "max_tokens": 6},
+            42,
+        ],
+        "max_tokens": 8,
+        "temperature": 0.0,
+    }
+    status, response_json = http_client(f"{base_url}/llm/batch", method="POST", payload=payload, timeout=180.0)
+    assert status == 200, f"Expected HTTP 200 from Serve /llm/batch endpoint, got {status}"
+    if not isinstance(response_json, dict) or "results" not in response_json:
+        pytest.skip(f"Serve /llm/batch endpoint unavailable: {response_json}")
+
+    results = response_json["results"]
+    assert [item["index"] for item in results] == [0, 1, 2]
+    assert len(results[0]["choices"]) == 1 and len(results[1]["choices"]) == 2
+    assert results[1]["usage"]["completion_tokens"] <= 2 * 6
+    assert results[2]["error_type"] == "bad_request"
+    assert response_json["usage"]["completion_tokens"] == sum(
+        item["usage"]["completion_tokens"] for item in results[:2]
+    )
+
+
+def test_ray_serve_llm_admission_control(ray_serve_service: Dict[str, str], http_client):
+    """
+    /llm/stats should report the admission budget, and admitted requests must
+    release their tokens once they finish.
+    """
+    base_url = ray_serve_service["base_url"]
+    status, stats = http_client(f"{base_url}/llm/stats")
+    if status != 200 or not isinstance(stats, dict) or not stats.get("admission"):
+        pytest.skip("Serve /llm admission control is disabled or unavailable")
+
+    payload = {"prompt": "Count to three.", "max_tokens": 8, "cache": False}
+    http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+    _, stats = http_client(f"{base_url}/llm/stats")
+    admission = stats["admission"]
+    assert admission["admitted"] >= 1
+    assert 0 <= admission["tokens_in_flight"] <= admission["token_budget"]
+    assert set(admission["rejected"]) == {"queue_full", "queue_timeout"}
+
+
+def test_ray_serve_llm_tenant_stats(ray_serve_service: Dict[str, str], http_client):
+    """
+    /llm/tenants should report the ingress fair-share queue and count finished
+    requests of the default tenant.
+    """
+    base_url = ray_serve_service["base_url"]
+    status, stats = http_client(f"{base_url}/llm/tenants")
+    if status != 200 or not isinstance(stats, dict) or "tenants" not in stats:
+        pytest.skip("Serve /llm fair-share scheduling is disabled or unavailable")
+
+    payload = {"prompt": "Name a color.", "max_tokens": 4, "cache": False}
+    http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+    _, stats = http_client(f"{base_url}/llm/tenants")
+    flows = [flow for flow in stats["tenants"] if flow["tenant"] == "anonymous"]
+    assert flows and sum(flow["completed"] for flow in flows) >= 1
+    assert 0 <= stats["tokens_in_flight"] <= stats["token_budget"]
+
+
+def test_ray_serve_llm_prefix_routing_stats(ray_serve_service: Dict[str, str], http_client):
+    """
+    /llm/routing should count the routing decision of every generation and
+    report per-replica prefix-cache statistics.
+    """
+    base_url = ray_serve_service["base_url"]
+    status, stats = http_client(f"{base_url}/llm/routing")
+    if status != 200 or not isinstance(stats, dict) or "prefix_routing" not in stats:
+        pytest.skip("Serve /llm prefix routing is unavailable")
+
+    payload = {"prompt": "You are a helpful assistant. Name a color.", "max_tokens": 4, "cache": False}
+    http_client(f"{base_url}/llm", method="POST", payload=payload, timeout=180.0)
+    _, stats = http_client(f"{base_url}/llm/routing")
+    if not stats["prefix_routing"]:
+        pytest.skip("Serve /llm prefix routing is disabled")
+    assert sum(stats["decisions"].values()) >= 1
+    assert stats["replicas"] and stats["load_imbalance"] >= 1.0
+
+
+def test_ray_serve_llm_request_timing(ray_serve_service: Dict[str, str]):
+    """
+    X-Request-Timing should return per-phase timings in a Server-Timing
+    header and a "timing" field, and on the final event of a stream.
+    """
+    base_url = ray_serve_service["base_url"]
+
+    def post(payload):
+        req = request.Request(f"{base_url}/llm", data=json.dumps(payload).encode("utf-8"), method="POST")
+        req.add_header("Content-Type", "application/json")
+        req.add_header("X-Request-Timing", "1")
+        with request.urlopen(req, timeout=180.0) as resp:
+            return resp.headers.get("Server-Timing"), resp.read().decode("utf-8")
+
+    header, body = post({"prompt": "Time me.", "max_tokens": 4, "cache": False})
+    result = json.loads(body)
+    if "error" in result:
+        pytest.skip(f"Serve /llm endpoint reported error: {result['error']}")
+    assert header, "Traced /llm response is missing Server-Timing"
+    assert "trace" not in result, "Replica spans leaked into the response"
+    phases = result["timing"]["phases_ms"]
+    assert {"parse", "queue", "prompt", "generate", "return", "total"} <= set(phases)
+    assert phases["generate"] <= phases["total"]
+    assert header.startswith("parse;dur=") and "generate;dur=" in header
+
+    _, body = post({"messages": [{"role": "user", "content": "Time me."}], "max_tokens": 4, "stream": True})
+    events = [json.loads(line[len("data: "):]) for line in body.splitlines()
+              if line.startswith("data: ") and line != "data: [DONE]"]
+    final = events[-1]
+    assert final.get("done") is True and "trace" not in final
+    assert "generate" in final["timing"]["phases_ms"]
+
+
 def test_ray_serve_echo_endpoint(ray_serve_service: Dict[str, str], http_client):
     """
     The Echo service should return the same message payload.
@@ -67,6 +362,38 @@ def test_ray_serve_echo_endpoint(ray_serve_service: Dict[str, str], http_client)
         "Echo endpoint response missing service metadata"
 
 
+def test_ray_serve_echo_raw_and_stream(ray_serve_service: Dict[str, str]):
+    """
+    /echo/raw should return the request bytes unchanged, /echo/stream in
+    chunk_size pieces, and the transport benchmark should sweep them.
+    """
+    base_url = ray_serve_service["base_url"]
+    payload = bytes(range(256)) * 1024
+
+    def post(path):
+        req = request.Request(f"{base_url}{path}", data=payload, method="POST")
+        req.add_header("Content-Type", "application/octet-stream")
+        with request.urlopen(req, timeout=60.0) as resp:
+            return resp.headers.get("Content-Type"), resp.read()
+
+    try:
+        content_type, body = post("/echo/raw")
+    except error.HTTPError as e:
+        pytest.skip(f"Serve /echo/raw is unavailable: HTTP {e.code}")
+    assert content_type == "application/octet-stream" and body == payload
+    assert post("/echo/stream?chunk_size=10000")[1] == payload
+
+    bench = _load_helper_module("bench_echo_transport")
+    args = bench.parse_args(["--base-url", base_url, "--paths", "direct,ingress", "--sizes", "16,8KiB",
+                             "--concurrency", "2", "--requests", "6", "--warmup", "1"])
+    cells = asyncio.run(bench.run(args))
+    assert len(cells) == 6
+    for cell in cells:
+        ingress = cell["paths"]["ingress"]
+        assert ingress["successful"] == 6 and ingress["p50_ms"] > 0
+        assert ingress["copies_per_request"] == (10 if cell["mode"] == "json" else 8)
+
+
 def test_ray_serve_calculator_addition(ray_serve_service: Dict[str, str], http_client):
     """
     The calculator should handle an addition request.
@@ -93,3 +420,41 @@ def test_ray_serve_calculator_divide_by_zero(ray_serve_service: Dict[str, str],
     assert isinstance(response_json, dict), "Expected JSON response from Serve /calc endpoint"
     assert "error" in response_json, "Calculator divide-by-zero should return error field"
 
+
+def test_ray_serve_calculator_batch(ray_serve_service: Dict[str, str], http_client):
+    """
+    /calc/batch should evaluate column arrays in one request and mask divide-by-zero.
+    """
+    base_url = ray_serve_service["base_url"]
+    payload = {
+        "operation": ["add", "subtract", "multiply", "divide", "divide"],
+        "a": [1, 10, 3, 8, 5],
+        "b": [2, 4, 7, 2, 0],
+    }
+
+    status, response_json = http_client(f"{base_url}/calc/batch", method="POST", payload=payload)
+    assert status == 200, f"Expected HTTP 200 from Serve /calc/batch endpoint, got {status}"
+    assert isinstance(response_json, dict), "Expected JSON response from Serve /calc/batch endpoint"
+    assert response_json.get("count") == 5
+    assert response_json.get("result") == [3.0, 6.0, 21.0, 4.0, None], "Batch results incorrect"
+    assert response_json.get("invalid") == [4], "Divide-by-zero position was not masked"
+
+    payload = {"operations": ["add", "multiply"], "a": [1, 2, 3], "b": [4, 5, 6]}
+    status, response_json = http_client(f"{base_url}/calc/batch", method="POST", payload=payload)
+    assert status == 200
+    assert response_json["results"]["add"] == [5.0, 7.0, 9.0]
+    assert response_json["results"]["multiply"] == [4.0, 10.0, 18.0]
+
+    # Results that overflow are masked like divisions by zero.
+    payload = {"operations": ["add", "multiply"], "a": [1e308, 2], "b": [1e308, 3]}
+    status, response_json = http_client(f"{base_url}/calc/batch", method="POST", payload=payload)
+    assert status == 200
+    assert response_json["results"] == {"add": [None, 5.0], "multiply": [None, 6.0]}
+    assert response_json["invalid"] == {"add": [0], "multiply": [0]}
+
+    for operations in (5, "add", [1, 2]):
+        payload = {"operations": operations, "a": [1], "b": [2]}
+        with pytest.raises(error.HTTPError) as rejected:
+            http_client(f"{base_url}/calc/batch", method="POST", payload=payload)
+        assert rejected.value.code == 400, f"Expected HTTP 400 for operations={operations!r}"
+        assert json.loads(rejected.value.read())["error_type"] == "bad_request"
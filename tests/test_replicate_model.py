@@ -0,0 +1,65 @@
+"""
+Tests for node-local model replication (scripts/helpers/replicate_model.py).
+
+``replicate`` is the body of the per-node Ray task, so it is exercised here
+directly on the local filesystem.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+from tests.conftest import _load_helper_module
+
+replicate_model = _load_helper_module("replicate_model")
+stage_model = _load_helper_module("stage_model")
+
+
+@pytest.fixture
+def staged_model(tmp_path):
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "config.json").write_text(json.dumps({"model_type": "llama"}))
+    (mirror / "model.safetensors").write_bytes(os.urandom(2 * 1024 * 1024 + 5))
+    shared = tmp_path / "shared" / "TinyModel"
+    stage_model.stage(stage_model.MirrorSource(str(mirror)), str(shared), jobs=2)
+    return shared
+
+
+def test_replicate_copies_and_verifies(staged_model, tmp_path):
+    local_root = tmp_path / "local"
+    stats = replicate_model.replicate(str(staged_model), str(local_root), chunk_bytes=1024 * 1024)
+
+    local = local_root / "TinyModel"
+    assert not stats["skipped"]
+    assert stats["bytes"] == sum(os.path.getsize(staged_model / name) for name in ("config.json", "model.safetensors"))
+    assert (local / "model.safetensors").read_bytes() == (staged_model / "model.safetensors").read_bytes()
+    assert stage_model.check_manifest(str(local), deep=True) == []
+
+    again = replicate_model.replicate(str(staged_model), str(local_root))
+    assert again["skipped"]
+
+
+def test_replicate_recopies_after_source_change(staged_model, tmp_path):
+    local_root = tmp_path / "local"
+    replicate_model.replicate(str(staged_model), str(local_root))
+
+    (staged_model / "tokenizer.json").write_text("{}")
+    stats = replicate_model.replicate(str(staged_model), str(local_root))
+
+    assert not stats["skipped"]
+    assert (local_root / "TinyModel" / "tokenizer.json").exists()
+
+
+def test_replicate_rejects_corrupt_shared_copy(staged_model, tmp_path):
+    weights = staged_model / "model.safetensors"
+    data = bytearray(weights.read_bytes())
+    data[0] ^= 0xFF
+    weights.write_bytes(bytes(data))
+
+    with pytest.raises(replicate_model.stage_model.StageError):
+        replicate_model.replicate(str(staged_model), str(tmp_path / "local"))
+    assert not (tmp_path / "local" / "TinyModel" / ".stage_manifest.json").exists()
@@ -0,0 +1,75 @@
+"""
+Unit tests for the per-replica /llm response cache in serve_app.py.
+
+They need Ray Serve importable (serve_app imports it) but no running cluster.
+"""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+from stub_engine import SamplingParams  # noqa: E402
+
+USAGE = {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7, "cached_prompt_tokens": 0}
+
+
+def _key(prompt="Hello", model="/models/a", **params):
+    options = {"max_tokens": 8, "temperature": 0.0}
+    options.update(params)
+    return serve_app.ResponseCache.make_key(model, prompt, SamplingParams(**options))
+
+
+def test_keys_separate_prompts_models_and_sampling():
+    keys = [
+        _key(),
+        _key(prompt=" Hello"),
+        _key(prompt="Hello\n"),
+        _key(model="/models/b"),
+        _key(max_tokens=9),
+        _key(temperature=0.5),
+        _key(seed=1),
+    ]
+    assert len(set(keys)) == len(keys)
+    assert _key() == _key()
+
+
+def test_hits_return_text_and_usage_until_the_ttl_expires():
+    cache = serve_app.ResponseCache(ttl_s=0.05)
+    assert cache.get(_key()) is None
+    cache.put(_key(), "world", USAGE)
+    assert cache.get(_key()) == ("world", USAGE)
+    time.sleep(0.06)
+    assert cache.get(_key()) is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = serve_app.ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == ("1", None)
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == ("1", None) and cache.get("c") == ("3", None)
+    assert cache.evictions == 1
+
+
+def test_byte_limit_bounds_the_cache():
+    overhead = serve_app.ResponseCache.ENTRY_OVERHEAD_BYTES
+    cache = serve_app.ResponseCache(max_bytes=2 * (1 + 100 + overhead))
+    cache.put("a", "x" * 100)
+    cache.put("b", "y" * 100)
+    assert cache.stats()["bytes"] == cache.max_bytes
+    cache.put("c", "z" * 100)
+    assert cache.get("a") is None and cache.get("c") is not None
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+    # An entry larger than the whole cache is not stored and evicts nothing.
+    cache.put("huge", "w" * cache.max_bytes)
+    assert cache.get("huge") is None and cache.stats()["entries"] == 2
@@ -0,0 +1,98 @@
+"""
+Tests for the model staging tool (scripts/helpers/stage_model.py).
+
+They stage from a local mirror directory, so no network access is needed.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+from tests.conftest import _load_helper_module
+
+stage_model = _load_helper_module("stage_model")
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    root = tmp_path / "mirror"
+    root.mkdir()
+    (root / "config.json").write_text(json.dumps({"model_type": "llama"}))
+    (root / "model.safetensors").write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    (root / "pytorch_model.bin").write_bytes(b"pickle weights are skipped")
+    (root / "flax_model.msgpack").write_bytes(b"skipped too")
+    return root
+
+
+def _stage(mirror, dest, **kwargs):
+    return stage_model.stage(stage_model.MirrorSource(str(mirror)), str(dest), jobs=4, **kwargs)
+
+
+def test_stage_from_mirror_writes_manifest(mirror, tmp_path):
+    dest = tmp_path / "model"
+    manifest = _stage(mirror, dest)
+
+    assert sorted(manifest["files"]) == ["config.json", "model.safetensors"]
+    assert (dest / "model.safetensors").read_bytes() == (mirror / "model.safetensors").read_bytes()
+    assert not (dest / "pytorch_model.bin").exists()
+    assert stage_model.check_manifest(str(dest)) == []
+    assert stage_model.check_manifest(str(dest), deep=True) == []
+    assert stage_model.main(["--dest", str(dest), "--check"]) == 0
+
+
+def test_stage_resumes_partial_download(mirror, tmp_path):
+    dest = tmp_path / "model"
+    dest.mkdir()
+    weights = (mirror / "model.safetensors").read_bytes()
+    (dest / "model.safetensors.partial").write_bytes(weights[: len(weights) // 2])
+
+    item = {"path": "model.safetensors", "size": len(weights), "mirror_path": str(mirror / "model.safetensors")}
+    _, transferred = stage_model.fetch(stage_model.MirrorSource(str(mirror)), item, str(dest))
+
+    assert transferred == len(weights) - len(weights) // 2
+    assert (dest / "model.safetensors").read_bytes() == weights
+    assert not (dest / "model.safetensors.partial").exists()
+
+
+def test_stage_recovers_from_corrupt_partial(mirror, tmp_path):
+    dest = tmp_path / "model"
+    dest.mkdir()
+    weights = (mirror / "model.safetensors").read_bytes()
+    (dest / "model.safetensors.partial").write_bytes(b"\0" * 1024)
+
+    _stage(mirror, dest)
+
+    assert (dest / "model.safetensors").read_bytes() == weights
+
+
+def test_check_detects_modified_files(mirror, tmp_path):
+    dest = tmp_path / "model"
+    _stage(mirror, dest)
+
+    with open(dest / "config.json", "a") as f:
+        f.write(" ")
+
+    assert stage_model.check_manifest(str(dest))
+    assert stage_model.main(["--dest", str(dest), "--check"]) == 1
+
+
+def test_stage_converts_pickle_weights(tmp_path):
+    torch = pytest.importorskip("torch")
+    safetensors_torch = pytest.importorskip("safetensors.torch")
+
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "config.json").write_text("{}")
+    embedding = torch.randn(4, 2)
+    torch.save({"embed.weight": embedding, "lm_head.weight": embedding}, mirror / "pytorch_model.bin")
+
+    dest = tmp_path / "model"
+    manifest = _stage(mirror, dest)
+
+    assert "model.safetensors" in manifest["files"]
+    assert not (dest / "pytorch_model.bin").exists()
+    tensors = safetensors_torch.load_file(str(dest / "model.safetensors"))
+    assert torch.equal(tensors["lm_head.weight"], embedding)
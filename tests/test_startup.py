@@ -0,0 +1,58 @@
+"""
+Unit tests for the /llm replica cold start in serve_app.py.
+
+TinyLlamaService is constructed directly on the CPU stub engine, so these need
+Ray Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+
+def _service(tmp_path, monkeypatch, warmup_requests):
+    model = tmp_path / "tiny"
+    model.mkdir()
+    (model / "config.json").write_text("{}")
+    (model / "model.safetensors").write_bytes(b"\0" * 1024)
+    monkeypatch.setattr(serve_app, "USE_STUB_ENGINE", True)
+    monkeypatch.setenv("MODEL_DIR", str(model))
+    monkeypatch.setenv("SERVE_LLM_MODEL_REGISTRY", str(tmp_path))
+    monkeypatch.setenv("SERVE_LLM_LOCAL_MODEL_ROOT", "")
+    monkeypatch.setenv("SERVE_LLM_WARMUP_REQUESTS", str(warmup_requests))
+    monkeypatch.setenv("SERVE_LLM_STUB_TOKEN_LATENCY_MS", "0")
+
+    cls = serve_app.create_tinyllama_deployment().func_or_class
+    service = object.__new__(cls)
+    # Serve awaits the async constructor before the replica reports ready.
+    asyncio.run(service.__init__())
+    return service
+
+
+def _prefilled_tokens(service):
+    model = service.registry.stats()["loaded"][0]["model"]
+    return service.registry._loaded[model].engine.prefix_cache.queried_tokens
+
+
+def test_startup_reports_every_phase(tmp_path, monkeypatch):
+    service = _service(tmp_path, monkeypatch, warmup_requests=2)
+
+    phases = service.startup_phases_ms
+    assert list(phases) == ["import", "weight_load", "engine_init", "warmup"]
+    assert all(isinstance(elapsed, float) and elapsed >= 0 for elapsed in phases.values())
+    assert service.stats()["startup_ms"] == phases
+    # Both warm-up generations reached the engine.
+    assert _prefilled_tokens(service) > 0
+
+
+def test_warmup_is_skipped_when_disabled(tmp_path, monkeypatch):
+    service = _service(tmp_path, monkeypatch, warmup_requests=0)
+
+    assert list(service.startup_phases_ms) == ["import", "weight_load", "engine_init", "warmup"]
+    assert _prefilled_tokens(service) == 0
@@ -0,0 +1,82 @@
+"""
+Unit tests for per-request phase tracing in serve_app.py.
+
+The ingress and replica halves of a trace are driven directly, so these need
+Ray Serve importable but no running cluster.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+import serve_app  # noqa: E402
+
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+def _replica(request):
+    """What TinyLlamaService does with a traced request."""
+    with serve_app.traced_request(request, "tinyllama") as trace:
+        with serve_app.trace_span("prompt"):
+            time.sleep(0.002)
+        with serve_app.trace_span("generate", engine="async"):
+            time.sleep(0.005)
+        return serve_app.attach_trace({"response": "ok"}, trace)
+
+
+def test_sampling_and_traceparent():
+    tracer = serve_app.Tracer(sample_rate=0.0)
+    assert tracer.start({}) is None
+    assert tracer.start({"traceparent": TRACEPARENT[:-2] + "00"}) is None
+
+    continued = tracer.start({"traceparent": TRACEPARENT})
+    assert continued.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736" and not continued.timing
+    assert tracer.start({"x-request-timing": "1"}).timing
+    assert serve_app.Tracer(sample_rate=1.0).start({}) is not None
+    assert serve_app.parse_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+
+    # Untraced requests pass through services untouched.
+    request = serve_app.ServeRequest(path="/llm", method="POST")
+    assert _replica(request) == {"response": "ok"}
+
+
+def test_trace_spans_cross_the_handle_and_export_as_otlp(tmp_path):
+    tracer = serve_app.Tracer(path=str(tmp_path / "traces" / "spans.jsonl"))
+    trace = tracer.start({"x-request-timing": "1", "traceparent": TRACEPARENT})
+    root = trace.start("POST /llm", serve_app.SPAN_KIND_SERVER, route="/llm")
+    with serve_app.trace_span("parse", trace):
+        pass
+    trace.start("handle", serve_app.SPAN_KIND_CLIENT)
+    request = serve_app.ServeRequest(path="/llm", method="POST", trace=trace.context())
+    time.sleep(0.003)
+    result = _replica(request)
+    time.sleep(0.003)
+
+    trace.merge(result.pop("trace"))
+    trace.finish()
+    tracer.export(trace)
+    phases = trace.summary()["phases_ms"]
+    assert list(phases) == ["parse", "queue", "prompt", "generate", "return", "total"]
+    assert phases["queue"] >= 3 and phases["return"] >= 3 and phases["generate"] >= 5
+    assert phases["total"] >= sum(ms for name, ms in phases.items() if name != "total")
+    assert trace.server_timing().startswith("parse;dur=")
+
+    exported = json.loads((tmp_path / "traces" / "spans.jsonl").read_text())
+    services = {
+        resource["resource"]["attributes"][0]["value"]["stringValue"]: resource["scopeSpans"][0]["spans"]
+        for resource in exported["resourceSpans"]
+    }
+    assert [span["name"] for span in services["ingress"]] == ["POST /llm", "parse", "handle"]
+    assert [span["name"] for span in services["tinyllama"]] == ["queue", "tinyllama /llm", "prompt", "generate"]
+    spans = {span["name"]: span for spans in services.values() for span in spans}
+    assert {span["traceId"] for span in spans.values()} == {"4bf92f3577b34da6a3ce929d0e0e4736"}
+    assert spans["POST /llm"]["parentSpanId"] == "00f067aa0ba902b7"
+    assert spans["tinyllama /llm"]["parentSpanId"] == spans["handle"]["spanId"] == spans["queue"]["parentSpanId"]
+    assert spans["generate"]["parentSpanId"] == spans["tinyllama /llm"]["spanId"]
+    assert spans["generate"]["attributes"] == [{"key": "engine", "value": {"stringValue": "async"}}]
+    assert root.end_ns >= int(spans["tinyllama /llm"]["endTimeUnixNano"])
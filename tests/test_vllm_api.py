@@ -60,3 +60,30 @@ def test_vllm_chat_completion(vllm_service: Dict[str, str], http_client):
         # Ensure usage stats follow the OpenAI schema when provided.
         assert set(usage.keys()).issuperset({"prompt_tokens", "completion_tokens", "total_tokens"})
 
+
+
+def test_vllm_64_simultaneous_chat_completions(vllm_service: Dict[str, str], concurrent_requests, record_latencies):
+    """
+    64 simultaneous chat completions should all succeed with well-formed responses.
+    """
+    base_url = vllm_service["base_url"]
+    payloads = [
+        {
+            "model": vllm_service["model"],
+            "messages": [{"role": "user", "content": f"Request {index}: say hello."}],
+            "max_tokens": 16,
+            "temperature": 0.0,
+        }
+        for index in range(64)
+    ]
+
+    results = concurrent_requests(f"{base_url}/v1/chat/completions", payloads)
+
+    ids = set()
+    for status, body, _ in results:
+        assert status == 200, f"Expected HTTP 200 from chat completion, got {status}"
+        assert isinstance(body, dict) and body.get("choices"), f"Chat completion returned no choices: {body}"
+        assert body["choices"][0]["message"]["content"].strip(), "vLLM returned an empty completion"
+        ids.add(body.get("id"))
+    assert len(ids) == len(payloads), "Chat completion ids should be unique per request"
+    record_latencies("chat_64_concurrent", [latency for _, _, latency in results])
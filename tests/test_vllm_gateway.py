@@ -0,0 +1,224 @@
+"""
+Tests for the least-outstanding-requests vLLM gateway (scripts/helpers/vllm_gateway.py).
+
+Every backend is an in-process mock vLLM server, so these always run.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+from tests.conftest import _load_helper_module
+
+gateway = _load_helper_module("vllm_gateway")
+mock = _load_helper_module("mock_vllm_server")
+
+
+def _servers(count, **kwargs):
+    options = {"model": "mock-tinyllama", "token_latency_ms": 2, "prefill_ms_per_token": 0}
+    options.update(kwargs)
+    return [mock.MockVLLMServer(port=0, **options).start() for _ in range(count)]
+
+
+def _completion(max_tokens=4, prompt="hello"):
+    return {"model": "mock-tinyllama", "prompt": prompt, "max_tokens": max_tokens, "ignore_eos": True}
+
+
+def _stop(servers):
+    for server in servers:
+        server.stop()
+
+
+def test_pool_spreads_by_outstanding_requests_and_tokens():
+    servers = _servers(3, token_latency_ms=10)
+
+    async def run(balance, payloads):
+        async with gateway.EndpointPool([server.base_url for server in servers], balance=balance,
+                                        health_interval_s=0) as pool:
+            first = asyncio.ensure_future(pool.request("POST", "/v1/completions", payloads[0]))
+            await asyncio.sleep(0.05)
+            rest = await asyncio.gather(*(pool.request("POST", "/v1/completions", p) for p in payloads[1:]))
+            return [await first] + rest, pool.stats()
+
+    try:
+        results, stats = asyncio.run(run("requests", [_completion(8) for _ in range(6)]))
+        assert all(status == 200 for status, _, _, _ in results)
+        assert [backend["requests"] for backend in stats["backends"]] == [2, 2, 2]
+        assert all(backend["outstanding"] == 0 for backend in stats["backends"])
+
+        # One long request: with token balancing the short ones avoid its backend.
+        long = _completion(60)
+        results, stats = asyncio.run(run("tokens", [long] + [_completion(2) for _ in range(4)]))
+        owner = results[0][3]
+        assert owner not in [backend for _, _, _, backend in results[1:]]
+        assert stats["backends"][[s.base_url for s in servers].index(owner)]["requests"] == 1
+    finally:
+        _stop(servers)
+
+
+def test_pool_hedges_slow_backend():
+    slow, fast = _servers(1, token_latency_ms=200) + _servers(1)
+
+    async def run():
+        async with gateway.EndpointPool([slow.base_url, fast.base_url], hedge_after_s=0.1,
+                                        health_interval_s=0) as pool:
+            results = []
+            for _ in range(4):
+                start = time.perf_counter()
+                status, _, body, backend = await pool.request("POST", "/v1/completions", _completion(8))
+                results.append((status, backend, time.perf_counter() - start, json.loads(body)))
+            return results, pool.stats()
+
+    try:
+        results, stats = asyncio.run(run())
+    finally:
+        _stop([slow, fast])
+
+    assert all(status == 200 and payload["choices"] for status, _, _, payload in results)
+    # Without hedging, the two requests sent to the slow backend take 1.6 s.
+    assert all(elapsed < 1.0 for _, _, elapsed, _ in results)
+    assert stats["hedged"] >= 1
+    assert {backend for _, backend, _, _ in results} == {fast.base_url}
+    assert stats["backends"][1]["hedges_won"] == stats["hedged"]
+    assert stats["backends"][0]["outstanding"] == 0
+
+
+def test_pool_ejects_and_reinstates_backends():
+    first, second = _servers(2)
+    port = first.port
+
+    async def run():
+        async with gateway.EndpointPool([first.base_url, second.base_url], health_interval_s=0,
+                                        failure_threshold=1, eject_s=0.2) as pool:
+            assert pool.stats()["usable"] == 2
+
+            # A dead backend fails over transparently and is ejected.
+            first.stop()
+            results = [await pool.request("POST", "/v1/completions", _completion()) for _ in range(3)]
+            assert all(status == 200 and backend == second.base_url for status, _, _, backend in results)
+            dead = pool.stats()["backends"][0]
+            assert dead["state"] == "ejected" and dead["failures"] >= 1
+
+            # Probes keep it out while it is down, then reinstate it.
+            await asyncio.sleep(0.25)
+            await pool.check_health()
+            assert pool.stats()["backends"][0]["state"] == "ejected"
+            restarted = mock.MockVLLMServer(port=port, model="mock-tinyllama", token_latency_ms=2,
+                                            prefill_ms_per_token=0).start()
+            try:
+                await asyncio.sleep(0.45)
+                await pool.check_health()
+                assert pool.stats()["backends"][0]["state"] == "healthy"
+
+                # A failing /health ejects a backend that still answers requests.
+                second.healthy = False
+                await pool.check_health()
+                stats = pool.stats()
+                assert [backend["state"] for backend in stats["backends"]] == ["healthy", "ejected"]
+                status, _, _, backend = await pool.request("POST", "/v1/completions", _completion())
+                assert status == 200 and backend == first.base_url
+            finally:
+                restarted.stop()
+
+            # With nothing left the pool says so instead of hanging.
+            await pool.check_health()
+            try:
+                await pool.request("GET", "/v1/models")
+            except gateway.NoBackendAvailable:
+                pass
+            else:
+                raise AssertionError("expected NoBackendAvailable")
+
+    try:
+        asyncio.run(run())
+    finally:
+        _stop([second])
+
+
+def test_gateway_proxies_openai_api(http_client):
+    servers = _servers(2)
+    server = gateway.GatewayServer([s.base_url for s in servers], port=0, health_interval_s=0).start()
+    stream_client = _load_helper_module("load_generator").AsyncHTTPClient
+    try:
+        status, _ = http_client(f"{server.base_url}/health")
+        assert status == 200
+        status, payload = http_client(f"{server.base_url}/v1/models")
+        assert status == 200 and payload["data"][0]["id"] == "mock-tinyllama"
+        for _ in range(4):
+            status, payload = http_client(f"{server.base_url}/v1/completions", "POST", _completion(), 30.0)
+            assert status == 200 and payload["usage"]["completion_tokens"] == 4
+
+        lines = []
+
+        async def stream():
+            client = stream_client()
+            try:
+                return await client.request(
+                    "POST", f"{server.base_url}/v1/chat/completions",
+                    payload={"model": "mock-tinyllama", "messages": [{"role": "user", "content": "hi"}],
+                             "max_tokens": 5, "ignore_eos": True, "stream": True},
+                    on_line=lines.append,
+                )
+            finally:
+                client.close()
+
+        status, headers, _ = asyncio.run(stream())
+        assert status == 200 and headers["content-type"].startswith("text/event-stream")
+        events = [line[len(b"data: "):] for line in lines if line.startswith(b"data: ")]
+        assert events[-1] == b"[DONE]"
+        content = "".join(
+            json.loads(event)["choices"][0]["delta"].get("content", "") for event in events[:-1]
+        )
+        assert len(content.split()) == 5
+
+        status, payload = http_client(f"{server.base_url}/gateway/backends")
+        assert status == 200 and payload["usable"] == 2
+        # /v1/models, four completions and the stream, alternating between the two.
+        assert [backend["requests"] for backend in payload["backends"]] == [3, 3]
+    finally:
+        server.stop()
+        _stop(servers)
+
+
+def test_gateway_does_not_end_a_stream_the_backend_cut_off():
+    async def dying_backend(reader, writer):
+        # Answers probes, then cuts every stream off after its first event.
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                           if line.lower().startswith(b"content-length:")), 0)
+            await reader.readexactly(length)
+            if head.startswith(b"GET"):
+                body = json.dumps({"data": [{"id": "mock-tinyllama"}]}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+                continue
+            event = b'data: {"choices": [{"text": "partial"}]}\n\n'
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Transfer-Encoding: chunked\r\n\r\n%x\r\n%s\r\n" % (len(event), event))
+            await writer.drain()
+            writer.close()
+            return
+
+    async def run():
+        backend = await asyncio.start_server(dying_backend, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{backend.sockets[0].getsockname()[1]}"
+        # The gateway runs its own loop; start it off this one, which serves the backend.
+        server = await asyncio.to_thread(gateway.GatewayServer([url], port=0, health_interval_s=0).start)
+        client = _load_helper_module("load_generator").AsyncHTTPClient()
+        lines = []
+        try:
+            await client.request("POST", f"{server.base_url}/v1/completions",
+                                 payload=dict(_completion(), stream=True), on_line=lines.append)
+        except asyncio.IncompleteReadError:
+            return lines
+        finally:
+            client.close()
+            await asyncio.to_thread(server.stop)
+            backend.close()
+        raise AssertionError("the truncated stream ended cleanly")
+
+    lines = asyncio.run(run())
+    assert lines[0].startswith(b"data: ") and b"[DONE]" not in b"".join(lines)